@@ -6,10 +6,32 @@ from kivy.uix.textinput import TextInput
 from kivy.clock import Clock
 from kivy.uix.progressbar import ProgressBar
 from kivy.uix.popup import Popup
+from kivy.uix.scrollview import ScrollView
 import threading
 import re
 from jnius import autoclass, PythonJavaClass, java_method
 
+# Встроенный spoof копируется в android/ при сборке (см. build_android.py)
+try:
+    from webm_spoof import spoof_duration, WebmSpoofError
+except ImportError:
+    spoof_duration = None  # type: ignore
+
+try:
+    from encoder_tuning import auto_settings
+except ImportError:
+    auto_settings = None  # type: ignore
+
+try:
+    from job_log import ThrottledLog
+except ImportError:
+    ThrottledLog = None  # type: ignore
+
+# Сколько последних строк держит LogView: текстура Label ограничена по высоте
+LOG_VIEW_LINES = 200
+# Не чаще одной перерисовки журнала за этот интервал, с
+LOG_VIEW_INTERVAL_S = 0.2
+
 
 # ffmpeg-kit Java bindings
 FFmpegKit = autoclass('com.arthenica.ffmpegkit.FFmpegKit')
@@ -71,14 +93,29 @@ class LogView(ScrollView):
         self.label = Label(text='', size_hint_y=None, halign='left', valign='top')
         self.label.bind(texture_size=self._update_height)
         self.add_widget(self.label)
+        if ThrottledLog is not None:
+            # Последние строки в кольцевом буфере, перерисовка пачкой по таймеру
+            self._log = ThrottledLog(self._render, Clock.schedule_once, LOG_VIEW_LINES, LOG_VIEW_INTERVAL_S)
+        else:
+            self._log = None
+            self._tail = []
 
     def _update_height(self, *_):
         self.label.height = self.label.texture_size[1]
         self.label.text_size = (self.width - 20, None)
 
+    def _render(self, text: str):
+        self.label.text = text
+
     def append(self, text: str):
+        if self._log is not None:
+            self._log.write(text)
+            return
+        # Без job_log: тот же предел строк, но перерисовка на каждый вызов
         def _do(*_):
-            self.label.text += text
+            self._tail.extend(text.splitlines())
+            del self._tail[:-LOG_VIEW_LINES]
+            self.label.text = '\n'.join(self._tail)
         Clock.schedule_once(_do)
 
 
@@ -97,7 +134,7 @@ class Root(BoxLayout):
         self.btn_convert = Button(text='Convert')
         self.btn_spoof = Button(text='Spoof')
         self.btn_convert.bind(on_press=lambda *_: self.run_convert())
-        self.btn_spoof.bind(on_press=lambda *_: self._spoof_unavailable())
+        self.btn_spoof.bind(on_press=lambda *_: self.run_spoof())
         btns.add_widget(self.btn_convert)
         btns.add_widget(self.btn_spoof)
         self.add_widget(btns)
@@ -122,7 +159,9 @@ class Root(BoxLayout):
 
         # Базовая команда для видеостикеров Telegram: VP9, 512x512, yuv420p, ~30fps
         vf = "scale=512:-2:force_original_aspect_ratio=decrease,pad=512:512:(ow-iw)/2:(oh-ih)/2:color=black"
-        base = f"-y -i '{i}' -vf {vf} -r 30 -an -c:v libvpx-vp9 -b:v 0 -crf 32 -pix_fmt yuv420p -deadline good -speed 4 '{o}'"
+        # Потоки, row-mt, тайлы и скорость по числу ядер устройства (одна задача за раз)
+        tuning = ' '.join(auto_settings().output_args()) if auto_settings else '-speed 4'
+        base = f"-y -i '{i}' -vf {vf} -r 30 -an -c:v libvpx-vp9 -b:v 0 -crf 32 -pix_fmt yuv420p -deadline good {tuning} '{o}'"
         if extra:
             # Примитивно добавим в конец (пользовательская ответственность)
             base = base[:-len("'"+o+"'")] + f" {extra} '{o}'"
@@ -151,6 +190,32 @@ class Root(BoxLayout):
 
         FFmpegKit.executeAsync(base, _ExecCb(on_complete), _LogCb(on_log), _StatsCb(on_stats))
 
+    def run_spoof(self):
+        if spoof_duration is None:
+            self._spoof_unavailable()
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        i = self.input_path.text.strip()
+        o = self.output_path.text.strip() or None
+        self.status.text = 'Spoof...'
+        self.pbar.value = 0
+
+        def _work():
+            try:
+                spoof_duration(i, o)
+                ok, msg = True, 'Готово'
+            except (OSError, WebmSpoofError) as e:
+                ok, msg = False, f'Ошибка: {e}'
+
+            def _done(*_):
+                self.pbar.value = 100 if ok else 0
+                self.status.text = msg
+            Clock.schedule_once(_done)
+
+        self._thread = threading.Thread(target=_work, daemon=True)
+        self._thread.start()
+
     def _spoof_unavailable(self):
         Popup(title='Недоступно', content=Label(text='Spoof недоступен на Android в этой версии'), size_hint=(0.8, 0.3)).open()
 
@@ -0,0 +1,326 @@
+"""Shared asyncio event loop of the job engine.
+
+Every external process started by :mod:`tgradish_jobs` (encodes, remuxes,
+the sample and segment encodes of task jobs) runs on one event loop in a
+background thread instead of a thread per process: :func:`run_process`
+reads output in non-blocking chunks, enforces timeouts and stops the process
+(SIGTERM, then SIGKILL after a grace period) when it is cancelled, even if
+the process prints nothing. Blocking work (probing, hashing, job completion
+callbacks, Python task jobs) goes to the loop's bounded thread pool.
+
+:class:`UiBridge` carries callbacks the other way, from engine threads to a
+UI thread that polls it (the Tk ``after`` tick). The GUI and the headless
+CLI share the same loop through :func:`engine_loop`.
+
+The module only uses the standard library. asyncio itself is imported on
+first use, so it does not slow down the start of the window.
+"""
+
+import codecs
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from job_log import LineAssembler
+
+# Сколько ждать выхода процесса после SIGTERM, прежде чем убить его
+TERMINATE_GRACE_S = 5.0
+# Код выхода задачи, остановленной по таймауту (как у coreutils timeout)
+TIMEOUT_EXIT_CODE = 124
+READ_CHUNK_BYTES = 64 * 1024
+# Период опроса /proc для учёта процессорного времени и пиковой памяти процессов задачи;
+# первый замер почти сразу, затем интервал удваивается до USAGE_SAMPLE_S
+USAGE_SAMPLE_FIRST_S = 0.02
+USAGE_SAMPLE_S = 0.5
+# Сколько переиспользуется общий обход /proc, если ядро не даёт файлов children
+PROC_SCAN_TTL_S = 0.2
+# Пул держит и долгие задачи на Python, и короткую подготовку задач; потоки создаются по мере надобности,
+# поэтому запас над числом исполнителей очереди ничего не стоит
+EXECUTOR_MAX_WORKERS = max(64, 2 * (os.cpu_count() or 1) + 8)
+
+
+class EngineLoop:
+    """An asyncio loop running forever in a daemon thread, started on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self.executor = ThreadPoolExecutor(max_workers=EXECUTOR_MAX_WORKERS, thread_name_prefix="engine")
+
+    @property
+    def loop(self):
+        """The running ``asyncio`` loop."""
+        with self._lock:
+            if self._loop is None:
+                import asyncio
+
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(self.executor)
+                threading.Thread(target=loop.run_forever, name="engine-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro) -> Future:
+        """Schedule ``coro`` on the loop from any thread."""
+        import asyncio
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        """Call ``callback(*args)`` on the loop thread."""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def call_later(self, delay_s: float, callback, *args):
+        """Call ``callback(*args)`` on the loop thread after ``delay_s`` seconds."""
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay_s, callback, *args)
+
+    def run_blocking(self, fn, *args) -> Future:
+        """Run a blocking ``fn(*args)`` in the engine thread pool."""
+        return self.executor.submit(fn, *args)
+
+
+_engine: EngineLoop | None = None
+_engine_lock = threading.Lock()
+
+
+def engine_loop() -> EngineLoop:
+    """Process-wide :class:`EngineLoop`."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = EngineLoop()
+        return _engine
+
+
+def _proc_stat(pid: int) -> list[bytes] | None:
+    """Fields of ``/proc/<pid>/stat`` after the command name, or None if the process is gone."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            return f.read().rsplit(b")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+
+
+_has_children_files: bool | None = None
+_process_table: tuple[float, dict[int, list[int]]] | None = None
+
+
+def _children(pid: int) -> list[int]:
+    """Direct children of ``pid``.
+
+    Uses ``/proc/<pid>/task/*/children`` where the kernel provides it;
+    otherwise a scan of ``/proc`` shared by all samplers for
+    :data:`PROC_SCAN_TTL_S` (called on the loop thread only).
+    """
+    global _has_children_files, _process_table
+    if _has_children_files is None:
+        _has_children_files = os.path.exists(f"/proc/self/task/{os.getpid()}/children")
+    if _has_children_files:
+        result = []
+        try:
+            for tid in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{tid}/children", "rb") as f:
+                    result += [int(c) for c in f.read().split()]
+        except (OSError, ValueError):
+            pass
+        return result
+    now = time.monotonic()
+    if _process_table is None or now - _process_table[0] > PROC_SCAN_TTL_S:
+        table: dict[int, list[int]] = {}
+        for name in os.listdir("/proc"):
+            if name.isdigit():
+                fields = _proc_stat(int(name))
+                if fields is not None and len(fields) > 1:
+                    table.setdefault(int(fields[1]), []).append(int(name))
+        _process_table = (now, table)
+    return _process_table[1].get(pid, [])
+
+
+class _UsageSampler:
+    """CPU time and peak RSS of a child process and its descendants, read from ``/proc``.
+
+    asyncio reaps its children itself, so ``wait4`` cannot be used. Each
+    sample walks the process tree (e.g. tgradish and the ffmpeg it started):
+    CPU time is the sum over live processes of their own time and that of
+    the children they already waited for, peak RSS the largest ``VmHWM`` of
+    any process in the tree, as ``wait4`` reports it. Samples are frequent
+    at first, so short jobs are measured too; a descendant that starts and
+    exits between two samples only shows up in the CPU time. Linux only,
+    None elsewhere.
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.usage: tuple[float, float, int | None] | None = None
+        self._enabled = sys.platform.startswith("linux")
+        self._tick = os.sysconf("SC_CLK_TCK") if self._enabled else 100
+
+    def sample(self):
+        if not self._enabled:
+            return
+        user = system = 0
+        peak = None
+        seen = False
+        pids = [self.pid]
+        while pids:
+            pid = pids.pop()
+            fields = _proc_stat(pid)
+            if fields is None or len(fields) < 15:
+                continue
+            seen = True
+            # utime, stime и время уже собранных потомков (ffmpeg, завершившийся внутри tgradish)
+            user += int(fields[11]) + int(fields[13])
+            system += int(fields[12]) + int(fields[14])
+            try:
+                with open(f"/proc/{pid}/status", "rb") as f:
+                    for line in f:
+                        if line.startswith(b"VmHWM:"):
+                            peak = max(peak or 0, int(line.split()[1]))
+                            break
+            except (OSError, ValueError, IndexError):
+                pass
+            pids += _children(pid)
+        if not seen:
+            return
+        previous = self.usage or (0.0, 0.0, None)
+        # Процессы дерева завершаются между замерами, поэтому суммы берутся не меньше прежних
+        self.usage = (
+            max(previous[0], user / self._tick),
+            max(previous[1], system / self._tick),
+            max(p for p in (peak, previous[2], 0) if p is not None) or None,
+        )
+
+    async def run(self):
+        import asyncio
+
+        delay = USAGE_SAMPLE_FIRST_S
+        while True:
+            self.sample()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, USAGE_SAMPLE_S)
+
+
+async def _read_lines(stream, on_output):
+    """Forward ``stream`` to ``on_output`` line by line; ``\\r`` also ends a line (ffmpeg progress)."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    lines = LineAssembler()
+    carry_cr = False
+    while True:
+        data = await stream.read(READ_CHUNK_BYTES)
+        text = decoder.decode(data, final=not data)
+        if carry_cr:
+            text = "\r" + text
+        # \r в конце куска может оказаться половиной \r\n
+        carry_cr = bool(data) and text.endswith("\r")
+        if carry_cr:
+            text = text[:-1]
+        for line in lines.feed(text.replace("\r\n", "\n").replace("\r", "\n")):
+            on_output(line + "\n")
+        if not data:
+            rest = lines.flush()
+            if rest:
+                on_output(rest)
+            return
+
+
+def _signal(proc, kill: bool):
+    """Send SIGTERM (or SIGKILL) to the process and, on POSIX, its whole group."""
+    try:
+        if os.name == "posix":
+            # Группа целиком: иначе ffmpeg, запущенный tgradish, держит канал вывода открытым
+            os.killpg(proc.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        elif kill:
+            proc.kill()
+        else:
+            proc.terminate()
+    except ProcessLookupError:
+        pass
+
+
+async def _stop(proc):
+    import asyncio
+
+    if proc.returncode is not None:
+        return
+    _signal(proc, kill=False)
+    try:
+        await asyncio.wait_for(proc.wait(), TERMINATE_GRACE_S)
+    except asyncio.TimeoutError:
+        _signal(proc, kill=True)
+        await proc.wait()
+
+
+async def run_process(
+    command: list[str], on_output, cwd: str | None = None, timeout_s: float | None = None
+) -> tuple[int, tuple[float, float, int | None] | None]:
+    """Run ``command`` with stdout and stderr merged into ``on_output(line)``.
+
+    Returns ``(exit_code, usage)``, where ``usage`` is ``(user_s, sys_s,
+    peak_rss_kb)`` or None. After ``timeout_s`` the process is stopped and
+    :data:`TIMEOUT_EXIT_CODE` returned. Cancelling the coroutine stops the
+    process before the cancellation propagates. Raises ``OSError`` if the
+    command cannot be started.
+    """
+    import asyncio
+
+    proc = await asyncio.create_subprocess_exec(
+        *command,
+        cwd=cwd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        # Своя группа процессов, чтобы остановка задела и дочерние процессы команды
+        start_new_session=os.name == "posix",
+    )
+    sampler = _UsageSampler(proc.pid)
+    sampling = asyncio.ensure_future(sampler.run())
+
+    async def finish() -> int:
+        await _read_lines(proc.stdout, on_output)  # type: ignore[arg-type]
+        # Поток закрыт — процесс завершается; последний замер до того, как его соберёт asyncio
+        sampler.sample()
+        return await proc.wait()
+
+    try:
+        code = await asyncio.wait_for(finish(), timeout_s)
+    except asyncio.TimeoutError:
+        on_output(f"Превышено время выполнения ({timeout_s:g} с), процесс остановлен\n")
+        await _stop(proc)
+        code = TIMEOUT_EXIT_CODE
+    except BaseException:
+        await _stop(proc)
+        raise
+    finally:
+        sampling.cancel()
+    return code, sampler.usage
+
+
+class UiBridge:
+    """Thread-safe hand-off of callbacks to a UI thread.
+
+    Engine threads call :meth:`post`; the UI thread calls :meth:`drain`
+    from its periodic tick (for Tk: ``root.after``), so callbacks run on the
+    UI thread in the order they were posted.
+    """
+
+    def __init__(self):
+        self._queue: "queue.SimpleQueue[tuple]" = queue.SimpleQueue()
+
+    def post(self, callback, *args):
+        self._queue.put((callback, args))
+
+    def drain(self, limit: int = 10000) -> int:
+        """Run up to ``limit`` pending callbacks; returns how many ran."""
+        count = 0
+        while count < limit:
+            try:
+                callback, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+            count += 1
+        return count
@@ -0,0 +1,288 @@
+"""Reproducible conversion benchmark on synthetic lavfi sources.
+
+Inputs are rendered locally with ffmpeg ``lavfi`` generators (testsrc2,
+mandelbrot, noise) at several resolutions, frame rates and durations and
+kept in the user cache dir, so every run encodes identical content. Each
+case runs in a fresh child process through :class:`tgradish_jobs.JobQueue`
+(the same runners the GUI and CLI use), which also makes the peak RSS of
+that child and its encoder processes attributable to a single case.
+
+Results (frames/s, MB/s of input, latency, peak RSS, output size) are
+written as JSON. With ``--baseline`` they are compared to a stored run and
+the script exits with code 1 if any case got slower than the threshold.
+
+Примеры:
+    python bench_convert.py --quick --update-baseline bench_baseline.json
+    python bench_convert.py --baseline bench_baseline.json --threshold 0.1 --json last.json
+    python bench_convert.py --backend tgradish --operations convert --only mandelbrot
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+
+from conversion_cache import tool_versions
+from tgradish_jobs import DependencyChecker, Job, JobQueue, build_spoof_args, plan_convert, user_cache_dir
+from webm_spoof import SpoofTask
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+SOURCES = {
+    "testsrc2": "testsrc2=size={w}x{h}:rate={fps}",
+    "mandelbrot": "mandelbrot=size={w}x{h}:rate={fps}",
+    "noise": "color=c=gray:size={w}x{h}:rate={fps},noise=alls=60:allf=t+u:all_seed=1",
+}
+# (ширина, высота, кадров/с, длительность, с)
+GRID = (
+    (640, 360, 30, 3),
+    (1280, 720, 30, 3),
+    (1920, 1080, 60, 3),
+    (1280, 720, 30, 10),
+)
+QUICK_GRID = GRID[:1]
+OPERATIONS = ("convert", "spoof")
+DEFAULT_THRESHOLD = 0.10
+
+
+class BenchCase:
+    """One synthetic input: generator, frame size, frame rate and duration."""
+
+    def __init__(self, source: str, width: int, height: int, fps: int, duration_s: float):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.duration_s = duration_s
+
+    @property
+    def name(self) -> str:
+        return f"{self.source}-{self.width}x{self.height}-{self.fps}fps-{self.duration_s:g}s"
+
+    @property
+    def frames(self) -> int:
+        return int(round(self.fps * self.duration_s))
+
+    def input_path(self) -> str:
+        return os.path.join(user_cache_dir("bench", "sources"), f"{self.name}.mkv")
+
+    def ensure_input(self) -> str:
+        """Render the source once; later runs reuse the identical file."""
+        path = self.input_path()
+        if os.path.isfile(path):
+            return path
+        expr = SOURCES[self.source].format(w=self.width, h=self.height, fps=self.fps)
+        tmp = path + ".tmp.mkv"
+        cmd = [
+            "ffmpeg", "-hide_banner", "-nostdin", "-y", "-v", "error",
+            "-f", "lavfi", "-i", expr, "-t", f"{self.duration_s:g}",
+            "-c:v", "mpeg4", "-q:v", "2", "-g", str(self.fps),
+            tmp,
+        ]
+        subprocess.run(cmd, check=True)
+        os.replace(tmp, path)
+        return path
+
+
+def build_cases(quick: bool, only: str) -> list[BenchCase]:
+    cases = [BenchCase(src, *row) for row in (QUICK_GRID if quick else GRID) for src in SOURCES]
+    return [c for c in cases if only in c.name] if only else cases
+
+
+def _peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # macOS отдаёт байты, Linux — КБ
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return round(peak * scale / (1024 * 1024), 1)
+
+
+def run_job(operation: str, args: list[str], input_path: str, output_path: str, backend: str, task=None) -> Job:
+    """Run one job through a single-slot JobQueue and wait for it."""
+    finished = threading.Event()
+    queue = JobQueue(
+        on_job_output=lambda job, line: None,
+        on_job_update=lambda job: job.is_finished and finished.set(),
+        max_workers=1,
+    )
+    job = queue.submit(operation, args, input_path=input_path, output_path=output_path, backend=backend, task=task)
+    finished.wait()
+    queue.shutdown()
+    return job
+
+
+def worker(spec: dict) -> dict:
+    """Child-process side: run one (case, operation) and measure it."""
+    out_dir = spec["out_dir"]
+    input_path = spec["input"]
+    if spec["operation"] == "convert":
+        args, target = plan_convert(input_path, out_dir, [], backend=spec["backend"])
+        job = run_job("convert", args, input_path, target, spec["backend"])
+    else:
+        target = os.path.join(out_dir, "spoofed.webm")
+        if spec["backend"] == "native":
+            task = SpoofTask(input_path, target)
+            job = run_job("spoof", task.describe(), input_path, target, "task", task)
+        else:
+            job = run_job("spoof", build_spoof_args(input_path, target), input_path, target, "tgradish")
+    output_bytes = os.path.getsize(target) if target and os.path.isfile(target) else None
+    return {
+        "status": job.status,
+        "latency_s": job.elapsed_s,
+        "peak_rss_mb": _peak_rss_mb(),
+        "output_bytes": output_bytes,
+        "output_path": target,
+    }
+
+
+def run_in_child(spec: dict) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(spec)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"Сбой замера {spec['operation']}: {result.stderr.strip()[-500:]}")
+    return json.loads(lines[-1])
+
+
+def measure(case: BenchCase, operation: str, backend: str, input_path: str, work: str, repeat: int) -> dict:
+    samples = []
+    for i in range(repeat):
+        out_dir = os.path.join(work, f"{case.name}-{operation}-{i}")
+        os.makedirs(out_dir, exist_ok=True)
+        samples.append(run_in_child({
+            "operation": operation,
+            "backend": backend,
+            "input": input_path,
+            "out_dir": out_dir,
+        }))
+    ok = [s for s in samples if s["status"] == Job.DONE and s["latency_s"]]
+    latency = statistics.median(s["latency_s"] for s in ok) if ok else None
+    input_mb = os.path.getsize(input_path) / (1024 * 1024)
+    return {
+        "case": case.name,
+        "operation": operation,
+        "backend": backend,
+        "status": Job.DONE if len(ok) == len(samples) else Job.FAILED,
+        "frames": case.frames,
+        "latency_s": round(latency, 3) if latency else None,
+        "frames_per_s": round(case.frames / latency, 2) if latency else None,
+        "mb_per_s": round(input_mb / latency, 2) if latency else None,
+        "peak_rss_mb": max((s["peak_rss_mb"] for s in ok if s["peak_rss_mb"] is not None), default=None),
+        "output_bytes": ok[-1]["output_bytes"] if ok else None,
+        "output_path": ok[-1]["output_path"] if ok else None,
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    """Return a message per case whose latency regressed beyond ``threshold``."""
+    base = {(r["case"], r["operation"], r["backend"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        ref = base.get((r["case"], r["operation"], r["backend"]))
+        if not ref or not ref.get("latency_s"):
+            continue
+        if r["latency_s"] is None:
+            regressions.append(f"{r['case']} {r['operation']}: задача не выполнена")
+            continue
+        change = r["latency_s"] / ref["latency_s"] - 1
+        r["vs_baseline"] = round(change, 3)
+        if change > threshold:
+            regressions.append(
+                f"{r['case']} {r['operation']}/{r['backend']}: {ref['latency_s']:.3f} → {r['latency_s']:.3f} с ({change:+.0%})"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк convert/spoof на синтетических исходниках lavfi")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--quick", action="store_true", help="Только малое разрешение")
+    parser.add_argument("--only", default="", help="Только случаи, в имени которых есть подстрока")
+    parser.add_argument("--operations", default=",".join(OPERATIONS), help="convert, spoof или оба через запятую")
+    parser.add_argument("--backend", choices=("ffmpeg", "tgradish"), default="ffmpeg", help="Движок convert")
+    parser.add_argument("--spoof-engine", choices=("native", "tgradish"), default="native", help="Движок spoof")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов на случай (берётся медиана)")
+    parser.add_argument("--json", default="", help="Сохранить результаты в JSON-файл")
+    parser.add_argument("--baseline", default="", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Допустимое замедление (0.1 = 10%%)")
+    parser.add_argument("--update-baseline", default="", metavar="ФАЙЛ", help="Записать результаты как новый baseline")
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(json.loads(args.worker))))
+        return 0
+
+    if not DependencyChecker.is_ffmpeg_available():
+        print("ffmpeg не найден в PATH.", file=sys.stderr)
+        return 2
+    operations = [op.strip() for op in args.operations.split(",") if op.strip() in OPERATIONS]
+    cases = build_cases(args.quick, args.only)
+    results: list[dict] = []
+    with tempfile.TemporaryDirectory(prefix="bench_convert_") as work:
+        for case in cases:
+            source = case.ensure_input()
+            converted = None
+            for operation in operations:
+                if operation == "convert":
+                    row = measure(case, "convert", args.backend, source, work, args.repeat)
+                    converted = row["output_path"]
+                else:
+                    if converted is None:
+                        # Для spoof нужен WebM — делаем его без замера
+                        converted = measure(case, "convert", "ffmpeg", source, work, 1)["output_path"]
+                    if converted is None:
+                        continue
+                    row = measure(case, "spoof", args.spoof_engine, converted, work, args.repeat)
+                row.pop("output_path", None)
+                results.append(row)
+                print(
+                    f"{row['case']:<36} {row['operation']:<8} {row['backend']:<9} "
+                    f"{row['latency_s'] or 0:>8.3f} с {row['frames_per_s'] or 0:>8.1f} к/с "
+                    f"{row['mb_per_s'] or 0:>7.2f} МБ/с {row['peak_rss_mb'] or 0:>7.1f} МБ RSS "
+                    f"{(row['output_bytes'] or 0) / 1024:>7.0f} КБ"
+                    + ("" if row["status"] == Job.DONE else "  ОШИБКА"),
+                    flush=True,
+                )
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "tools": tool_versions(),
+        },
+        "results": results,
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline.get("results", []), args.threshold)
+        report["baseline"] = {"path": args.baseline, "threshold": args.threshold, "regressions": regressions}
+        if regressions:
+            print(f"Регрессии производительности (порог {args.threshold:.0%}):", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            exit_code = 1
+    if any(r["status"] != Job.DONE for r in results):
+        exit_code = 1
+    for path in (args.json, args.update_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Benchmark: cost per log line of the bounded log buffers.
+
+Feeds synthetic ffmpeg-like output through the buffers used by the Android
+``LogView`` (:class:`job_log.ThrottledLog`) and the in-process tgradish stream
+shim (:class:`job_log.LineAssembler`), and for comparison through the old
+string accumulation (``text += chunk``, then ``split``). The time per line
+is reported for each tenth of the run: the bounded buffers stay flat, the
+old ``LogView`` grows with the amount of text already logged and the old
+stream shim with the size of a single write (the ``*_bulk`` runs).
+
+Kivy is not needed: redraws go to a stub label and a fake clock that fires
+every ``--interval-lines`` lines, as the real Clock would between frames.
+
+Примеры:
+    python bench_log_buffer.py
+    python bench_log_buffer.py --lines 1000000 --legacy-lines 20000 --json log_bench.json
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from job_log import LineAssembler, ThrottledLog
+
+BUCKETS = 10
+
+
+def make_chunks(lines: int, block_lines: int = 1):
+    """Yield output the way a pipe delivers it.
+
+    With ``block_lines == 1`` lines come one by one, every third split in two
+    writes; otherwise ``block_lines`` lines arrive in a single write, as when
+    tgradish prints a buffered report.
+    """
+    block: list[str] = []
+    for i in range(lines):
+        line = f"frame={i:7d} fps= 30 q=32.0 size={i // 4:8d}kB time=00:00:{i % 60:02d}.00 bitrate= 512.0kbits/s speed=1.0x\n"
+        if block_lines > 1:
+            block.append(line)
+            if len(block) == block_lines:
+                yield "".join(block)
+                block = []
+        elif i % 3 == 0:
+            cut = len(line) // 2
+            yield line[:cut]
+            yield line[cut:]
+        else:
+            yield line
+    if block:
+        yield "".join(block)
+
+
+class _FakeClock:
+    """Collects scheduled callbacks and runs them when the "frame" ends."""
+
+    def __init__(self):
+        self.pending = []
+
+    def schedule_once(self, callback, _delay=0):
+        self.pending.append(callback)
+
+    def tick(self):
+        pending, self.pending = self.pending, []
+        for callback in pending:
+            callback(0)
+
+
+class _Label:
+    def __init__(self):
+        self.text = ""
+
+
+def _timed_buckets(lines: int, feed, on_line_boundary=None, block_lines: int = 1) -> list[float]:
+    """Run ``feed(chunk)`` over the synthetic output; microseconds per line for each tenth."""
+    per_bucket = max(1, lines // BUCKETS)
+    timings: list[float] = []
+    done = 0
+    bucket_start = 0
+    t0 = time.perf_counter()
+    for chunk in make_chunks(lines, block_lines):
+        feed(chunk)
+        count = chunk.count("\n")
+        if not count:
+            continue
+        done += count
+        if on_line_boundary is not None:
+            on_line_boundary(done)
+        if done - bucket_start >= per_bucket:
+            t1 = time.perf_counter()
+            timings.append((t1 - t0) / (done - bucket_start) * 1e6)
+            t0, bucket_start = t1, done
+    return timings
+
+
+def bench_log_view(lines: int, max_lines: int, interval_lines: int) -> list[float]:
+    clock = _FakeClock()
+    label = _Label()
+    log = ThrottledLog(lambda text: setattr(label, "text", text), clock.schedule_once, max_lines)
+    return _timed_buckets(lines, log.write, lambda n: clock.tick() if n % interval_lines == 0 else None)
+
+
+def bench_stream(lines: int, block_lines: int = 1) -> list[float]:
+    assembler = LineAssembler()
+    sink = []
+
+    def feed(chunk: str):
+        for line in assembler.feed(chunk):
+            sink.append(line)
+            if len(sink) > 1000:
+                sink.clear()
+
+    return _timed_buckets(lines, feed, block_lines=block_lines)
+
+
+def bench_legacy_log_view(lines: int) -> list[float]:
+    label = _Label()
+
+    def feed(chunk: str):
+        label.text += chunk
+
+    return _timed_buckets(lines, feed)
+
+
+def bench_legacy_stream(lines: int, block_lines: int = 1) -> list[float]:
+    state = {"buf": ""}
+    sink = []
+
+    def feed(chunk: str):
+        state["buf"] += chunk
+        while "\n" in state["buf"]:
+            line, state["buf"] = state["buf"].split("\n", 1)
+            sink.append(line)
+            if len(sink) > 1000:
+                sink.clear()
+
+    return _timed_buckets(lines, feed, block_lines=block_lines)
+
+
+def _summary(name: str, lines: int, timings: list[float]) -> dict:
+    first, last = timings[0], timings[-1]
+    return {
+        "name": name,
+        "lines": lines,
+        "us_per_line": [round(t, 3) for t in timings],
+        "growth": round(last / first, 2) if first else None,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Стоимость строки журнала в ограниченных буферах")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="Строк для ограниченных буферов")
+    parser.add_argument(
+        "--legacy-lines", type=int, default=20_000, help="Строк для старого накопления строки (0 — не запускать)"
+    )
+    parser.add_argument("--max-lines", type=int, default=200, help="Размер кольцевого буфера LogView")
+    parser.add_argument("--interval-lines", type=int, default=500, help="Строк между тиками фальшивых часов Kivy")
+    parser.add_argument("--block-lines", type=int, default=2000, help="Строк в одной записи для сценария *_bulk")
+    parser.add_argument("--json", default="", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args(argv)
+
+    results = [
+        _summary("log_view", args.lines, bench_log_view(args.lines, args.max_lines, args.interval_lines)),
+        _summary("stream", args.lines, bench_stream(args.lines)),
+        _summary("stream_bulk", args.lines, bench_stream(args.lines, args.block_lines)),
+    ]
+    if args.legacy_lines:
+        results += [
+            _summary("legacy_log_view", args.legacy_lines, bench_legacy_log_view(args.legacy_lines)),
+            _summary("legacy_stream", args.legacy_lines, bench_legacy_stream(args.legacy_lines)),
+            _summary(
+                "legacy_stream_bulk", args.legacy_lines, bench_legacy_stream(args.legacy_lines, args.block_lines)
+            ),
+        ]
+
+    print(f"{'буфер':<20} {'строк':>9} {'мкс/строка: первая → последняя десятая':>40} {'рост':>6}")
+    for r in results:
+        us = r["us_per_line"]
+        print(f"{r['name']:<20} {r['lines']:>9} {us[0]:>19.2f} → {us[-1]:<18.2f} {r['growth']:>6}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Benchmark: single-process vs segment-parallel sticker encoding.
+
+For every requested core count the process (and so every ffmpeg child) is
+pinned to that many CPUs, then the same source is encoded by
+:class:`segment_encode.SegmentEncodeTask` once as a single segment (one
+ffmpeg process) and once with one segment per core. Both runs build their
+commands the same way and use the same ``-speed``, so only the split differs. Results are printed as a table and, with ``--json``,
+written as a JSON file.
+
+Без ``--input`` создаётся синтетический исходник через lavfi (testsrc2).
+
+Примеры:
+    python bench_segments.py
+    python bench_segments.py --input clip.mp4 --cores 4,8,16 --json bench.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from encoder_tuning import DEFAULT_SPEED
+from segment_encode import SegmentEncodeTask
+from tgradish_jobs import TaskContext
+
+
+def make_source(path: str, duration_s: float, size: str, gop: int) -> None:
+    """Render a synthetic source with a keyframe every ``gop`` frames."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostdin", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={duration_s}",
+        "-c:v", "mpeg4", "-q:v", "3", "-g", str(gop),
+        path,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def _pin(cores: int) -> bool:
+    setter = getattr(os, "sched_setaffinity", None)
+    if setter is None:
+        return False
+    available = sorted(os.sched_getaffinity(0))
+    setter(0, set(available[:cores]))
+    return True
+
+
+def _quiet(_line: str):
+    pass
+
+
+def run_encode(source: str, output: str, segments: int, speed: int = DEFAULT_SPEED) -> float:
+    """Wall time of :class:`SegmentEncodeTask`; ``segments=1`` is the single-process baseline."""
+    ctx = TaskContext(None, _quiet)
+    t0 = time.monotonic()
+    code = SegmentEncodeTask(source, output, segments=segments, speed=speed)(ctx)
+    if code != 0:
+        raise RuntimeError(f"кодирование ({segments} сегм.) завершилось с кодом {code}")
+    return time.monotonic() - t0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Сравнение обычного и сегментного кодирования")
+    parser.add_argument("--input", default="", help="Исходное видео (по умолчанию синтетическое)")
+    parser.add_argument("--cores", default="4,8,16", help="Список числа ядер через запятую")
+    parser.add_argument("--duration", type=float, default=3.0, help="Длительность синтетического исходника, с (кодируется не больше 3 с)")
+    parser.add_argument("--size", default="1920x1080", help="Размер кадра синтетического исходника")
+    parser.add_argument("--json", default="", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args(argv)
+
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        print("Нужны ffmpeg и ffprobe в PATH.", file=sys.stderr)
+        return 2
+    cores = [int(c) for c in args.cores.split(",") if c.strip()]
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+    work = tempfile.mkdtemp(prefix="bench_segments_")
+    try:
+        source = args.input
+        if not source:
+            source = os.path.join(work, "source.mkv")
+            print(f"Генерация исходника {args.size}, {args.duration:g} с…", file=sys.stderr)
+            # Ключевой кадр каждые полсекунды, чтобы трёхсекундный стикер было где разрезать
+            make_source(source, args.duration, args.size, gop=15)
+        results = []
+        for n in cores:
+            if n > available:
+                print(f"Пропуск {n} ядер: доступно {available}", file=sys.stderr)
+                continue
+            pinned = _pin(n)
+            single = run_encode(source, os.path.join(work, f"single_{n}.webm"), 1)
+            segmented = run_encode(source, os.path.join(work, f"segmented_{n}.webm"), n)
+            results.append({
+                "cores": n,
+                "pinned": pinned,
+                "single_s": round(single, 3),
+                "segmented_s": round(segmented, 3),
+                "speedup": round(single / segmented, 2) if segmented else None,
+                "single_bytes": os.path.getsize(os.path.join(work, f"single_{n}.webm")),
+                "segmented_bytes": os.path.getsize(os.path.join(work, f"segmented_{n}.webm")),
+            })
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"{'ядер':>5} {'один процесс, с':>16} {'сегменты, с':>12} {'ускорение':>10}")
+    for r in results:
+        print(f"{r['cores']:>5} {r['single_s']:>16.2f} {r['segmented_s']:>12.2f} {r['speedup']:>9.2f}x")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
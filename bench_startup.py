@@ -0,0 +1,146 @@
+"""Cold-start benchmark for the desktop app.
+
+Each build variant is launched several times with the startup probe
+enabled (see ``STARTUP_REPORT_ENV`` in ``gui_tgradish.py``): the app writes
+a timestamp when its window is first idle and when the first job reports
+progress, then closes itself. Reported are time-to-first-window and
+time-to-first-job, measured from process launch.
+
+Примеры:
+    python bench_startup.py
+    python bench_startup.py --variant onefile=dist/Sticker.exe --variant onedir=dist/Sticker/Sticker.exe
+    python bench_startup.py --input clip.mp4 --backend ffmpeg --runs 10 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from gui_tgradish import STARTUP_BACKEND_ENV, STARTUP_JOB_ENV, STARTUP_REPORT_ENV
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_clip(path: str) -> bool:
+    """Render a short synthetic clip for the first job; False if ffmpeg is missing."""
+    if not shutil.which("ffmpeg"):
+        return False
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostdin", "-y", "-v", "error",
+        "-f", "lavfi", "-i", "testsrc2=size=640x360:rate=30:duration=2",
+        "-c:v", "mpeg4", "-q:v", "3", path,
+    ]
+    return subprocess.run(cmd).returncode == 0
+
+
+def launch_once(command: list[str], work: str, job_input: str, backend: str, timeout: float) -> dict:
+    report = os.path.join(work, "startup.jsonl")
+    if os.path.exists(report):
+        os.remove(report)
+    env = dict(os.environ)
+    env[STARTUP_REPORT_ENV] = report
+    if job_input:
+        # Копия входа на каждый запуск, чтобы результат не брался из кэша конвертаций
+        clip = os.path.join(work, f"clip_{time.monotonic_ns()}{os.path.splitext(job_input)[1]}")
+        shutil.copyfile(job_input, clip)
+        env[STARTUP_JOB_ENV] = clip
+        env[STARTUP_BACKEND_ENV] = backend
+    t0 = time.time()
+    proc = subprocess.Popen(command, env=env, cwd=work)
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+    events: dict[str, float] = {}
+    try:
+        with open(report, "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                events.setdefault(item["event"], item["t"])
+    except (OSError, ValueError):
+        pass
+    return {
+        "window_s": events["window"] - t0 if "window" in events else None,
+        "job_s": events["job"] - t0 if "job" in events else None,
+    }
+
+
+def _summary(values: list[float | None]) -> dict:
+    present = [v for v in values if v is not None]
+    if not present:
+        return {"median_s": None, "min_s": None, "runs": 0}
+    return {"median_s": round(statistics.median(present), 3), "min_s": round(min(present), 3), "runs": len(present)}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Замер холодного старта GUI по вариантам сборки")
+    parser.add_argument(
+        "--variant",
+        action="append",
+        default=[],
+        metavar="ИМЯ=КОМАНДА",
+        help="Вариант сборки и команда запуска (по умолчанию — исходники через текущий Python)",
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Число запусков на вариант")
+    parser.add_argument("--input", default="", help="Видео для первой задачи (по умолчанию синтетическое)")
+    parser.add_argument("--backend", choices=("tgradish", "ffmpeg"), default="tgradish", help="Движок первой задачи")
+    parser.add_argument("--no-job", action="store_true", help="Мерить только появление окна")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Предел ожидания одного запуска, с")
+    parser.add_argument("--json", default="", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args(argv)
+
+    variants: list[tuple[str, list[str]]] = []
+    for spec in args.variant:
+        name, sep, command = spec.partition("=")
+        if not sep or not command:
+            print(f"Некорректный вариант: {spec}", file=sys.stderr)
+            return 2
+        variants.append((name, [os.path.abspath(command)] if os.path.isfile(command) else shlex.split(command)))
+    if not variants:
+        variants.append(("source", [sys.executable, os.path.join(HERE, "gui_tgradish.py")]))
+
+    work = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        job_input = ""
+        if not args.no_job:
+            job_input = os.path.abspath(args.input) if args.input else os.path.join(work, "clip.mp4")
+            if not args.input and not make_clip(job_input):
+                print("ffmpeg не найден — замеряется только появление окна.", file=sys.stderr)
+                job_input = ""
+        results = []
+        for name, command in variants:
+            runs = [launch_once(command, work, job_input, args.backend, args.timeout) for _ in range(args.runs)]
+            results.append({
+                "variant": name,
+                "first_window": _summary([r["window_s"] for r in runs]),
+                "first_job": _summary([r["job_s"] for r in runs]),
+            })
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    def fmt(value):
+        return f"{value:.3f}" if value is not None else "—"
+
+    print(f"{'вариант':<12} {'окно, с (медиана/мин)':>24} {'первая задача, с (медиана/мин)':>32}")
+    for r in results:
+        w, j = r["first_window"], r["first_job"]
+        print(
+            f"{r['variant']:<12} {fmt(w['median_s']) + ' / ' + fmt(w['min_s']):>24} "
+            f"{fmt(j['median_s']) + ' / ' + fmt(j['min_s']):>32}"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,12 +30,26 @@ def copy_ffmpeg_assets(source_dir: str, target_dir: str):
                 shutil.copy2(sp, dp)
 
 
+# Общие с десктопом модули без внешних зависимостей, которые нужны APK
+SHARED_MODULES = ("webm_spoof.py", "encoder_tuning.py", "job_log.py")
+
+
+def copy_shared_modules(target_dir: str):
+    for name in SHARED_MODULES:
+        if os.path.isfile(name):
+            shutil.copy2(name, os.path.join(target_dir, name))
+        else:
+            print(f"Предупреждение: не найден модуль {name}")
+
+
 def build_apk(app_name: str | None = None, icon_png: str | None = None, ffmpeg_src: str | None = None):
     ensure_buildozer()
     spec_path = os.path.join("android", "buildozer.spec")
     if not os.path.isfile(spec_path):
         raise FileNotFoundError("Не найден android/buildozer.spec")
 
+    copy_shared_modules("android")
+
     # Copy ffmpeg assets if provided
     if ffmpeg_src:
         copy_ffmpeg_assets(ffmpeg_src, os.path.join("android", "ffmpeg"))
@@ -77,6 +77,11 @@ def build_apk():
         print("❌ Папка android не найдена")
         return False
     
+    # Встроенный spoof и подбор настроек кодировщика используются и в APK
+    for name in ('webm_spoof.py', 'encoder_tuning.py', 'job_log.py'):
+        if Path(name).exists():
+            shutil.copy2(name, android_dir / name)
+
     try:
         # Переходим в папку android
         os.chdir(android_dir)
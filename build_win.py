@@ -25,7 +25,20 @@ def _find_ffmpeg_exe(ffmpeg_dir: str) -> str:
     raise FileNotFoundError("В указанной папке не найден ffmpeg.exe")
 
 
-def build_exe(app_name: str, icon_path: str | None, script_path: str, ffmpeg_dir: str | None, onefile: bool = True, windowed: bool = True):
+# Варианты сборки: onefile распаковывает весь архив (вместе с ffmpeg) во временную папку
+# при каждом запуске; onedir запускается сразу из папки; optimized — onedir без UPX и с -O
+BUILD_MODES = ("onefile", "onedir", "optimized")
+
+
+def build_exe(
+    app_name: str,
+    icon_path: str | None,
+    script_path: str,
+    ffmpeg_dir: str | None,
+    onefile: bool = True,
+    windowed: bool = True,
+    optimized: bool = False,
+):
     if not os.path.isfile(script_path):
         raise FileNotFoundError(f"Не найден скрипт: {script_path}")
     _ensure_pyinstaller_installed()
@@ -34,6 +47,11 @@ def build_exe(app_name: str, icon_path: str | None, script_path: str, ffmpeg_dir
     cmd = [sys.executable, "-m", "PyInstaller"]
     if onefile:
         cmd.append("--onefile")
+    else:
+        cmd.append("--onedir")
+    if optimized:
+        # Сжатые UPX библиотеки распаковываются при каждой загрузке; байткод собирается с -O
+        cmd += ["--noupx", "--optimize", "1"]
     if windowed:
         cmd.append("--windowed")
     cmd += ["--name", app_name]
@@ -49,14 +67,14 @@ def build_exe(app_name: str, icon_path: str | None, script_path: str, ffmpeg_dir
         sep = ";" if os.name == "nt" else ":"
         cmd += ["--add-binary", f"{ffmpeg_exe}{sep}ffmpeg"]
 
-    # Ensure we include tgradish CLI if needed (generally not required)
-    # PyInstaller will follow runtime imports; CLI is called as external process
+    # tgradish импортируется лениво (в процессах пула), поэтому указываем его явно
+    cmd += ["--hidden-import", "tgradish", "--collect-submodules", "tgradish"]
 
     cmd.append(script_path)
 
     print("Запуск PyInstaller:\n", " ".join(cmd))
     subprocess.check_call(cmd)
-    print("Готово. EXE в папке dist/.")
+    print(f"Готово. EXE в папке dist/{'' if onefile else app_name + '/'}.")
 
 
 def main():
@@ -65,17 +83,25 @@ def main():
     parser.add_argument("--icon", help="Путь к .ico иконке")
     parser.add_argument("--script", default="gui_tgradish.py", help="Главный скрипт Python")
     parser.add_argument("--ffmpeg-dir", help="Папка с ffmpeg.exe (будет упакована)")
-    parser.add_argument("--no-onefile", action="store_true", help="Не собирать в один файл")
+    parser.add_argument(
+        "--mode",
+        choices=BUILD_MODES,
+        default="onefile",
+        help="onefile — один exe; onedir — папка (быстрый запуск); optimized — onedir без UPX и с -O",
+    )
+    parser.add_argument("--no-onefile", action="store_true", help="Не собирать в один файл (то же, что --mode onedir)")
     parser.add_argument("--console", action="store_true", help="Оставить консольное окно")
 
     args = parser.parse_args()
+    mode = "onedir" if args.no_onefile and args.mode == "onefile" else args.mode
     build_exe(
         app_name=args.name,
         icon_path=args.icon,
         script_path=args.script,
         ffmpeg_dir=args.ffmpeg_dir,
-        onefile=not args.no_onefile,
+        onefile=mode == "onefile",
         windowed=not args.console,
+        optimized=mode == "optimized",
     )
 
 
@@ -0,0 +1,72 @@
+"""Pre-check of convert inputs against Telegram video sticker constraints.
+
+Many inputs are already finished stickers (512 px VP9 WebM without audio),
+and re-encoding them only costs time and quality. :func:`classify` sorts a
+probed input into one of three classes:
+
+* ``copy`` — the file already meets every constraint and is copied as is;
+* ``remux`` — the VP9 stream fits, but the file has audio or another
+  container; the video stream is copied into a new WebM;
+* ``encode`` — anything else goes to libvpx as usual.
+"""
+
+import os
+
+from ffmpeg_backend import STICKER_FPS, STICKER_MAX_BYTES, STICKER_MAX_DURATION_S, STICKER_SIZE
+
+COPY = "copy"
+REMUX = "remux"
+ENCODE = "encode"
+
+STICKER_CODECS = ("vp9",)
+STICKER_PIX_FMTS = ("yuv420p", "yuva420p")
+# Погрешность длительности и частоты кадров из метаданных контейнера
+DURATION_TOLERANCE_S = 0.05
+FPS_TOLERANCE = 0.5
+
+
+def stream_problems(media) -> list[str]:
+    """Reasons why the video stream itself must be re-encoded (empty if it fits)."""
+    problems = []
+    if media.video_codec not in STICKER_CODECS:
+        problems.append(f"кодек {media.video_codec or '?'}")
+    if not media.width or not media.height:
+        problems.append("размер кадра неизвестен")
+    elif max(media.width, media.height) != STICKER_SIZE or min(media.width, media.height) > STICKER_SIZE:
+        problems.append(f"размер {media.width}x{media.height}")
+    if media.pix_fmt not in STICKER_PIX_FMTS:
+        problems.append(f"формат пикселей {media.pix_fmt or '?'}")
+    if media.fps is None or media.fps > STICKER_FPS + FPS_TOLERANCE:
+        problems.append(f"{media.fps or '?'} кадр/с")
+    if media.duration_s is None or media.duration_s > STICKER_MAX_DURATION_S + DURATION_TOLERANCE_S:
+        problems.append(f"длительность {media.duration_s or '?'} с")
+    if media.size_bytes is None or media.size_bytes > STICKER_MAX_BYTES:
+        # Перепаковка размер почти не меняет, поэтому без запаса проверяем размер всего файла
+        problems.append(f"{(media.size_bytes or 0) // 1024} КБ")
+    return problems
+
+
+def container_problems(media, path: str) -> list[str]:
+    """What a stream copy has to fix: audio and a non-WebM container."""
+    problems = []
+    if media.has_audio:
+        problems.append("есть звук")
+    if os.path.splitext(path)[1].lower() != ".webm" or "webm" not in (media.format_name or ""):
+        problems.append(f"контейнер {media.format_name or '?'}")
+    return problems
+
+
+def classify(media, path: str) -> tuple[str, list[str]]:
+    """Return ``(COPY | REMUX | ENCODE, reasons)`` for a probed input.
+
+    ``reasons`` lists what prevents the cheaper class (empty for COPY).
+    """
+    if media is None:
+        return ENCODE, ["нет метаданных"]
+    problems = stream_problems(media)
+    if problems:
+        return ENCODE, problems
+    problems = container_problems(media, path)
+    if problems:
+        return REMUX, problems
+    return COPY, []
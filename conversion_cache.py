@@ -0,0 +1,181 @@
+"""Content-addressed on-disk cache for `tgradish convert` results.
+
+A cache key is a SHA-256 over the input file bytes, the tgradish argument
+vector (with the input/output paths replaced by placeholders) and the
+tgradish/ffmpeg versions. Entries are plain ``.webm`` files; a hit copies
+(or hardlinks) the stored file to the requested output instead of
+re-encoding. The cache size is capped, least recently used entries are
+evicted first.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from tgradish_jobs import tool_registry, user_cache_dir
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def _ffmpeg_version() -> str:
+    info = tool_registry().ffmpeg()
+    if info is None:
+        return ""
+    return info.version or info.path
+
+
+@functools.lru_cache(maxsize=None)
+def _tgradish_version() -> str:
+    version = tool_registry().module_version("tgradish")
+    if version:
+        return version
+    exe = tool_registry().which("tgradish")
+    if not exe:
+        return ""
+    try:
+        st = os.stat(exe)
+        return f"{exe}:{st.st_size}:{int(st.st_mtime)}"
+    except OSError:
+        return exe
+
+
+def tool_versions() -> dict:
+    return {"tgradish": _tgradish_version(), "ffmpeg": _ffmpeg_version()}
+
+
+class ConversionCache:
+    """LRU-bounded store of converted stickers keyed by content hash."""
+
+    DEFAULT_MAX_MB = 2048
+
+    def __init__(self, root: str | None = None, max_mb: int = DEFAULT_MAX_MB, hardlink: bool = False):
+        self.root = root or user_cache_dir("conversions")
+        self.max_bytes = int(max_mb) * 1024 * 1024
+        # Hardlinks save space, but the output then shares an inode with the cache entry:
+        # in-place edits of the output would corrupt the cache, so copying is the default.
+        self.hardlink = hardlink
+        self._lock = threading.Lock()
+        self._digests: dict[tuple, str] = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    # ------------------------------ Keys ----------------------------------- #
+    def file_digest(self, path: str) -> str:
+        st = os.stat(path)
+        memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(memo_key)
+        if digest:
+            return digest
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[memo_key] = digest
+        return digest
+
+    def key_for(self, input_path: str, args: list[str], output_path: str = "") -> str:
+        normalized = []
+        for a in args:
+            if a == input_path:
+                normalized.append("{input}")
+            elif output_path and a == output_path:
+                normalized.append("{output}")
+            else:
+                normalized.append(a)
+        payload = json.dumps(
+            {"input": self.file_digest(input_path), "args": normalized, "tools": tool_versions()},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".webm")
+
+    # ----------------------------- Lookup ---------------------------------- #
+    def fetch(self, key: str, output_path: str) -> bool:
+        """Materialise a cached entry at ``output_path``. Returns False on miss."""
+        entry = self._entry_path(key)
+        if not os.path.isfile(entry):
+            return False
+        out_dir = os.path.dirname(os.path.abspath(output_path))
+        os.makedirs(out_dir, exist_ok=True)
+        tmp = os.path.join(out_dir, f".{os.path.basename(output_path)}.{os.getpid()}.tmp")
+        try:
+            if self.hardlink:
+                try:
+                    os.link(entry, tmp)
+                except OSError:
+                    shutil.copyfile(entry, tmp)
+            else:
+                shutil.copyfile(entry, tmp)
+            os.replace(tmp, output_path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False
+        try:
+            # mtime служит отметкой последнего использования для LRU
+            os.utime(entry, None)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key: str, output_path: str):
+        if not os.path.isfile(output_path):
+            return
+        entry = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            shutil.copyfile(output_path, tmp)
+            os.replace(tmp, entry)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    # ---------------------------- Maintenance ------------------------------ #
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        for root, _dirs, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith(".webm"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size_bytes(self) -> int:
+        return sum(size for _mtime, size, _path in self._entries())
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _mtime, size, _path in entries)
+            for _mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            os.makedirs(self.root, exist_ok=True)
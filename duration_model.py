@@ -0,0 +1,137 @@
+"""Encode time prediction for queue scheduling.
+
+The cost of a convert is modelled as ``pixels × frames``: decoding scales
+with the input resolution and frame rate, encoding with the 512 px sticker
+at up to 30 fps. :class:`DurationModel` learns, per settings key (operation,
+backend and task type), how many seconds one unit of that work takes on
+this machine, together with the fixed per-job overhead (process start,
+probing, writing the result): a least-squares line ``wall = a + b × work``
+over recent jobs, older jobs weighing less. It starts from the per-job
+metrics log written by :class:`job_metrics.MetricsRecorder` and keeps
+learning from every job the queue finishes (``JobQueue(predictor=...)``).
+
+Jobs that will be copied or remuxed (:mod:`compliance`) and native spoofs
+are predicted as near-instant.
+"""
+
+import json
+import os
+import threading
+
+from compliance import ENCODE, classify
+from ffmpeg_backend import STICKER_FPS, STICKER_SIZE
+
+# Секунд на единицу работы (кадр × мегапиксель) до первых измерений: ~30 кадр/с для 1080p
+DEFAULT_SECONDS_PER_UNIT = 0.015
+# Запуск процесса, анализ и запись результата, не зависящие от длины входа (до первых замеров)
+OVERHEAD_S = 0.5
+# Копирование, перепаковка и подмена длительности без кодирования
+INSTANT_S = 0.2
+# Вес прошлых замеров умножается на это число с каждым новым, так что модель следует за машиной
+DECAY = 0.95
+# Сколько последних строк лога метрик читать при запуске
+HISTORY_LINES = 2000
+
+
+def work_units(width: int | None, height: int | None, duration_s: float | None, fps: float | None) -> float | None:
+    """Decode plus encode work of a convert in frame-megapixels, or None if the input is unknown."""
+    if not width or not height or not duration_s:
+        return None
+    fps = fps or STICKER_FPS
+    decode = duration_s * fps * width * height
+    encode = duration_s * min(fps, STICKER_FPS) * STICKER_SIZE * STICKER_SIZE
+    return (decode + encode) / 1e6
+
+
+class DurationModel:
+    """Predict a job's run time from its input and the measured speed of its settings."""
+
+    def __init__(self, history_path: str | None = None):
+        self._lock = threading.Lock()
+        # ключ настроек -> взвешенные суммы [n, Σработа, Σвремя, Σработа², Σработа·время]
+        self._sums: dict[str, list[float]] = {}
+        if history_path:
+            self.load_history(history_path)
+
+    def load_history(self, path: str, limit: int = HISTORY_LINES):
+        """Learn from the tail of a :class:`job_metrics.MetricsRecorder` JSONL log."""
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                # Хвоста в 1 МБ хватает на тысячи записей; лог целиком не читаем
+                f.seek(max(0, f.tell() - 1024 * 1024))
+                lines = f.read().decode("utf-8", errors="replace").splitlines()[-limit:]
+        except OSError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict):
+                self._learn(entry)
+
+    def coefficients(self, settings: str) -> tuple[float, float]:
+        """``(overhead_s, seconds_per_unit)`` for ``settings``.
+
+        Unseen settings borrow the average of other task types of the same
+        operation and backend, then the defaults.
+        """
+        with self._lock:
+            sums = self._sums.get(settings)
+            if sums is None:
+                prefix = settings.rsplit("/", 1)[0] + "/"
+                similar = [_fit(s) for key, s in self._sums.items() if key.startswith(prefix)]
+                if not similar:
+                    return OVERHEAD_S, DEFAULT_SECONDS_PER_UNIT
+                return (
+                    sum(a for a, _b in similar) / len(similar),
+                    sum(b for _a, b in similar) / len(similar),
+                )
+            return _fit(sums)
+
+    def predict(self, job) -> float | None:
+        """Expected wall time of ``job`` in seconds, or None while its input is not probed."""
+        if job.operation == "spoof":
+            return INSTANT_S
+        media = job.media
+        if media is None:
+            return None
+        if job.fast_path and classify(media, job.input_path)[0] != ENCODE:
+            return INSTANT_S
+        units = work_units(media.width, media.height, job.parser.duration_s or media.duration_s, media.fps)
+        if units is None:
+            return None
+        overhead, rate = self.coefficients(job.settings_key)
+        return overhead + units * rate
+
+    def observe(self, job):
+        """Update the model from a finished job (called by the queue)."""
+        self._learn({"status": job.status, "cached": job.cached, **job.metrics()})
+
+    def _learn(self, entry: dict):
+        if entry.get("status") != "done" or entry.get("cached") or entry.get("fast_path"):
+            return
+        settings, wall = entry.get("settings"), entry.get("wall_s")
+        units = work_units(entry.get("width"), entry.get("height"), entry.get("duration_s"), entry.get("input_fps"))
+        if not settings or not wall or not units:
+            return
+        with self._lock:
+            sums = self._sums.setdefault(settings, [0.0] * 5)
+            for i, value in enumerate((1.0, units, wall, units * units, units * wall)):
+                sums[i] = sums[i] * DECAY + value
+
+
+def _fit(sums: list[float]) -> tuple[float, float]:
+    """Weighted least-squares ``(overhead_s, seconds_per_unit)`` from accumulated sums."""
+    n, su, sw, suu, suw = sums
+    variance = n * suu - su * su
+    # Веса затухают, поэтому после двух замеров n чуть меньше 2
+    if n > 1.5 and variance > 1e-9 * n * suu:
+        rate = (n * suw - su * sw) / variance
+        overhead = (sw - rate * su) / n
+        if rate > 0 and overhead >= 0:
+            return overhead, rate
+    # Одна точка или разброс работы слишком мал: накладные расходы по умолчанию, темп по среднему
+    overhead = min(OVERHEAD_S, sw / n) if n else OVERHEAD_S
+    return overhead, max(0.0, sw - overhead * n) / su if su else DEFAULT_SECONDS_PER_UNIT
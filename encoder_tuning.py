@@ -0,0 +1,212 @@
+"""libvpx-vp9 threading and speed auto-tuning.
+
+:func:`auto_settings` picks ``-threads``, ``-row-mt``, ``-tile-columns`` and
+``-speed`` from the number of cores, how many jobs currently share them
+and the input resolution. A calibration run (:func:`calibrate`) measures
+the fastest combination per thread count on this machine and stores it as
+a profile that :func:`auto_settings` prefers over the built-in rules.
+
+The module only uses the standard library so it can also be shipped with
+the Android build.
+"""
+
+import json
+import os
+import subprocess
+import time
+
+STICKER_WIDTH = 512
+# Минимальная ширина тайла VP9 — 256 px, поэтому для стикера 512 px больше двух колонок не бывает
+MIN_TILE_WIDTH = 256
+# Дальше 8 потоков кадр 512x512 (8 строк суперблоков) не ускоряется
+MAX_ENCODER_THREADS = 8
+SUPERBLOCK_SIZE = 64
+DEFAULT_SPEED = 4
+# На одном ядре жертвуем чуть большим размером ради вдвое более быстрого кодирования
+SINGLE_CORE_SPEED = 5
+LARGE_INPUT_PIXELS = 1920 * 1080
+PROFILE_VERSION = 1
+# При калибровке более быстрая скорость принимается, если файл вырос не больше чем на 5 %
+SPEED_SIZE_TOLERANCE = 0.05
+CALIBRATION_SPEEDS = (4, 5, 6)
+
+
+def max_tile_columns_log2(width: int) -> int:
+    n = 0
+    while (width >> (n + 1)) >= MIN_TILE_WIDTH:
+        n += 1
+    return n
+
+
+class EncoderSettings:
+    """Threading and speed options for one libvpx-vp9 encode."""
+
+    def __init__(
+        self,
+        threads: int = 1,
+        row_mt: bool = False,
+        tile_columns: int = 0,
+        speed: int = DEFAULT_SPEED,
+        decode_threads: int | None = None,
+    ):
+        self.threads = threads
+        self.row_mt = row_mt
+        self.tile_columns = tile_columns
+        self.speed = speed
+        self.decode_threads = decode_threads
+
+    def output_args(self, row_mt_supported: bool = True, tiles_supported: bool = True) -> list[str]:
+        args = ["-threads", str(self.threads)]
+        if row_mt_supported:
+            args += ["-row-mt", "1" if self.row_mt else "0"]
+        if tiles_supported:
+            args += ["-tile-columns", str(self.tile_columns)]
+        return [*args, "-speed", str(self.speed)]
+
+    def input_args(self) -> list[str]:
+        return ["-threads", str(self.decode_threads)] if self.decode_threads else []
+
+    def to_dict(self) -> dict:
+        return {
+            "threads": self.threads,
+            "row_mt": self.row_mt,
+            "tile_columns": self.tile_columns,
+            "speed": self.speed,
+            "decode_threads": self.decode_threads,
+        }
+
+    def __repr__(self) -> str:
+        return f"EncoderSettings({self.to_dict()})"
+
+
+class EncoderProfile:
+    """Calibrated best settings per encoder thread count for one machine."""
+
+    def __init__(self, entries: dict[int, dict], cpu_count: int | None = None, ffmpeg: str = "", created: float | None = None):
+        self.entries = entries
+        self.cpu_count = cpu_count
+        self.ffmpeg = ffmpeg
+        self.created = created
+
+    def lookup(self, threads: int) -> dict | None:
+        """Entry for the largest calibrated thread count not above ``threads``."""
+        keys = [k for k in self.entries if k <= threads]
+        return self.entries[max(keys)] if keys else None
+
+    def to_dict(self) -> dict:
+        return {
+            "version": PROFILE_VERSION,
+            "cpu_count": self.cpu_count,
+            "ffmpeg": self.ffmpeg,
+            "created": self.created,
+            "entries": {str(k): v for k, v in sorted(self.entries.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "EncoderProfile":
+        entries = {int(k): v for k, v in (data.get("entries") or {}).items()}
+        return cls(entries, data.get("cpu_count"), data.get("ffmpeg", ""), data.get("created"))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+
+def load_profile(path: str) -> EncoderProfile | None:
+    """Load a saved profile; None if missing, unreadable or from another machine."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != PROFILE_VERSION:
+        return None
+    if data.get("cpu_count") not in (None, os.cpu_count()):
+        return None
+    return EncoderProfile.from_dict(data)
+
+
+def auto_settings(
+    cpu_count: int | None = None,
+    concurrent_jobs: int = 1,
+    input_width: int | None = None,
+    input_height: int | None = None,
+    output_width: int = STICKER_WIDTH,
+    profile: EncoderProfile | None = None,
+) -> EncoderSettings:
+    """Pick encoder settings for one job sharing ``cpu_count`` cores with others."""
+    cpus = cpu_count or os.cpu_count() or 1
+    share = max(1, cpus // max(1, concurrent_jobs))
+    # Больше потоков, чем строк суперблоков 64 px, row-mt занять не может
+    threads = min(share, MAX_ENCODER_THREADS, max(1, -(-output_width // SUPERBLOCK_SIZE)))
+    settings = EncoderSettings(
+        threads=threads,
+        row_mt=threads > 1,
+        tile_columns=min(max_tile_columns_log2(output_width), (threads - 1).bit_length()),
+        speed=DEFAULT_SPEED if threads > 1 else SINGLE_CORE_SPEED,
+    )
+    entry = profile.lookup(threads) if profile is not None else None
+    if entry:
+        settings.row_mt = bool(entry.get("row_mt", settings.row_mt))
+        settings.tile_columns = int(entry.get("tile_columns", settings.tile_columns))
+        settings.speed = int(entry.get("speed", settings.speed))
+    pixels = (input_width or 0) * (input_height or 0)
+    if pixels >= LARGE_INPUT_PIXELS:
+        # Декодирование 1080p+ стоит дороже кодирования стикера — отдаём ему все ядра доли задачи
+        settings.decode_threads = share
+    elif pixels:
+        settings.decode_threads = min(share, 2)
+    return settings
+
+
+def _thread_levels(cpu_count: int) -> list[int]:
+    levels = [1]
+    while levels[-1] * 2 <= min(cpu_count, MAX_ENCODER_THREADS):
+        levels.append(levels[-1] * 2)
+    return levels
+
+
+def calibrate(command_for, cpu_count: int | None = None, work_dir: str = ".", on_progress=None) -> EncoderProfile:
+    """Measure the fastest settings for each thread count.
+
+    ``command_for(settings, output_path)`` must return the full ffmpeg
+    command of a representative encode. For every thread level the
+    row-mt/tile combinations are timed at the default speed, then faster
+    speeds are accepted while the output grows by at most
+    :data:`SPEED_SIZE_TOLERANCE`.
+    """
+    cpus = cpu_count or os.cpu_count() or 1
+    output = os.path.join(work_dir, "calibration.webm")
+
+    def measure(settings: EncoderSettings) -> tuple[float, int]:
+        t0 = time.monotonic()
+        subprocess.run(command_for(settings, output), check=True, capture_output=True)
+        wall = time.monotonic() - t0
+        size = os.path.getsize(output)
+        if on_progress is not None:
+            on_progress(settings, wall, size)
+        return wall, size
+
+    max_tiles = max_tile_columns_log2(STICKER_WIDTH)
+    entries: dict[int, dict] = {}
+    for threads in _thread_levels(cpus):
+        candidates = [(False, 0)] if threads == 1 else [(False, 0), (True, 0)] + [(True, t) for t in range(1, max_tiles + 1)]
+        best = None
+        for row_mt, tiles in candidates:
+            wall, size = measure(EncoderSettings(threads, row_mt, tiles, DEFAULT_SPEED))
+            if best is None or wall < best[0]:
+                best = (wall, size, row_mt, tiles)
+        assert best is not None
+        base_wall, base_size, row_mt, tiles = best
+        speed, wall = DEFAULT_SPEED, base_wall
+        for candidate in CALIBRATION_SPEEDS:
+            if candidate <= DEFAULT_SPEED:
+                continue
+            c_wall, c_size = measure(EncoderSettings(threads, row_mt, tiles, candidate))
+            if c_size <= base_size * (1 + SPEED_SIZE_TOLERANCE) and c_wall < wall:
+                speed, wall = candidate, c_wall
+        entries[threads] = {"row_mt": row_mt, "tile_columns": tiles, "speed": speed, "wall_s": round(wall, 3)}
+    return EncoderProfile(entries, cpu_count=os.cpu_count(), created=round(time.time(), 3))
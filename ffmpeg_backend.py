@@ -0,0 +1,396 @@
+"""Direct ffmpeg backend and structured progress parsing.
+
+ffmpeg is started with ``-progress pipe:1 -nostats``, which makes it print
+``key=value`` blocks terminated by ``progress=continue``/``progress=end``.
+:class:`ProgressParser` consumes output line by line and turns those blocks
+into :class:`ProgressEvent` objects. The classic ``frame=... time=...``
+stats line printed by tgradish/ffmpeg is understood as well, so both
+backends drive the progress bar, ETA and metrics through the same events.
+"""
+
+import re
+
+STICKER_SIZE = 512
+STICKER_FPS = 30
+STICKER_MAX_BYTES = 256 * 1024
+STICKER_MAX_DURATION_S = 3.0
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_STATS_RE = re.compile(r"(frame|fps|size|time|bitrate|speed)=\s*(\S+)")
+_KV_RE = re.compile(r"^([a-z_0-9]+)=\s*(\S*)$")
+
+
+def _parse_clock(value: str) -> float | None:
+    """Parse ``HH:MM:SS.frac`` (ffmpeg time notation) into seconds."""
+    parts = value.strip().split(":")
+    if len(parts) != 3:
+        return None
+    try:
+        h, m, s = parts
+        return int(h) * 3600 + int(m) * 60 + float(s)
+    except ValueError:
+        return None
+
+
+def _parse_float(value: str) -> float | None:
+    value = value.strip().rstrip("x")
+    if not value or value == "N/A":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _parse_size(value: str) -> int | None:
+    """Parse a byte count (``12345``) or a stats size (``512kB``, ``1.2MiB``)."""
+    m = re.match(r"^(\d+(?:\.\d+)?)\s*([kKmMgG]i?B)?$", value.strip())
+    if not m:
+        return None
+    number = float(m.group(1))
+    unit = (m.group(2) or "").lower()
+    scale = {"": 1, "kb": 1000, "kib": 1024, "mb": 1000 ** 2, "mib": 1024 ** 2, "gb": 1000 ** 3, "gib": 1024 ** 3}
+    return int(number * scale.get(unit, 1))
+
+
+class ProgressEvent:
+    """A snapshot of encoder progress."""
+
+    __slots__ = ("out_time_s", "frame", "fps", "speed", "total_size", "finished")
+
+    def __init__(
+        self,
+        out_time_s: float | None = None,
+        frame: int | None = None,
+        fps: float | None = None,
+        speed: float | None = None,
+        total_size: int | None = None,
+        finished: bool = False,
+    ):
+        self.out_time_s = out_time_s
+        self.frame = frame
+        self.fps = fps
+        self.speed = speed
+        self.total_size = total_size
+        self.finished = finished
+
+    def __repr__(self) -> str:
+        return (
+            f"ProgressEvent(out_time_s={self.out_time_s}, frame={self.frame}, fps={self.fps}, "
+            f"speed={self.speed}, total_size={self.total_size}, finished={self.finished})"
+        )
+
+
+class ProgressParser:
+    """Incremental parser for ffmpeg ``-progress`` output and stats lines.
+
+    ``feed`` is called once per output line and returns a
+    :class:`ProgressEvent` whenever a progress block is complete (or a stats
+    line was seen), otherwise ``None``. The input duration is picked up from
+    the ``Duration:`` banner line into :attr:`duration_s` unless it was
+    provided up front.
+    """
+
+    def __init__(self, duration_s: float | None = None):
+        self.duration_s = duration_s
+        self._block: dict[str, str] = {}
+
+    def feed(self, line: str) -> ProgressEvent | None:
+        text = line.strip()
+        if not text:
+            return None
+        kv = _KV_RE.match(text)
+        if kv:
+            key, value = kv.groups()
+            if key == "progress":
+                block, self._block = self._block, {}
+                return self._event_from_block(block, finished=(value == "end"))
+            self._block[key] = value
+            return None
+        if self.duration_s is None:
+            m = _DURATION_RE.search(text)
+            if m:
+                total = _parse_clock(":".join(m.groups()))
+                if total:
+                    self.duration_s = total
+                return None
+        if "time=" in text:
+            return self._event_from_stats(text)
+        return None
+
+    @staticmethod
+    def _event_from_block(block: dict[str, str], finished: bool) -> ProgressEvent:
+        out_time_s = None
+        if "out_time_us" in block:
+            us = _parse_float(block["out_time_us"])
+            out_time_s = us / 1_000_000 if us is not None and us >= 0 else None
+        elif "out_time_ms" in block:
+            # Исторически out_time_ms тоже содержит микросекунды
+            us = _parse_float(block["out_time_ms"])
+            out_time_s = us / 1_000_000 if us is not None and us >= 0 else None
+        elif "out_time" in block:
+            out_time_s = _parse_clock(block["out_time"])
+        frame = _parse_float(block.get("frame", ""))
+        size = _parse_size(block.get("total_size", "")) if "total_size" in block else None
+        return ProgressEvent(
+            out_time_s=out_time_s,
+            frame=int(frame) if frame is not None else None,
+            fps=_parse_float(block.get("fps", "")),
+            speed=_parse_float(block.get("speed", "")),
+            total_size=size,
+            finished=finished,
+        )
+
+    @staticmethod
+    def _event_from_stats(text: str) -> ProgressEvent | None:
+        fields = dict(_STATS_RE.findall(text))
+        if "time" not in fields:
+            return None
+        out_time_s = _parse_clock(fields["time"])
+        if out_time_s is None:
+            return None
+        frame = _parse_float(fields.get("frame", ""))
+        return ProgressEvent(
+            out_time_s=out_time_s,
+            frame=int(frame) if frame is not None else None,
+            fps=_parse_float(fields.get("fps", "")),
+            speed=_parse_float(fields.get("speed", "")),
+            total_size=_parse_size(fields["size"]) if "size" in fields else None,
+        )
+
+
+def sticker_filter(size: int = STICKER_SIZE) -> str:
+    """Video filter producing a Telegram sticker frame (longest side ``size`` px)."""
+    return f"scale={size}:{size}:force_original_aspect_ratio=decrease:flags=bicubic"
+
+
+def _vp9_output_options(crf: int, encoder_args: list[str] | tuple = ()) -> list[str]:
+    return [
+        "-an",
+        "-c:v", "libvpx-vp9",
+        "-b:v", "0",
+        "-crf", str(crf),
+        "-pix_fmt", "yuva420p",
+        "-deadline", "good",
+        "-speed", "4",
+        *encoder_args,
+    ]
+
+
+# Декодеры, умеющие отдавать кадр в 1/2, 1/4, 1/8 разрешения (-lowres)
+LOWRES_CODECS = frozenset({"mjpeg", "mpeg1video", "mpeg2video", "mpeg4", "h263", "msmpeg4v3", "wmv1", "wmv2"})
+# Декодеры, которые честно пропускают deblocking по -skip_loop_filter
+SKIP_LOOP_FILTER_CODECS = frozenset({"h264", "hevc"})
+MAX_LOWRES = 3
+# Во сколько раз исходник должен быть больше стикера, чтобы упрощать декодирование
+SKIP_LOOP_FILTER_RATIO = 4.0
+
+
+def seek_options(start_s: float = 0.0, duration_s: float | None = None) -> list[str]:
+    """Input options that make ffmpeg seek before decoding instead of decoding and dropping."""
+    options: list[str] = []
+    if start_s:
+        options += ["-ss", f"{start_s:.6f}"]
+    if duration_s:
+        options += ["-t", f"{duration_s:.6f}"]
+    return options
+
+
+def sticker_length(duration_s: float | None = None) -> float:
+    """Length to encode: ``duration_s`` if given, but never more than a sticker may last."""
+    return min(duration_s, STICKER_MAX_DURATION_S) if duration_s else STICKER_MAX_DURATION_S
+
+
+def _parse_time(value: str) -> float | None:
+    """Parse an ffmpeg time duration: seconds (``12.5``) or ``[HH:]MM:SS[.frac]``."""
+    text = value.strip()
+    if ":" in text:
+        if text.count(":") == 1:
+            text = "0:" + text
+        return _parse_clock(text)
+    return _parse_float(text.rstrip("s"))
+
+
+def split_seek_options(extra_parts: list[str] | tuple) -> tuple[float, float | None, list[str]]:
+    """Move ``-ss``/``-t``/``-to`` from output options to input options.
+
+    Placed after ``-i`` these make ffmpeg decode everything up to the start
+    point and throw it away; before ``-i`` they seek in the demuxer. ``-to``
+    is turned into a ``-t`` length because its meaning as an input option
+    differs between ffmpeg versions. Returns ``(start_s, duration_s, rest)``
+    for :func:`seek_options`.
+    """
+    rest: list[str] = []
+    found: dict[str, float] = {}
+    parts = list(extra_parts)
+    i = 0
+    while i < len(parts):
+        flag = parts[i]
+        value = _parse_time(parts[i + 1]) if flag in ("-ss", "-t", "-to") and i + 1 < len(parts) else None
+        if value is None:
+            rest.append(flag)
+            i += 1
+            continue
+        found[flag] = value
+        i += 2
+    start = found.get("-ss", 0.0)
+    length = found.get("-t")
+    if length is None and "-to" in found:
+        length = max(0.0, found["-to"] - start)
+    return start, length, rest
+
+
+def input_duration_limit(args: list[str]) -> float | None:
+    """Length limit (``-t`` before ``-i``) of an ffmpeg command, if any."""
+    try:
+        head = args[: args.index("-i")]
+    except ValueError:
+        return None
+    if "-t" in head and head.index("-t") + 1 < len(head):
+        return _parse_time(head[head.index("-t") + 1])
+    return None
+
+
+def fast_decode_options(
+    codec: str | None,
+    width: int | None,
+    height: int | None,
+    fps: float | None = None,
+) -> tuple[list[str], str]:
+    """Cheaper decode path for sources much larger than a sticker.
+
+    Returns ``(input_options, video_filter)``: ``-lowres`` where the decoder
+    can downscale on its own, ``-skip_loop_filter`` for H.264/HEVC sources
+    far above sticker size (deblocking artifacts vanish after the downscale)
+    and a filter graph that drops surplus frames before scaling.
+    """
+    options: list[str] = []
+    vf = sticker_filter()
+    ratio = max(width or 0, height or 0) / STICKER_SIZE
+    if codec in LOWRES_CODECS and ratio >= 2:
+        lowres = 0
+        while lowres < MAX_LOWRES and ratio / 2 ** (lowres + 1) >= 1:
+            lowres += 1
+        options += ["-lowres", str(lowres)]
+    elif codec in SKIP_LOOP_FILTER_CODECS and ratio >= SKIP_LOOP_FILTER_RATIO:
+        options += ["-skip_loop_filter", "all"]
+    if fps and fps > STICKER_FPS * 1.05:
+        # Лишние кадры отбрасываются до масштабирования, а не после него
+        vf = f"fps={STICKER_FPS},{vf}"
+    return options, vf
+
+
+def build_convert_command(
+    input_path: str,
+    output_path: str,
+    extra_parts: list[str] | tuple = (),
+    crf: int = 32,
+    progress: bool = True,
+    input_options: list[str] | tuple = (),
+    encoder_args: list[str] | tuple = (),
+    video_filter: str | None = None,
+) -> list[str]:
+    """Build ffmpeg arguments (without the executable) for a sticker encode.
+
+    ``input_options`` are placed before ``-i`` (e.g. ``-ss``/``-t`` for
+    input seeking); ``encoder_args`` are extra libvpx-vp9 options the
+    installed ffmpeg is known to support; ``video_filter`` replaces the
+    default :func:`sticker_filter`.
+    """
+    return [
+        "-hide_banner",
+        "-nostdin",
+        "-y",
+        *input_options,
+        "-i", input_path,
+        "-vf", video_filter or sticker_filter(),
+        "-r", str(STICKER_FPS),
+        *_vp9_output_options(crf, encoder_args),
+        *extra_parts,
+        *(("-progress", "pipe:1", "-nostats") if progress else ("-nostats",)),
+        output_path,
+    ]
+
+
+def build_remux_command(input_path: str, output_path: str, progress: bool = True) -> list[str]:
+    """Build ffmpeg arguments that copy the first video stream into a WebM without audio."""
+    return [
+        "-hide_banner",
+        "-nostdin",
+        "-y",
+        "-i", input_path,
+        "-map", "0:v:0",
+        "-c:v", "copy",
+        "-an", "-sn", "-dn",
+        *(("-progress", "pipe:1", "-nostats") if progress else ("-nostats",)),
+        "-f", "webm",
+        output_path,
+    ]
+
+
+def build_multi_output_command(
+    input_path: str,
+    outputs: list[tuple[str, str, int, list[str]]],
+    extra_parts: list[str] | tuple = (),
+    progress: bool = True,
+    input_options: list[str] | tuple = (),
+) -> list[str]:
+    """Build ffmpeg arguments that decode the input once and encode several outputs.
+
+    ``outputs`` are ``(path, video_filter, crf, encoder_args)`` tuples; the
+    decoded frames are reduced to the sticker frame rate, fanned out with a
+    ``split`` filter and each branch is scaled and encoded separately.
+    ``extra_parts`` are repeated for every output.
+    """
+    count = len(outputs)
+    graph = f"[0:v]fps={STICKER_FPS},split={count}" + "".join(f"[s{i}]" for i in range(count))
+    for i, (_path, video_filter, _crf, _args) in enumerate(outputs):
+        graph += f";[s{i}]{video_filter}[v{i}]"
+    args = [
+        "-hide_banner",
+        "-nostdin",
+        "-y",
+        *(("-progress", "pipe:1", "-nostats") if progress else ("-nostats",)),
+        *input_options,
+        "-i", input_path,
+        "-filter_complex", graph,
+    ]
+    for i, (path, _video_filter, crf, encoder_args) in enumerate(outputs):
+        args += ["-map", f"[v{i}]", *_vp9_output_options(crf, encoder_args), *extra_parts, path]
+    return args
+
+
+def merge_encoder_options(
+    args: list[str],
+    input_options: list[str] | tuple = (),
+    encoder_options: list[str] | tuple = (),
+) -> list[str]:
+    """Merge tuned options into arguments built by :func:`build_convert_command`.
+
+    Each ``-flag value`` pair of ``encoder_options`` replaces the first
+    occurrence of that flag after ``-i`` (the built-in default), so options
+    appended later by the user still win; unknown flags are inserted right
+    after ``-speed``. ``input_options`` go before ``-i`` unless the flag is
+    already given there.
+    """
+    result = list(args)
+    try:
+        input_at = result.index("-i")
+    except ValueError:
+        return result
+    try:
+        insert_at = result.index("-speed", input_at + 2) + 2
+    except ValueError:
+        insert_at = len(result) - 1
+    for flag, value in zip(encoder_options[::2], encoder_options[1::2]):
+        try:
+            at = result.index(flag, input_at + 2)
+            result[at + 1] = value
+        except ValueError:
+            result[insert_at:insert_at] = [flag, value]
+            insert_at += 2
+    for flag, value in zip(input_options[::2], input_options[1::2]):
+        if flag not in result[:input_at]:
+            result[input_at:input_at] = [flag, value]
+            input_at += 2
+    return result
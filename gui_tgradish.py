@@ -1,222 +1,153 @@
 import os
 import sys
+import json
+import time
+import functools
 import shlex
-import queue
-import shutil
-import threading
 import subprocess
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import runpy
-import re
-
-# Попытка импортировать tgradish для упаковки внутрь exe (PyInstaller hidden-import)
-try:
-    import tgradish as _tgradish  # noqa: F401
-except Exception:
-    _tgradish = None  # type: ignore
-
-
-class DependencyChecker:
-    """Utility to check for required external tools and build command invocations."""
-
-    @staticmethod
-    def has_tgradish_cli() -> bool:
-        return shutil.which("tgradish") is not None
 
-    @staticmethod
-    def has_tgradish_module() -> bool:
-        try:
-            import importlib.util
-            return importlib.util.find_spec("tgradish") is not None
-        except Exception:
-            return False
-
-    @staticmethod
-    def is_tgradish_available() -> bool:
-        return DependencyChecker.has_tgradish_cli() or DependencyChecker.has_tgradish_module()
-
-    @staticmethod
-    def tgradish_command() -> list:
-        """Return a command prefix for invoking tgradish.
-
-        Prefer the CLI script if present; otherwise fallback to `python -m tgradish`.
-        """
-        if DependencyChecker.has_tgradish_cli():
-            return ["tgradish"]
-        # В портативной сборке PyInstaller `-m` недоступен.
-        # Фактический запуск будет через встроенный режим (runpy).
+from async_engine import UiBridge, engine_loop
+from conversion_cache import ConversionCache
+from duration_model import DurationModel
+from job_metrics import MetricsRecorder, default_log_path
+from ffmpeg_backend import ProgressEvent
+from single_instance import FORWARD_WAIT_S, InstanceServer, forward
+from webm_spoof import DEFAULT_DURATION_S, SpoofStep, SpoofTask
+from tgradish_jobs import (
+    SCHEDULE_FAIR,
+    SCHEDULE_FIFO,
+    SCHEDULE_SJF,
+    DependencyChecker,
+    Job,
+    JobQueue,
+    build_spoof_args,
+    inject_embedded_ffmpeg_into_path,
+    plan_convert,
+    resolve_output_path,
+    tool_registry,
+    user_cache_dir,
+)
+
+
+# Замер холодного старта (см. bench_startup.py): файл, куда пишутся метки времени
+STARTUP_REPORT_ENV = "TGRADISH_GUI_STARTUP_REPORT"
+# Входной файл задачи, запускаемой сразу после появления окна, и её движок
+STARTUP_JOB_ENV = "TGRADISH_GUI_STARTUP_JOB"
+STARTUP_BACKEND_ENV = "TGRADISH_GUI_STARTUP_BACKEND"
+# Путь к .prom-файлу для textfile collector node_exporter (по умолчанию не пишется)
+METRICS_PROM_ENV = "TGRADISH_METRICS_PROM"
+# Запустить отдельное окно, даже если приложение уже открыто
+NEW_INSTANCE_FLAG = "--new-instance"
+
+# Подписи политик очереди в выпадающем списке
+SCHEDULE_LABELS = {
+    SCHEDULE_SJF: "сначала короткие",
+    SCHEDULE_FAIR: "поровну между запусками",
+    SCHEDULE_FIFO: "по порядку добавления",
+}
+
+
+def _split_input_paths(text: str) -> list[str]:
+    """Split the input entry into file paths (separated by ';')."""
+    text = text.strip()
+    if not text:
         return []
+    if os.path.isfile(text):
+        return [text]
+    return [p.strip() for p in text.split(";") if p.strip()]
 
-    @staticmethod
-    def is_ffmpeg_available() -> bool:
-        return shutil.which("ffmpeg") is not None
-
-
-class BackgroundProcessRunner:
-    """Run external commands in a background thread and stream their output."""
-
-    def __init__(self, on_output_line, on_process_end):
-        self._on_output_line = on_output_line
-        self._on_process_end = on_process_end
-        self._thread: threading.Thread | None = None
-        self._proc: subprocess.Popen | None = None
-        self._stop_requested = False
-
-    def run(self, command: list[str], cwd: str | None = None):
-        if self._thread and self._thread.is_alive():
-            raise RuntimeError("Уже запущен процесс. Остановите его перед новым запуском.")
-        self._stop_requested = False
-        self._thread = threading.Thread(target=self._run_worker, args=(command, cwd), daemon=True)
-        self._thread.start()
-
-    def terminate(self):
-        self._stop_requested = True
-        if self._proc and self._proc.poll() is None:
-            try:
-                self._proc.terminate()
-            except Exception:
-                pass
-
-    def _run_worker(self, command: list[str], cwd: str | None):
-        try:
-            self._on_output_line(f"$ {' '.join(shlex.quote(c) for c in command)}\n")
-            self._proc = subprocess.Popen(
-                command,
-                cwd=cwd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-            )
-        except FileNotFoundError as e:
-            self._on_output_line(f"Ошибка запуска: {e}\n")
-            self._on_process_end(1)
-            return
-        except Exception as e:
-            self._on_output_line(f"Не удалось запустить процесс: {e}\n")
-            self._on_process_end(1)
-            return
-
-        assert self._proc is not None
-        with self._proc.stdout as stream:  # type: ignore[arg-type]
-            for line in stream:  # type: ignore[assignment]
-                if self._stop_requested:
-                    break
-                self._on_output_line(line)
 
-        # Ensure process is terminated if stop requested
-        if self._stop_requested and self._proc.poll() is None:
-            try:
-                self._proc.terminate()
-            except Exception:
-                pass
+def _join_input_paths(paths: list[str]) -> str:
+    return "; ".join(paths)
 
-        code = self._proc.wait()
-        self._on_process_end(code)
 
+def _output_folder(path: str) -> str:
+    return path if os.path.isdir(path) else os.path.dirname(path)
 
-class InProcessTgradishRunner:
-    """Run `tgradish` module in-process (no external CLI needed)."""
 
-    def __init__(self, on_output_line, on_process_end):
-        self._on_output_line = on_output_line
-        self._on_process_end = on_process_end
-        self._thread: threading.Thread | None = None
-        self._stop_requested = False
+def _open_metadata_index():
+    try:
+        from media_probe import MetadataIndex
 
-    def run(self, tgradish_args: list[str]):
-        if self._thread and self._thread.is_alive():
-            raise RuntimeError("Уже запущен процесс. Остановите его перед новым запуском.")
-        self._stop_requested = False
-        self._thread = threading.Thread(target=self._worker, args=(tgradish_args,), daemon=True)
-        self._thread.start()
+        return MetadataIndex()
+    except Exception:
+        return None
 
-    def terminate(self):
-        # Корректная остановка встроенного CLI не гарантируется
-        self._stop_requested = True
-        self._on_output_line("Прерывание встроенного режима не поддерживается полностью. Ожидайте завершения...\n")
 
-    def _worker(self, tgradish_args: list[str]):
-        self._on_output_line("$ tgradish " + " ".join(shlex.quote(a) for a in tgradish_args) + "\n")
-        if not DependencyChecker.has_tgradish_module():
-            self._on_output_line("Встроенный модуль tgradish недоступен.\n")
-            self._on_process_end(1)
-            return
+def _instance_info_path() -> str:
+    return os.path.join(user_cache_dir("instance"), "gui.json")
 
-        # Подмена argv и потоков вывода
-        old_argv = sys.argv
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
-
-        class _Stream:
-            def __init__(self, callback):
-                self._buf = ""
-                self._cb = callback
-
-            def write(self, s):
-                self._buf += str(s)
-                while "\n" in self._buf:
-                    line, self._buf = self._buf.split("\n", 1)
-                    self._cb(line + "\n")
-
-            def flush(self):
-                if self._buf:
-                    self._cb(self._buf)
-                    self._buf = ""
-
-        sys.argv = ["tgradish", *tgradish_args]
-        sys.stdout = _Stream(self._on_output_line)  # type: ignore
-        sys.stderr = _Stream(self._on_output_line)  # type: ignore
-        exit_code = 0
-        try:
-            runpy.run_module("tgradish", run_name="__main__")
-        except SystemExit as e:
-            try:
-                exit_code = int(getattr(e, "code", 1))
-            except Exception:
-                exit_code = 1
-        except Exception as e:
-            self._on_output_line(f"Ошибка выполнения: {e}\n")
-            exit_code = 1
-        finally:
-            try:
-                sys.stdout.flush()  # type: ignore
-                sys.stderr.flush()  # type: ignore
-            except Exception:
-                pass
-            sys.argv = old_argv
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
 
-        self._on_process_end(exit_code)
+def _format_eta(seconds: float | None, approximate: bool = False) -> str:
+    if seconds is None:
+        return ""
+    seconds = int(round(seconds))
+    return f"{'~' if approximate else ''}{seconds // 60}:{seconds % 60:02d}"
 
 
 class TgradishGUI:
     """Tkinter-based GUI wrapper around tgradish CLI (convert and spoof)."""
 
+    # Период обработки событий задач в UI-потоке, мс
+    UI_TICK_MS = 50
+    # Предел событий за один тик, чтобы UI не замирал при всплеске вывода
+    UI_TICK_MAX_EVENTS = 10000
+    # Как часто пересчитывать прогноз окончания задач, с
+    ETA_REFRESH_S = 1.0
+
     def __init__(self, root: tk.Tk):
         self.root = root
         self.root.title("Tgradish GUI")
-        self.root.geometry("900x600")
-        self.root.minsize(800, 520)
-
-        self.process_runner = BackgroundProcessRunner(
-            on_output_line=self._on_process_output_line_threadsafe,
-            on_process_end=self._on_process_finished_threadsafe,
-        )
-        self.inproc_runner = InProcessTgradishRunner(
-            on_output_line=self._on_process_output_line_threadsafe,
-            on_process_end=self._on_process_finished_threadsafe,
+        self.root.geometry("900x720")
+        self.root.minsize(800, 640)
+
+        self.conversion_cache = ConversionCache()
+        # История скорости читается из лога метрик к первой задаче, как и индекс метаданных
+        self.duration_model = DurationModel()
+        self.job_queue = JobQueue(
+            # Строки уже лежат в job.log; вкладка «Журнал» дочитывает их по тику
+            on_job_output=None,
+            on_job_update=self._on_job_update_threadsafe,
+            on_job_progress=self._on_job_progress_threadsafe,
+            cache=self.conversion_cache,
+            metrics=MetricsRecorder(default_log_path(), os.environ.get(METRICS_PROM_ENV) or None),
+            log_dir=user_cache_dir("logs"),
+            predictor=self.duration_model,
+            policy=SCHEDULE_SJF,
         )
+        # Индекс метаданных (sqlite3) открывается к первой задаче, чтобы не задерживать появление окна
+        self._metadata_index_opened = False
 
         # Состояние прогресса
-        self.current_operation: str | None = None  # 'convert' | 'spoof'
-        self.total_duration_s: float | None = None
         self.is_indeterminate: bool = False
+        # Вызовы из потоков движка (события задач, отчёт пакета, файлы повторного запуска);
+        # выполняются в UI-потоке одним периодическим тиком
+        self._bridge = UiBridge()
+        # Задачи, изменившиеся с прошлого тика (только UI-поток)
+        self._dirty_jobs: dict[int, Job] = {}
+        # Текущая сборка пакета
+        self._pack_build = None
+        # Задача, чей журнал показан во вкладке «Журнал», и номер следующей строки для дозаписи
+        self._log_job: Job | None = None
+        self._log_seq = 0
+        # Каждый запуск (нажатие кнопки) — отдельная группа для политики fair
+        self._batch = 0
+        # Прогноз окончания активных задач (id -> с) и всей очереди, время расчёта
+        self._etas: dict[int, float | None] = {}
+        self._eta_total: float | None = None
+        self._etas_at = 0.0
 
         self._build_ui()
         self._update_dependency_labels()
+        self.root.after(self.UI_TICK_MS, self._ui_tick)
+
+        self._startup_report = os.environ.get(STARTUP_REPORT_ENV, "")
+        self._startup_job_pending = False
+        if self._startup_report:
+            self.root.after_idle(self._on_startup_window_shown)
 
     # --------------------------- UI Construction --------------------------- #
     def _build_ui(self):
@@ -232,6 +163,34 @@ class TgradishGUI:
         # Top spacer (ранее показывал режим, сейчас оставлен как отступ)
         top_bar = ttk.Frame(self.main_frame)
         top_bar.pack(fill=tk.X, padx=12, pady=(6, 6))
+        ttk.Label(top_bar, text="Параллельных задач:").pack(side=tk.LEFT)
+        self.var_workers = tk.IntVar(value=self.job_queue.max_workers)
+        spn_workers = ttk.Spinbox(
+            top_bar,
+            from_=1,
+            to=max(1, (os.cpu_count() or 1) * 2),
+            textvariable=self.var_workers,
+            width=5,
+            command=self._on_workers_changed,
+        )
+        spn_workers.pack(side=tk.LEFT, padx=(8, 0))
+        spn_workers.bind("<FocusOut>", lambda _e: self._on_workers_changed())
+        spn_workers.bind("<Return>", lambda _e: self._on_workers_changed())
+        self.var_use_cache = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            top_bar,
+            text="Кэш конвертаций",
+            variable=self.var_use_cache,
+            command=self._on_use_cache_changed,
+        ).pack(side=tk.LEFT, padx=(16, 0))
+        ttk.Button(top_bar, text="Очистить кэш", command=self._on_clear_cache).pack(side=tk.LEFT, padx=(8, 0))
+        ttk.Label(top_bar, text="Порядок:").pack(side=tk.LEFT, padx=(16, 0))
+        self.var_schedule = tk.StringVar(value=SCHEDULE_LABELS[self.job_queue.policy])
+        cmb_schedule = ttk.Combobox(
+            top_bar, textvariable=self.var_schedule, values=list(SCHEDULE_LABELS.values()), state="readonly", width=24
+        )
+        cmb_schedule.pack(side=tk.LEFT, padx=(8, 0))
+        cmb_schedule.bind("<<ComboboxSelected>>", lambda _e: self._on_schedule_changed())
 
         # Убраны кнопки проверки/установки зависимостей
 
@@ -244,6 +203,36 @@ class TgradishGUI:
 
         self._build_convert_tab()
         self._build_spoof_tab()
+        self._build_pack_tab()
+        self._build_log_tab()
+        self.notebook.bind("<<NotebookTabChanged>>", lambda _e: self._render_log())
+
+        # Queue section
+        queue_frame = ttk.LabelFrame(self.main_frame, text="Очередь")
+        queue_frame.pack(fill=tk.BOTH, padx=12, pady=(6, 0))
+        columns = ("file", "operation", "status", "progress", "fps", "eta", "code")
+        self.queue_view = ttk.Treeview(queue_frame, columns=columns, show="headings", height=6)
+        for col, heading, width in (
+            ("file", "Файл", 360),
+            ("operation", "Операция", 90),
+            ("status", "Статус", 110),
+            ("progress", "Прогресс", 80),
+            ("fps", "FPS", 60),
+            ("eta", "Осталось", 80),
+            ("code", "Код", 60),
+        ):
+            self.queue_view.heading(col, text=heading)
+            self.queue_view.column(col, width=width, stretch=(col == "file"))
+        self.queue_view.pack(fill=tk.BOTH, expand=True, side=tk.LEFT, padx=(8, 0), pady=8)
+        queue_scroll = ttk.Scrollbar(queue_frame, orient=tk.VERTICAL, command=self.queue_view.yview)
+        queue_scroll.pack(fill=tk.Y, side=tk.LEFT, pady=8)
+        self.queue_view.configure(yscrollcommand=queue_scroll.set)
+        self.queue_view.bind("<<TreeviewSelect>>", lambda _e: self._on_queue_select())
+        self.queue_view.bind("<Double-1>", lambda _e: self.notebook.select(self.log_tab))
+        queue_btns = ttk.Frame(queue_frame)
+        queue_btns.pack(fill=tk.Y, side=tk.LEFT, padx=8, pady=8)
+        ttk.Button(queue_btns, text="Отменить выбранные", command=self._on_cancel_selected).pack(fill=tk.X)
+        ttk.Button(queue_btns, text="Очистить завершённые", command=self._on_clear_finished).pack(fill=tk.X, pady=(6, 0))
 
         # Progress section
         prog_frame = ttk.LabelFrame(self.main_frame, text="Прогресс")
@@ -267,7 +256,7 @@ class TgradishGUI:
         section.pack(fill=tk.X, padx=10, pady=(12, 6))
         row1 = ttk.Frame(section)
         row1.pack(fill=tk.X, padx=8, pady=(8, 6))
-        ttk.Label(row1, text="Входной файл видео:").pack(side=tk.LEFT)
+        ttk.Label(row1, text="Входные файлы видео:").pack(side=tk.LEFT)
         self.var_convert_input = tk.StringVar()
         ent_in = ttk.Entry(row1, textvariable=self.var_convert_input)
         ent_in.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=8)
@@ -276,7 +265,7 @@ class TgradishGUI:
         # Output file
         row2 = ttk.Frame(section)
         row2.pack(fill=tk.X, padx=8, pady=6)
-        ttk.Label(row2, text="Выходной файл (.webm, опционально):").pack(side=tk.LEFT)
+        ttk.Label(row2, text="Выходной файл или папка (опционально):").pack(side=tk.LEFT)
         self.var_convert_output = tk.StringVar()
         ent_out = ttk.Entry(row2, textvariable=self.var_convert_output)
         ent_out.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=8)
@@ -291,6 +280,53 @@ class TgradishGUI:
         self.var_convert_extra = tk.StringVar()
         ent_args = ttk.Entry(row3, textvariable=self.var_convert_extra)
         ent_args.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=8)
+        row_backend = ttk.Frame(adv)
+        row_backend.pack(fill=tk.X, padx=8, pady=(0, 6))
+        ttk.Label(row_backend, text="Движок:").pack(side=tk.LEFT)
+        self.var_convert_backend = tk.StringVar(value="tgradish")
+        ttk.Combobox(
+            row_backend,
+            textvariable=self.var_convert_backend,
+            values=("tgradish", "ffmpeg"),
+            state="readonly",
+            width=12,
+        ).pack(side=tk.LEFT, padx=8)
+        self.var_target_size = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row_backend, text="Целевой размер, КБ:", variable=self.var_target_size).pack(side=tk.LEFT, padx=(16, 0))
+        self.var_target_kb = tk.IntVar(value=256)
+        ttk.Spinbox(row_backend, from_=16, to=4096, increment=16, textvariable=self.var_target_kb, width=6).pack(side=tk.LEFT, padx=8)
+        self.var_segments = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row_backend, text="Параллельно по сегментам", variable=self.var_segments).pack(side=tk.LEFT, padx=(16, 0))
+        row_trim = ttk.Frame(adv)
+        row_trim.pack(fill=tk.X, padx=8, pady=(0, 6))
+        ttk.Label(row_trim, text="Отрезок: начало, с:").pack(side=tk.LEFT)
+        self.var_trim_start = tk.DoubleVar(value=0.0)
+        ttk.Spinbox(row_trim, from_=0.0, to=86400.0, increment=1.0, textvariable=self.var_trim_start, width=8).pack(side=tk.LEFT, padx=8)
+        ttk.Label(row_trim, text="длительность, с (0 — до конца):").pack(side=tk.LEFT)
+        self.var_trim_duration = tk.DoubleVar(value=0.0)
+        ttk.Spinbox(row_trim, from_=0.0, to=86400.0, increment=0.5, textvariable=self.var_trim_duration, width=6).pack(side=tk.LEFT, padx=8)
+        row_outputs = ttk.Frame(adv)
+        row_outputs.pack(fill=tk.X, padx=8, pady=(0, 6))
+        ttk.Label(row_outputs, text="За то же декодирование:").pack(side=tk.LEFT)
+        self.var_output_emoji = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row_outputs, text="эмодзи 100x100", variable=self.var_output_emoji).pack(side=tk.LEFT, padx=(8, 0))
+        self.var_output_preview = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row_outputs, text="превью 256", variable=self.var_output_preview).pack(side=tk.LEFT, padx=(8, 0))
+        self.var_fast_path = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            row_outputs, text="Готовые стикеры копировать без перекодирования", variable=self.var_fast_path
+        ).pack(side=tk.LEFT, padx=(16, 0))
+
+        row_spoof = ttk.Frame(adv)
+        row_spoof.pack(fill=tk.X, padx=8, pady=(0, 6))
+        self.var_convert_spoof = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            row_spoof, text="Сразу подменить длительность, с:", variable=self.var_convert_spoof
+        ).pack(side=tk.LEFT)
+        self.var_convert_spoof_duration = tk.DoubleVar(value=DEFAULT_DURATION_S)
+        ttk.Spinbox(
+            row_spoof, from_=0.1, to=3.0, increment=0.1, textvariable=self.var_convert_spoof_duration, width=6
+        ).pack(side=tk.LEFT, padx=8)
 
         # Actions
         row4 = ttk.Frame(tab)
@@ -311,7 +347,7 @@ class TgradishGUI:
         section.pack(fill=tk.X, padx=10, pady=(12, 6))
         row1 = ttk.Frame(section)
         row1.pack(fill=tk.X, padx=8, pady=(8, 6))
-        ttk.Label(row1, text="Входной .webm стикер:").pack(side=tk.LEFT)
+        ttk.Label(row1, text="Входные .webm стикеры:").pack(side=tk.LEFT)
         self.var_spoof_input = tk.StringVar()
         ent_in = ttk.Entry(row1, textvariable=self.var_spoof_input)
         ent_in.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=8)
@@ -320,7 +356,7 @@ class TgradishGUI:
         # Output file
         row2 = ttk.Frame(section)
         row2.pack(fill=tk.X, padx=8, pady=6)
-        ttk.Label(row2, text="Выходной .webm:").pack(side=tk.LEFT)
+        ttk.Label(row2, text="Выходной .webm или папка:").pack(side=tk.LEFT)
         self.var_spoof_output = tk.StringVar()
         ent_out = ttk.Entry(row2, textvariable=self.var_spoof_output)
         ent_out.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=8)
@@ -335,6 +371,20 @@ class TgradishGUI:
         self.var_spoof_extra = tk.StringVar()
         ent_args = ttk.Entry(row3, textvariable=self.var_spoof_extra)
         ent_args.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=8)
+        row_engine = ttk.Frame(adv)
+        row_engine.pack(fill=tk.X, padx=8, pady=(0, 6))
+        ttk.Label(row_engine, text="Движок:").pack(side=tk.LEFT)
+        self.var_spoof_engine = tk.StringVar(value="встроенный")
+        ttk.Combobox(
+            row_engine,
+            textvariable=self.var_spoof_engine,
+            values=("встроенный", "tgradish"),
+            state="readonly",
+            width=12,
+        ).pack(side=tk.LEFT, padx=8)
+        ttk.Label(row_engine, text="Длительность, с (встроенный):").pack(side=tk.LEFT, padx=(16, 0))
+        self.var_spoof_duration = tk.DoubleVar(value=DEFAULT_DURATION_S)
+        ttk.Spinbox(row_engine, from_=0.1, to=3.0, increment=0.1, textvariable=self.var_spoof_duration, width=6).pack(side=tk.LEFT, padx=8)
 
         # Actions
         row4 = ttk.Frame(tab)
@@ -346,14 +396,88 @@ class TgradishGUI:
         self.btn_open_spoof_dir = ttk.Button(row4, text="Открыть папку результата", command=self._open_spoof_dir)
         self.btn_open_spoof_dir.pack(side=tk.LEFT, padx=(8, 0))
 
+    def _build_pack_tab(self):
+        tab = ttk.Frame(self.notebook)
+        self.notebook.add(tab, text="Pack")
+
+        section = ttk.LabelFrame(tab, text="Пакет стикеров")
+        section.pack(fill=tk.X, padx=10, pady=(12, 6))
+        row1 = ttk.Frame(section)
+        row1.pack(fill=tk.X, padx=8, pady=(8, 6))
+        ttk.Label(row1, text="Папка с исходниками:").pack(side=tk.LEFT)
+        self.var_pack_source = tk.StringVar()
+        ttk.Entry(row1, textvariable=self.var_pack_source).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=8)
+        ttk.Button(row1, text="Обзор...", command=lambda: self._browse_folder(self.var_pack_source)).pack(side=tk.LEFT)
+        row2 = ttk.Frame(section)
+        row2.pack(fill=tk.X, padx=8, pady=6)
+        ttk.Label(row2, text="Папка пакета:").pack(side=tk.LEFT)
+        self.var_pack_output = tk.StringVar()
+        ttk.Entry(row2, textvariable=self.var_pack_output).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=8)
+        ttk.Button(row2, text="Обзор...", command=lambda: self._browse_folder(self.var_pack_output)).pack(side=tk.LEFT)
+
+        adv = ttk.LabelFrame(tab, text="Дополнительные параметры")
+        adv.pack(fill=tk.X, padx=10, pady=6)
+        row3 = ttk.Frame(adv)
+        row3.pack(fill=tk.X, padx=8, pady=6)
+        ttk.Label(row3, text="Доп. аргументы (опционально):").pack(side=tk.LEFT)
+        self.var_pack_extra = tk.StringVar()
+        ttk.Entry(row3, textvariable=self.var_pack_extra).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=8)
+        row_backend = ttk.Frame(adv)
+        row_backend.pack(fill=tk.X, padx=8, pady=(0, 6))
+        ttk.Label(row_backend, text="Движок:").pack(side=tk.LEFT)
+        self.var_pack_backend = tk.StringVar(value="tgradish")
+        ttk.Combobox(
+            row_backend,
+            textvariable=self.var_pack_backend,
+            values=("tgradish", "ffmpeg"),
+            state="readonly",
+            width=12,
+        ).pack(side=tk.LEFT, padx=8)
+        self.var_pack_target_size = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row_backend, text="Целевой размер, КБ:", variable=self.var_pack_target_size).pack(side=tk.LEFT, padx=(16, 0))
+        self.var_pack_target_kb = tk.IntVar(value=256)
+        ttk.Spinbox(row_backend, from_=16, to=4096, increment=16, textvariable=self.var_pack_target_kb, width=6).pack(side=tk.LEFT, padx=8)
+        self.var_pack_force = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row_backend, text="Пересобрать всё", variable=self.var_pack_force).pack(side=tk.LEFT, padx=(16, 0))
+
+        row4 = ttk.Frame(tab)
+        row4.pack(fill=tk.X, padx=10, pady=(6, 6))
+        self.btn_pack = ttk.Button(row4, text="Собрать", command=self._on_pack)
+        self.btn_pack.pack(side=tk.LEFT)
+        ttk.Button(row4, text="Открыть папку пакета", command=self._open_pack_dir).pack(side=tk.LEFT, padx=(8, 0))
+        self.lbl_pack_summary = ttk.Label(tab, text="")
+        self.lbl_pack_summary.pack(anchor="w", padx=10, pady=(0, 12))
+
+    def _build_log_tab(self):
+        self.log_tab = ttk.Frame(self.notebook)
+        self.notebook.add(self.log_tab, text="Журнал")
+        header = ttk.Frame(self.log_tab)
+        header.pack(fill=tk.X, padx=10, pady=(8, 4))
+        self.lbl_log_job = ttk.Label(header, text="Выберите задачу в очереди")
+        self.lbl_log_job.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.btn_open_log = ttk.Button(header, text="Открыть полный журнал", command=self._open_saved_log, state=tk.DISABLED)
+        self.btn_open_log.pack(side=tk.LEFT)
+        body = ttk.Frame(self.log_tab)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        self.log_text = tk.Text(body, height=10, wrap=tk.NONE, state=tk.DISABLED, font=("Consolas", 9), undo=False)
+        log_scroll = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.log_text.yview)
+        self.log_text.configure(yscrollcommand=log_scroll.set)
+        self.log_text.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
+        log_scroll.pack(fill=tk.Y, side=tk.LEFT)
+
     # ----------------------------- UI Handlers ----------------------------- #
+    def _browse_folder(self, var: tk.StringVar):
+        path = filedialog.askdirectory(title="Выберите папку")
+        if path:
+            var.set(path)
+
     def _browse_convert_input(self):
-        path = filedialog.askopenfilename(title="Выберите видеофайл", filetypes=[
+        paths = filedialog.askopenfilenames(title="Выберите видеофайлы", filetypes=[
             ("Видео", "*.mp4 *.mov *.mkv *.webm *.avi *.m4v"),
             ("Все файлы", "*.*"),
         ])
-        if path:
-            self.var_convert_input.set(path)
+        if paths:
+            self.var_convert_input.set(_join_input_paths(list(paths)))
 
     def _browse_convert_output(self):
         path = filedialog.asksaveasfilename(title="Сохранить как", defaultextension=".webm", filetypes=[
@@ -364,12 +488,12 @@ class TgradishGUI:
             self.var_convert_output.set(path)
 
     def _browse_spoof_input(self):
-        path = filedialog.askopenfilename(title="Выберите .webm стикер", filetypes=[
+        paths = filedialog.askopenfilenames(title="Выберите .webm стикеры", filetypes=[
             ("WebM", "*.webm"),
             ("Все файлы", "*.*"),
         ])
-        if path:
-            self.var_spoof_input.set(path)
+        if paths:
+            self.var_spoof_input.set(_join_input_paths(list(paths)))
 
     def _browse_spoof_output(self):
         path = filedialog.asksaveasfilename(title="Сохранить как", defaultextension=".webm", filetypes=[
@@ -381,7 +505,8 @@ class TgradishGUI:
 
     def _open_convert_dir(self):
         out = self.var_convert_output.get().strip()
-        folder = os.path.dirname(out) if out else os.path.dirname(self.var_convert_input.get().strip())
+        inputs = _split_input_paths(self.var_convert_input.get())
+        folder = _output_folder(out) if out else (os.path.dirname(inputs[0]) if inputs else "")
         if folder and os.path.isdir(folder):
             self._open_in_explorer(folder)
         else:
@@ -389,12 +514,20 @@ class TgradishGUI:
 
     def _open_spoof_dir(self):
         out = self.var_spoof_output.get().strip()
-        folder = os.path.dirname(out) if out else os.path.dirname(self.var_spoof_input.get().strip())
+        inputs = _split_input_paths(self.var_spoof_input.get())
+        folder = _output_folder(out) if out else (os.path.dirname(inputs[0]) if inputs else "")
         if folder and os.path.isdir(folder):
             self._open_in_explorer(folder)
         else:
             messagebox.showinfo("Открыть папку", "Сначала укажите файл ввода или вывода.")
 
+    def _open_pack_dir(self):
+        folder = self.var_pack_output.get().strip()
+        if folder and os.path.isdir(folder):
+            self._open_in_explorer(folder)
+        else:
+            messagebox.showinfo("Открыть папку", "Сначала укажите папку пакета.")
+
     def _open_in_explorer(self, path: str):
         try:
             if sys.platform.startswith("win"):
@@ -407,160 +540,549 @@ class TgradishGUI:
             messagebox.showerror("Ошибка", f"Не удалось открыть папку: {e}")
 
     def _on_convert(self):
-        if not DependencyChecker.is_tgradish_available():
+        self._batch += 1
+        backend = self.var_convert_backend.get()
+        target_kb = None
+        segmented = self.var_segments.get()
+        if segmented and self.var_target_size.get():
+            messagebox.showinfo("Параметры", "Целевой размер и сегментное кодирование нельзя включить одновременно.")
+            return
+        extra_outputs = [
+            name for name, var in (("emoji", self.var_output_emoji), ("preview", self.var_output_preview)) if var.get()
+        ]
+        if extra_outputs and (segmented or self.var_target_size.get()):
+            messagebox.showinfo("Параметры", "Дополнительные результаты нельзя сочетать с целевым размером и сегментами.")
+            return
+        if segmented or extra_outputs:
+            # Сегменты и граф с split собираются ffmpeg напрямую
+            backend = "ffmpeg"
+        try:
+            trim_start = max(0.0, float(self.var_trim_start.get()))
+            trim_duration = max(0.0, float(self.var_trim_duration.get())) or None
+        except (tk.TclError, ValueError):
+            messagebox.showerror("Параметры", "Некорректные границы отрезка.")
+            return
+        if trim_start or trim_duration:
+            # Поиск до -i выполняет только прямой движок ffmpeg
+            backend = "ffmpeg"
+        if self.var_target_size.get():
+            # Подбор размера управляет ffmpeg напрямую
+            backend = "ffmpeg"
+            try:
+                target_kb = int(self.var_target_kb.get())
+            except (tk.TclError, ValueError):
+                messagebox.showerror("Параметры", "Некорректный целевой размер.")
+                return
+        if backend == "tgradish" and not DependencyChecker.is_tgradish_available():
             messagebox.showwarning("tgradish недоступен", "В этой сборке tgradish отсутствует. Попробуйте другую сборку или установите tgradish в систему.")
             return
         if not DependencyChecker.is_ffmpeg_available():
+            if backend == "ffmpeg":
+                messagebox.showerror("ffmpeg не найден", "Для движка ffmpeg требуется ffmpeg в PATH.")
+                return
             if not messagebox.askyesno("ffmpeg не найден", "Для convert требуется ffmpeg. Продолжить попытку без него?"):
                 return
-        input_path = self.var_convert_input.get().strip()
-        if not input_path:
+        elif backend == "ffmpeg":
+            extra_filters: tuple[str, ...] = ()
+            if extra_outputs:
+                from multi_output import GRAPH_FILTERS as extra_filters
+            missing = DependencyChecker.missing_ffmpeg_features(extra_filters)
+            if missing:
+                messagebox.showerror("ffmpeg не подходит", f"В найденном ffmpeg нет: {', '.join(missing)}.")
+                return
+        step = None
+        if self.var_convert_spoof.get():
+            try:
+                # Подмена длительности в той же задаче: один файл результата и одна полоса прогресса
+                step = SpoofStep(float(self.var_convert_spoof_duration.get()))
+            except (tk.TclError, ValueError):
+                messagebox.showerror("Параметры", "Некорректная длительность.")
+                return
+        inputs = _split_input_paths(self.var_convert_input.get())
+        if not inputs:
             messagebox.showinfo("Параметры", "Укажите входной видеофайл.")
             return
-        if not os.path.isfile(input_path):
-            messagebox.showerror("Файл не найден", f"Не найден файл: {input_path}")
+        missing = [p for p in inputs if not os.path.isfile(p)]
+        if missing:
+            messagebox.showerror("Файл не найден", f"Не найден файл: {missing[0]}")
             return
         output_path = self.var_convert_output.get().strip()
+        if len(inputs) > 1 and output_path and not os.path.isdir(output_path):
+            messagebox.showinfo("Параметры", "Для нескольких файлов укажите папку вывода.")
+            return
         extra = self.var_convert_extra.get().strip()
+        try:
+            extra_parts = shlex.split(extra, posix=(os.name != "nt")) if extra else []
+        except ValueError as e:
+            messagebox.showerror("Аргументы", f"Ошибка разбора доп. аргументов: {e}")
+            return
 
-        base_args: list[str] = ["convert", "-i", input_path]
-        if output_path:
-            base_args += ["-o", output_path]
-        if extra:
-            try:
-                parts = shlex.split(extra, posix=(os.name != "nt"))
-            except ValueError as e:
-                messagebox.showerror("Аргументы", f"Ошибка разбора доп. аргументов: {e}")
-                return
-            base_args += parts
-
-        self._run_tgradish_args(base_args, operation="convert")
+        for input_path in inputs:
+            if target_kb is not None:
+                from size_target import plan_size_target
+
+                task, target = plan_size_target(
+                    input_path, output_path, target_kb * 1024, extra_parts, trim_start, trim_duration
+                )
+                self._run_tgradish_args(
+                    task.describe(),
+                    operation="convert",
+                    input_path=input_path,
+                    output_path=target,
+                    backend="task",
+                    task=task,
+                    then=step,
+                )
+                continue
+            if extra_outputs:
+                from multi_output import plan_multi_output
+
+                task, target = plan_multi_output(
+                    input_path, output_path, ["sticker", *extra_outputs], extra_parts, trim_start, trim_duration
+                )
+                self._run_tgradish_args(
+                    task.describe(),
+                    operation="convert",
+                    input_path=input_path,
+                    output_path=target,
+                    backend="task",
+                    task=task,
+                    then=step,
+                )
+                continue
+            if segmented:
+                from segment_encode import plan_segment_encode
+
+                task, target = plan_segment_encode(input_path, output_path, 0, extra_parts, trim_start, trim_duration)
+                self._run_tgradish_args(
+                    task.describe(),
+                    operation="convert",
+                    input_path=input_path,
+                    output_path=target,
+                    backend="task",
+                    task=task,
+                    then=step,
+                )
+                continue
+            base_args, target = plan_convert(
+                input_path, output_path, extra_parts, backend=backend, start_s=trim_start, duration_s=trim_duration
+            )
+            plain = self.var_fast_path.get() and not (extra_parts or trim_start or trim_duration)
+            self._run_tgradish_args(
+                base_args,
+                operation="convert",
+                input_path=input_path,
+                output_path=target,
+                backend=backend,
+                fast_path=plain,
+                then=step,
+            )
 
     def _on_spoof(self):
-        if not DependencyChecker.is_tgradish_available():
+        self._batch += 1
+        native = self.var_spoof_engine.get() != "tgradish"
+        if not native and not DependencyChecker.is_tgradish_available():
             messagebox.showwarning("tgradish недоступен", "В этой сборке tgradish отсутствует. Попробуйте другую сборку или установите tgradish в систему.")
             return
-        input_path = self.var_spoof_input.get().strip()
+        inputs = _split_input_paths(self.var_spoof_input.get())
         output_path = self.var_spoof_output.get().strip()
-        if not input_path or not output_path:
+        if not inputs or (len(inputs) == 1 and not output_path):
             messagebox.showinfo("Параметры", "Укажите входной и выходной файл .webm.")
             return
-        if not os.path.isfile(input_path):
-            messagebox.showerror("Файл не найден", f"Не найден файл: {input_path}")
+        missing = [p for p in inputs if not os.path.isfile(p)]
+        if missing:
+            messagebox.showerror("Файл не найден", f"Не найден файл: {missing[0]}")
+            return
+        if len(inputs) > 1 and output_path and not os.path.isdir(output_path):
+            messagebox.showinfo("Параметры", "Для нескольких файлов укажите папку вывода.")
             return
         extra = self.var_spoof_extra.get().strip()
+        if native:
+            if extra:
+                messagebox.showinfo("Аргументы", "Доп. аргументы поддерживаются только движком tgradish.")
+                return
+            try:
+                duration = float(self.var_spoof_duration.get())
+            except (tk.TclError, ValueError):
+                messagebox.showerror("Параметры", "Некорректная длительность.")
+                return
+            for input_path in inputs:
+                target = resolve_output_path(input_path, output_path, "_spoof.webm")
+                task = SpoofTask(input_path, target, duration)
+                self._run_tgradish_args(
+                    task.describe(), operation="spoof", input_path=input_path, output_path=target, backend="task", task=task
+                )
+            return
+        try:
+            extra_parts = shlex.split(extra, posix=(os.name != "nt")) if extra else []
+        except ValueError as e:
+            messagebox.showerror("Аргументы", f"Ошибка разбора доп. аргументов: {e}")
+            return
 
-        base_args: list[str] = ["spoof", input_path, output_path]
-        if extra:
+        for input_path in inputs:
+            target = resolve_output_path(input_path, output_path, "_spoof.webm")
+            base_args = build_spoof_args(input_path, target, extra_parts)
+            self._run_tgradish_args(base_args, operation="spoof", input_path=input_path, output_path=target)
+
+    def _on_pack(self):
+        if self._pack_build is not None:
+            messagebox.showinfo("Пакет", "Сборка пакета уже выполняется.")
+            return
+        source_dir = self.var_pack_source.get().strip()
+        output_dir = self.var_pack_output.get().strip()
+        if not source_dir or not os.path.isdir(source_dir):
+            messagebox.showinfo("Параметры", "Укажите папку с исходниками.")
+            return
+        if not output_dir:
+            messagebox.showinfo("Параметры", "Укажите папку пакета.")
+            return
+        backend = self.var_pack_backend.get()
+        target_kb = None
+        if self.var_pack_target_size.get():
+            backend = "ffmpeg"
             try:
-                parts = shlex.split(extra, posix=(os.name != "nt"))
-            except ValueError as e:
-                messagebox.showerror("Аргументы", f"Ошибка разбора доп. аргументов: {e}")
+                target_kb = int(self.var_pack_target_kb.get())
+            except (tk.TclError, ValueError):
+                messagebox.showerror("Параметры", "Некорректный целевой размер.")
                 return
-            base_args += parts
+        if backend == "tgradish" and not DependencyChecker.is_tgradish_available():
+            messagebox.showwarning("tgradish недоступен", "В этой сборке tgradish отсутствует. Попробуйте другую сборку или установите tgradish в систему.")
+            return
+        if backend == "ffmpeg" and not DependencyChecker.is_ffmpeg_available():
+            messagebox.showerror("ffmpeg не найден", "Для движка ffmpeg требуется ffmpeg в PATH.")
+            return
+        extra = self.var_pack_extra.get().strip()
+        try:
+            extra_parts = shlex.split(extra, posix=(os.name != "nt")) if extra else []
+        except ValueError as e:
+            messagebox.showerror("Аргументы", f"Ошибка разбора доп. аргументов: {e}")
+            return
+
+        from pack_builder import PackBuild
 
-        self._run_tgradish_args(base_args, operation="spoof")
+        build = PackBuild(source_dir, output_dir, backend, extra_parts, target_kb, force=self.var_pack_force.get())
+        self._pack_build = build
+        self._batch += 1
+        submit = functools.partial(self.job_queue.submit, group=f"batch-{self._batch}")
+        self.btn_pack.configure(state=tk.DISABLED)
+        self.lbl_pack_summary.configure(text="Сверка исходников с манифестом...")
+        self._prepare_submit()
+
+        def worker():
+            # Хэширование исходников может занять время — не в UI-потоке
+            try:
+                plan = build.plan()
+                self._bridge.post(
+                    self._show_pack_result,
+                    f"Исходников: {plan['sources']}, к сборке: {plan['to_build']}, "
+                    f"без изменений: {plan['reused']}, удалено: {plan['removed']}"
+                )
+                report = build.submit(submit)
+            except Exception as e:
+                report = {"error": str(e)}
+            if report is not None:
+                self._bridge.post(self._show_pack_result, report)
+
+        engine_loop().run_blocking(worker)
+
+    def _show_pack_result(self, result: dict | str):
+        if isinstance(result, str):
+            self.lbl_pack_summary.configure(text=result)
+            return
+        self._pack_build = None
+        self.btn_pack.configure(state=tk.NORMAL)
+        if "error" in result:
+            self.lbl_pack_summary.configure(text=f"Ошибка сборки пакета: {result['error']}")
+            return
+        text = (
+            f"Стикеров: {result['stickers']}, пересобрано: {result['rebuilt']} "
+            f"(из кэша: {result['from_cache']}, без перекодирования: {result['encodes_avoided']}), "
+            f"без изменений: {result['reused']}, удалено: {result['removed']}, "
+            f"размер: {result['total_bytes'] / 1024:.0f} КБ, {result['elapsed_s']:.1f} с"
+        )
+        if result["failed"]:
+            text += f"\nОшибки: {', '.join(result['failed'])}"
+        self.lbl_pack_summary.configure(text=text)
+
+    def _on_queue_select(self):
+        selection = self.queue_view.selection()
+        if not selection:
+            return
+        job = next((j for j in self.job_queue.jobs if str(j.id) == selection[-1]), None)
+        if job is not None and job is not self._log_job:
+            self._show_log_for(job)
+
+    def _show_log_for(self, job: Job):
+        self._log_job = job
+        self._log_seq = 0
+        self.log_text.configure(state=tk.NORMAL)
+        self.log_text.delete("1.0", tk.END)
+        self.log_text.configure(state=tk.DISABLED)
+        self._render_log()
+
+    def _render_log(self):
+        """Append lines added since the last render; only while the log tab is visible."""
+        job = self._log_job
+        if job is None or self.notebook.select() != str(self.log_tab):
+            return
+        name = os.path.basename(job.input_path) or " ".join(job.args)
+        self.lbl_log_job.configure(text=f"Задача {job.id}: {name}" + (f" — {job.log.saved_path}" if job.log.saved_path else ""))
+        self.btn_open_log.configure(state=tk.NORMAL if job.log.saved_path else tk.DISABLED)
+        first, lines = job.log.since(self._log_seq)
+        if not lines:
+            return
+        at_bottom = self.log_text.yview()[1] >= 0.999
+        self.log_text.configure(state=tk.NORMAL)
+        if first > self._log_seq:
+            # Отстали больше, чем на размер буфера: показанное уже вытеснено
+            self.log_text.delete("1.0", tk.END)
+        # Одна вставка на пачку строк, а виджет держит не больше строк, чем буфер задачи
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - job.log.max_lines
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        self.log_text.configure(state=tk.DISABLED)
+        self._log_seq = first + len(lines)
+        if at_bottom:
+            self.log_text.see(tk.END)
+
+    def _open_saved_log(self):
+        if self._log_job is not None and self._log_job.log.saved_path:
+            self._open_in_explorer(self._log_job.log.saved_path)
 
     def _on_stop(self):
-        self.process_runner.terminate()
+        self.job_queue.cancel_all()
+
+    def _on_cancel_selected(self):
+        for item in self.queue_view.selection():
+            try:
+                self.job_queue.cancel(int(item))
+            except ValueError:
+                pass
+
+    def _on_clear_finished(self):
+        self.job_queue.clear_finished()
+        known = {str(j.id) for j in self.job_queue.jobs}
+        for item in self.queue_view.get_children():
+            if item not in known:
+                self.queue_view.delete(item)
+        self._refresh_overall_progress()
+
+    def _on_workers_changed(self):
+        try:
+            value = int(self.var_workers.get())
+        except (tk.TclError, ValueError):
+            return
+        self.job_queue.set_max_workers(value)
+
+    def _on_schedule_changed(self):
+        label = self.var_schedule.get()
+        policy = next((p for p, text in SCHEDULE_LABELS.items() if text == label), SCHEDULE_SJF)
+        self.job_queue.set_policy(policy)
+        self._etas_at = 0.0
+
+    def _on_use_cache_changed(self):
+        self.job_queue.cache = self.conversion_cache if self.var_use_cache.get() else None
+
+    def _on_clear_cache(self):
+        size_mb = self.conversion_cache.size_bytes() / (1024 * 1024)
+        if not messagebox.askyesno("Очистить кэш", f"Удалить сохранённые результаты ({size_mb:.1f} МБ)?"):
+            return
+        self.conversion_cache.clear()
 
     def _install_tgradish(self):
         messagebox.showinfo("Недоступно", "Функция отключена в этой версии.")
 
-    def _run_tgradish_args(self, args: list[str], operation: str):
-        self.current_operation = operation
-        # Сброс прогресса
-        if operation == "convert":
+    def _run_tgradish_args(
+        self,
+        args: list[str],
+        operation: str,
+        input_path: str = "",
+        output_path: str = "",
+        backend: str = "tgradish",
+        task=None,
+        fast_path: bool = False,
+        then=None,
+    ):
+        if backend == "tgradish" and not DependencyChecker.is_tgradish_available():
+            messagebox.showerror("tgradish", "tgradish недоступен ни как CLI, ни как модуль.")
+            return
+        self._prepare_submit()
+        self.job_queue.submit(
+            operation,
+            args,
+            input_path=input_path,
+            output_path=output_path,
+            backend=backend,
+            task=task,
+            fast_path=fast_path,
+            then=then,
+            group=f"batch-{self._batch}",
+        )
+
+    def _prepare_submit(self):
+        if not self._metadata_index_opened:
+            self._metadata_index_opened = True
+            self.job_queue.metadata_index = _open_metadata_index()
+            self.duration_model.load_history(default_log_path())
+        if self.job_queue.active_count() == 0:
             self._reset_progress(determinate=True)
             self._set_status("Подготовка...")
-        else:
-            self._reset_progress(determinate=False)
-            self._set_status("Выполняется...")
-        # Выбор режима: CLI -> внешний процесс; модуль -> встроенный
-        if DependencyChecker.has_tgradish_cli():
-            cmd = [*DependencyChecker.tgradish_command(), *args]
-            self._start_process(cmd, show_notice=True, inprocess=False)
-        elif DependencyChecker.has_tgradish_module():
-            self._start_process(args, show_notice=True, inprocess=True)
-        else:
-            messagebox.showerror("tgradish", "tgradish недоступен ни как CLI, ни как модуль.")
 
-    def _start_process(self, cmd: list[str], show_notice: bool = True, inprocess: bool = False):
+    # --------------------------- Progress handling ------------------------- #
+    def _on_job_progress_threadsafe(self, job: Job, event: ProgressEvent):
+        self._bridge.post(self._mark_dirty, job)
+
+    def _on_job_update_threadsafe(self, job: Job):
+        self._bridge.post(self._mark_dirty, job)
+        build = self._pack_build
+        if build is not None and job.is_finished:
+            report = build.job_finished(job)
+            if report is not None:
+                self._bridge.post(self._show_pack_result, report)
+
+    def _mark_dirty(self, job: Job):
+        self._dirty_jobs[job.id] = job
+
+    def open_files_threadsafe(self, files: list[str]):
+        """Queue files passed on the command line (possibly of another launch) for conversion."""
+        self._bridge.post(self._open_files, files)
+
+    def _open_files(self, files: list[str]):
+        # Повторный запуск без файлов просто показывает окно
+        self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
+        files = [p for p in files if os.path.isfile(p)]
+        if not files:
+            return
+        self.notebook.select(0)
+        self.var_convert_input.set(";".join(files))
+        # Файлы встают в общую очередь с текущими настройками вкладки Convert
+        self._on_convert()
+
+    def _ui_tick(self):
+        """Run calls posted by engine threads and redraw each changed job once."""
+        self._bridge.drain(self.UI_TICK_MAX_EVENTS)
+        dirty, self._dirty_jobs = self._dirty_jobs, {}
+        if dirty and not self.queue_view.selection():
+            # Без выбора журнал следует за последней запущенной задачей
+            latest = max((j for j in dirty.values() if j.status != Job.QUEUED), key=lambda j: j.id, default=None)
+            if latest is not None and (self._log_job is None or latest.id > self._log_job.id):
+                self._show_log_for(latest)
+        self._render_log()
+        if time.monotonic() - self._etas_at >= self.ETA_REFRESH_S:
+            # Прогноз меняется и без событий: идёт время, освобождаются исполнители
+            had_etas = bool(self._etas)
+            self._etas, self._eta_total = self.job_queue.estimate()
+            self._etas_at = time.monotonic()
+            if self._etas or had_etas:
+                for job in self.job_queue.jobs:
+                    if not job.is_finished:
+                        dirty.setdefault(job.id, job)
+        if dirty:
+            for job in dirty.values():
+                self._update_job_row(job)
+            self._refresh_overall_progress()
+            if self._startup_job_pending and any(j.last_event is not None or j.is_finished for j in dirty.values()):
+                self._startup_job_pending = False
+                self._write_startup_event("job")
+                self.job_queue.cancel_all()
+                self.root.after(0, self.root.destroy)
+        self.root.after(self.UI_TICK_MS, self._ui_tick)
+
+    # ------------------------------ Startup probe -------------------------- #
+    def _write_startup_event(self, event: str):
         try:
-            self.btn_convert.configure(state=tk.DISABLED)
-            self.btn_convert_stop.configure(state=(tk.DISABLED if inprocess else tk.NORMAL))
-            self.btn_spoof.configure(state=tk.DISABLED)
-            self.btn_spoof_stop.configure(state=(tk.DISABLED if inprocess else tk.NORMAL))
-        except Exception:
+            with open(self._startup_report, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"event": event, "t": time.time()}) + "\n")
+        except OSError:
             pass
 
-        if show_notice:
-            self._set_status("Запуск...")
-        try:
-            if inprocess:
-                self.inproc_runner.run(cmd)
-            else:
-                self.process_runner.run(cmd, cwd=None)
-        except RuntimeError as e:
-            messagebox.showinfo("Процесс уже запущен", str(e))
-        except Exception as e:
-            messagebox.showerror("Ошибка запуска", str(e))
-
-    # --------------------------- Progress handling ------------------------- #
-    def _on_process_output_line_threadsafe(self, text: str):
-        self.root.after(0, lambda t=text: self._process_output_line(t))
-
-    def _process_output_line(self, text: str):
-        # Определяем общую длительность
-        if self.current_operation == "convert":
-            if self.total_duration_s is None:
-                m = re.search(r"Duration:\s*(\d+):(\d+):(\d+\.?\d*)", text)
-                if m:
-                    h, mnt, s = m.groups()
-                    try:
-                        total = int(h) * 3600 + int(mnt) * 60 + float(s)
-                        if total > 0:
-                            self.total_duration_s = total
-                            # Переключаемся на определённый прогресс
-                            self._reset_progress(determinate=True)
-                            self._set_status("Конвертация...")
-                    except Exception:
-                        pass
-            # Обновляем текущий прогресс по time=
-            mt = re.search(r"time=(\d+):(\d+):(\d+\.?\d*)", text)
-            if mt and self.total_duration_s:
-                h, mnt, s = mt.groups()
-                try:
-                    cur = int(h) * 3600 + int(mnt) * 60 + float(s)
-                    pct = max(0, min(100, int(cur / self.total_duration_s * 100)))
-                    self._set_progress(pct)
-                except Exception:
-                    pass
+    def _on_startup_window_shown(self):
+        """Record the first idle moment after the window is drawn, then start the probe job."""
+        self._write_startup_event("window")
+        job_input = os.environ.get(STARTUP_JOB_ENV, "")
+        if not job_input:
+            self.root.after(0, self.root.destroy)
+            return
+        # Задача считается запущенной при первом событии прогресса (или завершении)
+        self._startup_job_pending = True
+        backend = os.environ.get(STARTUP_BACKEND_ENV, "") or self.var_convert_backend.get()
+        args, target = plan_convert(job_input, "", [], backend=backend)
+        self._run_tgradish_args(args, operation="convert", input_path=job_input, output_path=target, backend=backend)
+
+    def _update_job_row(self, job: Job):
+        status_text = {
+            Job.QUEUED: "В очереди",
+            Job.RUNNING: "Выполняется",
+            Job.DONE: "Из кэша" if job.cached else "Готово",
+            Job.FAILED: "Ошибка",
+            Job.CANCELLED: "Отменено",
+        }.get(job.status, job.status)
+        if job.status == Job.RUNNING and job.operation == "spoof":
+            progress_text = "..."
         else:
-            # Для spoof оставляем индикатор неопределённым
-            pass
-
-    def _on_process_finished_threadsafe(self, exit_code: int):
-        def _finish():
-            try:
-                self.btn_convert.configure(state=tk.NORMAL)
-                self.btn_convert_stop.configure(state=tk.DISABLED)
-                self.btn_spoof.configure(state=tk.NORMAL)
-                self.btn_spoof_stop.configure(state=tk.DISABLED)
-            except Exception:
-                pass
-            self._update_dependency_labels()
-            self._stop_indeterminate()
-            if exit_code == 0:
-                self._set_progress(100)
-                self._set_status("Готово")
-            else:
-                self._set_status(f"Ошибка (код {exit_code})")
+            progress_text = f"{job.progress}%"
+        fps = job.last_event.fps if job.last_event and job.status == Job.RUNNING else None
+        values = (
+            os.path.basename(job.input_path) or " ".join(job.args),
+            f"{job.operation}+spoof" if job.then is not None else job.operation,
+            status_text,
+            progress_text,
+            "" if fps is None else f"{fps:.1f}",
+            self._eta_text(job),
+            "" if job.exit_code is None else str(job.exit_code),
+        )
+        item = str(job.id)
+        if self.queue_view.exists(item):
+            self.queue_view.item(item, values=values)
+        else:
+            self.queue_view.insert("", tk.END, iid=item, values=values)
+
+    def _eta_text(self, job: Job) -> str:
+        if job.is_finished:
+            return ""
+        if job.status == Job.RUNNING and job.eta_s is not None:
+            return _format_eta(job.eta_s)
+        # До первых кадров и для задач в очереди — прогноз по метаданным и прошлым замерам
+        return _format_eta(self._etas.get(job.id), approximate=True)
+
+    def _refresh_overall_progress(self):
+        jobs = [j for j in self.job_queue.jobs if j.status != Job.CANCELLED or j.exit_code is not None]
+        if not jobs:
+            self._set_progress(0)
+            self._set_status("Готов")
+            self._set_stop_buttons(False)
+            return
+        running = sum(1 for j in jobs if j.status == Job.RUNNING)
+        queued = sum(1 for j in jobs if j.status == Job.QUEUED)
+        done = sum(1 for j in jobs if j.status == Job.DONE)
+        failed = [j for j in jobs if j.status == Job.FAILED]
+        avoided = sum(1 for j in jobs if j.status == Job.DONE and "fast_path" in j.stats)
+        self._set_stop_buttons(running + queued > 0)
+        self._set_progress(sum(j.progress for j in jobs) / len(jobs))
+        if running + queued > 0:
+            total = f", осталось {_format_eta(self._eta_total, approximate=True)}" if self._eta_total else ""
+            self._set_status(f"Выполняется: {running}, в очереди: {queued}, готово: {done}, ошибок: {len(failed)}{total}")
+        elif len(jobs) == 1 and failed:
+            self._set_status(f"Ошибка (код {failed[0].exit_code})")
+        elif failed:
+            self._set_status(f"Готово: {done}, ошибок: {len(failed)}")
+        elif avoided:
+            self._set_status(f"Готово: {done}, без перекодирования: {avoided}")
+        else:
+            self._set_status("Готово")
 
-        self.root.after(0, _finish)
+    def _set_stop_buttons(self, active: bool):
+        try:
+            state = tk.NORMAL if active else tk.DISABLED
+            self.btn_convert_stop.configure(state=state)
+            self.btn_spoof_stop.configure(state=state)
+        except Exception:
+            pass
 
     def _reset_progress(self, determinate: bool):
-        self.total_duration_s = None
         self.is_indeterminate = not determinate
         if determinate:
             try:
@@ -602,11 +1124,35 @@ class TgradishGUI:
 
 
 def main():
+    if getattr(sys, "frozen", False):
+        # Процессы пула tgradish запускаются через spawn; в собранном exe это обязательно
+        import multiprocessing
+
+        multiprocessing.freeze_support()
+    if "--headless" in sys.argv[1:]:
+        from tgradish_cli import main as headless_main
+
+        argv = [a for a in sys.argv[1:] if a != "--headless"]
+        sys.exit(headless_main(argv))
+    files = [os.path.abspath(a) for a in sys.argv[1:] if not a.startswith("--")]
+    # Замер холодного старта должен каждый раз запускать новое окно
+    single = NEW_INSTANCE_FLAG not in sys.argv[1:] and not os.environ.get(STARTUP_REPORT_ENV)
+    server = None
+    if single:
+        # Блокировку берём до Tk: из двух одновременных запусков окно откроет только один
+        server = InstanceServer(_instance_info_path())
+        if not server.start():
+            server = None
+            if forward(_instance_info_path(), files, wait_s=FORWARD_WAIT_S):
+                # Файлы переданы уже открытому окну: без инициализации Tk и второго кодировщика
+                sys.exit(0)
     # Make embedded ffmpeg (if bundled) discoverable by PATH early
     try:
-        _inject_embedded_ffmpeg_into_path()
+        inject_embedded_ffmpeg_into_path()
     except Exception:
         pass
+    # Возможности ffmpeg выясняются в фоне, пока строится окно, чтобы первый запуск не ждал
+    threading.Thread(target=tool_registry().ffmpeg, daemon=True).start()
     root = tk.Tk()
     # Use ttk theme if available
     try:
@@ -634,61 +1180,19 @@ def main():
         style.configure("Horizontal.TProgressbar", background=accent, troughcolor=panel, bordercolor=panel, lightcolor=accent, darkcolor=accent)
     except Exception:
         pass
-    TgradishGUI(root)
-    root.mainloop()
+    app = TgradishGUI(root)
+    if files:
+        app.open_files_threadsafe(files)
+    if server is not None:
+        # Файлы, пришедшие от других запусков, пока строилось окно, добавятся сейчас
+        server.set_handler(app.open_files_threadsafe)
+    try:
+        root.mainloop()
+    finally:
+        if server is not None:
+            server.close()
+        app.job_queue.shutdown()
 
 
 if __name__ == "__main__":
     main()
-
-# ---------------------- Embedded ffmpeg PATH bootstrap ---------------------- #
-def _inject_embedded_ffmpeg_into_path():
-    """If ffmpeg is shipped alongside the app (PyInstaller), add it to PATH.
-
-    Search locations:
-    - In a frozen app: inside sys._MEIPASS under 'ffmpeg' or 'ffmpeg_bin'
-    - Next to the executable/script: './ffmpeg' or './ffmpeg_bin'
-    """
-    if shutil.which("ffmpeg"):
-        return
-
-    candidates: list[str] = []
-
-    # When frozen by PyInstaller
-    meipass = getattr(sys, "_MEIPASS", None)
-    if meipass and isinstance(meipass, str):
-        candidates.extend([
-            os.path.join(meipass, "ffmpeg"),
-            os.path.join(meipass, "ffmpeg_bin"),
-            meipass,
-        ])
-
-    # Directory of the executable/script
-    base_dir = os.path.dirname(sys.executable if getattr(sys, "frozen", False) else os.path.abspath(__file__))
-    candidates.extend([
-        os.path.join(base_dir, "ffmpeg"),
-        os.path.join(base_dir, "ffmpeg_bin"),
-        base_dir,
-    ])
-
-    ffmpeg_names = ["ffmpeg.exe", "ffmpeg"]
-    selected_dir = None
-    for d in candidates:
-        try:
-            if not d or not os.path.isdir(d):
-                continue
-            for name in ffmpeg_names:
-                fp = os.path.join(d, name)
-                if os.path.isfile(fp):
-                    selected_dir = d
-                    break
-            if selected_dir:
-                break
-        except Exception:
-            continue
-
-    if selected_dir and selected_dir not in os.environ.get("PATH", ""):
-        os.environ["PATH"] = selected_dir + os.pathsep + os.environ.get("PATH", "")
-
-
-
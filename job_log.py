@@ -0,0 +1,234 @@
+"""Bounded per-job output logs.
+
+Every line a job prints goes into a :class:`LogRing` that keeps only the
+last ``max_lines`` lines, so a 100k-line ffmpeg log costs the same memory as
+a short one. Lines are numbered with a running sequence so a viewer can ask
+for "everything after line N" and append in batches. :class:`JobLog` also
+spools the complete output to a file, which is kept only if the job fails.
+
+:class:`LineAssembler` turns arbitrary output chunks into lines without
+re-scanning what was already buffered, and :class:`ThrottledLog` redraws a
+text view from a ring at most a few times per second, however fast lines
+arrive.
+
+The module only uses the standard library so it can also be shipped with
+the Android build.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+DEFAULT_MAX_LINES = 2000
+# Строка без перевода строки длиннее этого отдаётся частями, чтобы буфер не рос без предела
+MAX_LINE_CHARS = 64 * 1024
+# Сохранённых журналов упавших задач в каталоге, старые удаляются
+MAX_SAVED_LOGS = 50
+
+
+class LineAssembler:
+    """Split a stream of text chunks into lines.
+
+    Chunks without a newline are kept as a list and joined once, when their
+    line ends, so each character is copied a constant number of times.
+    """
+
+    def __init__(self, max_line_chars: int = MAX_LINE_CHARS):
+        self.max_line_chars = max_line_chars
+        self._parts: list[str] = []
+        self._size = 0
+
+    def feed(self, text: str) -> list[str]:
+        """Add ``text``; return the lines it completed (without ``\\n``)."""
+        if "\n" not in text:
+            self._parts.append(text)
+            self._size += len(text)
+            if self._size < self.max_line_chars:
+                return []
+            return [self.flush()]
+        head, *lines, tail = text.split("\n")
+        if self._parts:
+            self._parts.append(head)
+            head = "".join(self._parts)
+        self._parts = [tail] if tail else []
+        self._size = len(tail)
+        return [head, *lines]
+
+    def flush(self) -> str:
+        """Return and clear the unterminated rest."""
+        rest = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        return rest
+
+
+class LogRing:
+    """Thread-safe ring buffer of the last ``max_lines`` lines."""
+
+    def __init__(self, max_lines: int = DEFAULT_MAX_LINES):
+        self.max_lines = max(1, int(max_lines))
+        self._lines: deque[str] = deque(maxlen=self.max_lines)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total(self) -> int:
+        """Number of lines ever appended (sequence number of the next line)."""
+        return self._total
+
+    def append(self, line: str):
+        with self._lock:
+            self._lines.append(line)
+            self._total += 1
+
+    def since(self, seq: int = 0) -> tuple[int, list[str]]:
+        """Return ``(first_seq, lines)`` for retained lines numbered ``>= seq``.
+
+        ``first_seq > seq`` means older lines were already overwritten.
+        """
+        with self._lock:
+            first = self._total - len(self._lines)
+            start = max(seq, first)
+            skip = start - first
+            if skip >= len(self._lines):
+                return self._total, []
+            lines = list(self._lines)[skip:] if skip else list(self._lines)
+            return start, lines
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+
+
+class JobLog(LogRing):
+    """Ring buffer plus an optional on-disk spool of the full output.
+
+    With ``spool_dir`` set, every line is also written to a temporary file
+    there; :meth:`keep` turns it into a named log, :meth:`discard` deletes it.
+    """
+
+    def __init__(self, max_lines: int = DEFAULT_MAX_LINES, spool_dir: str | None = None, name: str = "job"):
+        super().__init__(max_lines)
+        self.spool_dir = spool_dir
+        self.name = name
+        self.saved_path: str | None = None
+        self._assembler = LineAssembler()
+        self._spool = None
+        self._spool_path = ""
+        self._spool_failed = False
+        self._spool_closed = False
+        self._write_lock = threading.Lock()
+
+    def write(self, text: str):
+        """Append process output; ``text`` may hold several or partial lines."""
+        if not text:
+            return
+        with self._write_lock:
+            self._write_spool(text)
+            for line in self._assembler.feed(text.replace("\r\n", "\n").replace("\r", "\n")):
+                self.append(line)
+
+    def _write_spool(self, text: str):
+        if self.spool_dir is None or self._spool_failed or self._spool_closed:
+            return
+        try:
+            if self._spool is None:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                fd, self._spool_path = tempfile.mkstemp(prefix=f".{self.name}.", suffix=".part", dir=self.spool_dir)
+                self._spool = open(fd, "w", encoding="utf-8", errors="replace")
+            self._spool.write(text)
+        except OSError:
+            # Журнал на диске — вспомогательный; задача не должна падать из-за него
+            self._spool_failed = True
+
+    def _close_spool(self):
+        with self._write_lock:
+            # Строки после завершения (например, путь к журналу) попадают только в память
+            self._spool_closed = True
+            rest = self._assembler.flush()
+            if rest:
+                self.append(rest)
+            if self._spool is not None:
+                try:
+                    self._spool.close()
+                except OSError:
+                    pass
+                self._spool = None
+
+    def keep(self) -> str | None:
+        """Save the full log as ``<spool_dir>/<time>-<name>.log``; returns its path."""
+        self._close_spool()
+        if self.spool_dir is None:
+            return None
+        path = os.path.join(self.spool_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}.log")
+        try:
+            if self._spool_path and os.path.exists(self._spool_path):
+                os.replace(self._spool_path, path)
+            else:
+                # Спул не удалось вести — сохраняем хотя бы хвост из памяти
+                os.makedirs(self.spool_dir, exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.writelines(line + "\n" for line in self.since(0)[1])
+        except OSError:
+            return None
+        self.saved_path = path
+        prune_logs(self.spool_dir)
+        return path
+
+    def discard(self):
+        self._close_spool()
+        if self._spool_path:
+            try:
+                os.remove(self._spool_path)
+            except OSError:
+                pass
+
+
+class ThrottledLog:
+    """Bounded log feeding a text view with batched redraws.
+
+    ``render(text)`` receives the retained lines joined by newlines;
+    ``schedule(callback, delay_s)`` must call ``callback()`` later on the UI
+    thread (for Kivy: ``Clock.schedule_once``, which passes ``dt``). Lines
+    can be written from any thread; at most one redraw is pending at a time.
+    """
+
+    def __init__(self, render, schedule, max_lines: int = 200, interval_s: float = 0.2):
+        self.ring = LogRing(max_lines)
+        self.interval_s = interval_s
+        self._render = render
+        self._schedule = schedule
+        self._assembler = LineAssembler()
+        self._lock = threading.Lock()
+        self._pending = False
+
+    def write(self, text: str):
+        with self._lock:
+            lines = self._assembler.feed(text)
+            for line in lines:
+                self.ring.append(line)
+            if not lines or self._pending:
+                return
+            self._pending = True
+        self._schedule(self._flush, self.interval_s)
+
+    def _flush(self, *_):
+        with self._lock:
+            self._pending = False
+        self._render("\n".join(self.ring.since(0)[1]))
+
+
+def prune_logs(log_dir: str, keep: int = MAX_SAVED_LOGS):
+    """Delete all but the ``keep`` newest ``.log`` files in ``log_dir``."""
+    try:
+        logs = [e for e in os.scandir(log_dir) if e.is_file() and e.name.endswith(".log")]
+    except OSError:
+        return
+    logs.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in logs[keep:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
@@ -0,0 +1,136 @@
+"""Per-job resource metrics export.
+
+:class:`MetricsRecorder` receives every finished :class:`tgradish_jobs.Job`
+(see ``JobQueue(metrics=...)``), appends a JSON line with its wall/CPU
+time, peak RSS, average fps and byte counts to a log, and optionally
+rewrites a Prometheus textfile-collector file with running totals, so a
+node exporter can scrape conversion throughput.
+"""
+
+import json
+import os
+import threading
+import time
+
+from tgradish_jobs import user_cache_dir
+
+# Лог переименовывается в .1 после этого размера, чтобы не расти бесконечно
+MAX_LOG_BYTES = 10 * 1024 * 1024
+PROM_PREFIX = "videotosticker_job"
+
+
+def default_log_path() -> str:
+    return os.path.join(user_cache_dir("metrics"), "jobs.jsonl")
+
+
+def _format_value(value: float) -> str:
+    # Без экспоненты с потерей точности: отметки времени должны оставаться точными до мс
+    if isinstance(value, float) and not value.is_integer():
+        return repr(round(value, 6))
+    return str(int(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRecorder:
+    """Append job metrics to JSONL and keep Prometheus counters up to date."""
+
+    def __init__(self, log_path: str | None = None, prom_path: str | None = None):
+        self.log_path = log_path
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        # (operation, backend) -> накопленные значения
+        self._totals: dict[tuple[str, str], dict[str, float]] = {}
+        self._jobs: dict[tuple[str, str, str], int] = {}
+        self._last: dict[tuple[str, str], dict[str, float]] = {}
+
+    def record(self, job) -> dict:
+        entry = {
+            "ts": round(time.time(), 3),
+            "id": job.id,
+            "operation": job.operation,
+            "backend": job.backend,
+            "status": job.status,
+            "exit_code": job.exit_code,
+            "cached": job.cached,
+            "input": job.input_path,
+            "output": job.output_path,
+            **job.metrics(),
+        }
+        with self._lock:
+            self._accumulate(entry)
+            if self.log_path:
+                self._append_log(entry)
+            if self.prom_path:
+                self._write_prom()
+        return entry
+
+    def _accumulate(self, entry: dict):
+        key = (entry["operation"], entry["backend"])
+        status_key = (*key, entry["status"])
+        self._jobs[status_key] = self._jobs.get(status_key, 0) + 1
+        totals = self._totals.setdefault(key, {})
+        for name in ("wall_s", "cpu_user_s", "cpu_sys_s", "frames", "input_bytes", "output_bytes"):
+            totals[name] = totals.get(name, 0) + (entry.get(name) or 0)
+        if entry["status"] == "done" and not entry["cached"]:
+            self._last[key] = {
+                "avg_fps": entry.get("avg_fps") or 0,
+                "peak_rss_bytes": (entry.get("peak_rss_mb") or 0) * 1024 * 1024,
+                "wall_s": entry.get("wall_s") or 0,
+                "ts": entry["ts"],
+            }
+
+    def _append_log(self, entry: dict):
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)  # type: ignore[arg-type]
+        try:
+            if os.path.getsize(self.log_path) > MAX_LOG_BYTES:  # type: ignore[arg-type]
+                os.replace(self.log_path, f"{self.log_path}.1")  # type: ignore[arg-type]
+        except OSError:
+            pass
+        with open(self.log_path, "a", encoding="utf-8") as f:  # type: ignore[arg-type]
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _write_prom(self):
+        lines: list[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list[tuple[dict, float]]):
+            lines.append(f"# HELP {PROM_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROM_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_escape_label(str(v))}"' for k, v in labels.items())
+                lines.append(f"{PROM_PREFIX}_{name}{{{label_text}}} {_format_value(value)}")
+
+        def by_key(source: dict, field: str) -> list[tuple[dict, float]]:
+            return [({"operation": op, "backend": be}, values.get(field, 0)) for (op, be), values in sorted(source.items())]
+
+        metric(
+            "jobs_total", "counter", "Finished jobs by status.",
+            [({"operation": op, "backend": be, "status": st}, n) for (op, be, st), n in sorted(self._jobs.items())],
+        )
+        metric("wall_seconds_total", "counter", "Wall-clock time spent in jobs.", by_key(self._totals, "wall_s"))
+        metric(
+            "cpu_seconds_total", "counter", "User and system CPU time of job processes.",
+            [({**labels, "mode": "user"}, v) for labels, v in by_key(self._totals, "cpu_user_s")]
+            + [({**labels, "mode": "system"}, v) for labels, v in by_key(self._totals, "cpu_sys_s")],
+        )
+        metric("frames_total", "counter", "Encoded frames.", by_key(self._totals, "frames"))
+        metric("input_bytes_total", "counter", "Bytes read from job inputs.", by_key(self._totals, "input_bytes"))
+        metric("output_bytes_total", "counter", "Bytes written to job outputs.", by_key(self._totals, "output_bytes"))
+        metric("last_avg_fps", "gauge", "Average encode fps of the last successful job.", by_key(self._last, "avg_fps"))
+        metric(
+            "last_peak_rss_bytes", "gauge", "Peak resident memory of the last successful job.",
+            by_key(self._last, "peak_rss_bytes"),
+        )
+        metric(
+            "last_success_timestamp_seconds", "gauge", "Completion time of the last successful job.",
+            by_key(self._last, "ts"),
+        )
+
+        # textfile collector читает файл целиком: пишем во временный и атомарно подменяем
+        os.makedirs(os.path.dirname(os.path.abspath(self.prom_path)), exist_ok=True)  # type: ignore[arg-type]
+        tmp = f"{self.prom_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.prom_path)  # type: ignore[arg-type]
@@ -0,0 +1,209 @@
+"""ffprobe metadata probe with a persistent index.
+
+:func:`probe_media` runs ffprobe once per file and returns a
+:class:`MediaInfo`. :class:`MetadataIndex` stores results in a small SQLite
+database keyed by path + size + mtime, so repeat runs over the same library
+skip the probe entirely.
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+
+from tgradish_jobs import tool_registry, user_cache_dir
+
+
+def _parse_rate(value: str | None) -> float | None:
+    """Parse an ffprobe frame rate such as ``30000/1001``."""
+    if not value or value in ("0/0", "N/A"):
+        return None
+    try:
+        if "/" in value:
+            num, den = value.split("/", 1)
+            return float(num) / float(den) if float(den) else None
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _parse_number(value) -> float | None:
+    if value in (None, "", "N/A"):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MediaInfo:
+    """Facts about an input file needed to plan and track an encode."""
+
+    FIELDS = (
+        "duration_s",
+        "width",
+        "height",
+        "fps",
+        "frames",
+        "video_codec",
+        "pix_fmt",
+        "has_audio",
+        "format_name",
+        "bit_rate",
+        "size_bytes",
+    )
+
+    def __init__(self, **values):
+        self.duration_s: float | None = None
+        self.width: int | None = None
+        self.height: int | None = None
+        self.fps: float | None = None
+        self.frames: int | None = None
+        self.video_codec: str | None = None
+        self.pix_fmt: str | None = None
+        self.has_audio = False
+        self.format_name: str | None = None
+        self.bit_rate: int | None = None
+        self.size_bytes: int | None = None
+        for key, value in values.items():
+            if key in MediaInfo.FIELDS:
+                setattr(self, key, value)
+
+    @property
+    def pixels(self) -> int:
+        return (self.width or 0) * (self.height or 0)
+
+    @property
+    def estimated_frames(self) -> int | None:
+        if self.frames:
+            return self.frames
+        if self.duration_s and self.fps:
+            return int(self.duration_s * self.fps)
+        return None
+
+    def estimated_memory_mb(self, default: int) -> int:
+        """Rough peak memory of a decode + VP9 encode for a source of this size."""
+        if not self.pixels:
+            return default
+        # Базовые затраты процесса + буферы декодера/фильтров пропорционально площади кадра
+        return int(120 + self.pixels * 60 / (1024 * 1024))
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in MediaInfo.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MediaInfo":
+        return cls(**data)
+
+    @classmethod
+    def from_ffprobe(cls, data: dict, size_bytes: int | None = None) -> "MediaInfo":
+        fmt = data.get("format") or {}
+        streams = data.get("streams") or []
+        video = next((st for st in streams if st.get("codec_type") == "video"), None) or {}
+        info = cls(
+            format_name=fmt.get("format_name"),
+            has_audio=any(st.get("codec_type") == "audio" for st in streams),
+            size_bytes=size_bytes,
+        )
+        duration = _parse_number(video.get("duration")) or _parse_number(fmt.get("duration"))
+        info.duration_s = duration
+        bit_rate = _parse_number(fmt.get("bit_rate"))
+        info.bit_rate = int(bit_rate) if bit_rate is not None else None
+        if video:
+            info.video_codec = video.get("codec_name")
+            info.pix_fmt = video.get("pix_fmt")
+            info.width = video.get("width")
+            info.height = video.get("height")
+            info.fps = _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate"))
+            frames = _parse_number(video.get("nb_frames"))
+            info.frames = int(frames) if frames else None
+            # В WebM альфа-канал VP9 указывается тегом, а pix_fmt остаётся yuv420p
+            tags = video.get("tags") or {}
+            if str(tags.get("alpha_mode", tags.get("ALPHA_MODE", ""))) == "1" and info.pix_fmt == "yuv420p":
+                info.pix_fmt = "yuva420p"
+        return info
+
+
+def probe_media(path: str, ffprobe: str | None = None, timeout: float = 30.0) -> MediaInfo | None:
+    """Run ffprobe on ``path``. Returns None if ffprobe is missing or fails."""
+    exe = ffprobe or tool_registry().which("ffprobe")
+    if not exe:
+        return None
+    cmd = [exe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0 or not result.stdout:
+        return None
+    try:
+        data = json.loads(result.stdout)
+    except ValueError:
+        return None
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = None
+    return MediaInfo.from_ffprobe(data, size_bytes=size)
+
+
+class MetadataIndex:
+    """SQLite-backed cache of :class:`MediaInfo` keyed by path, size and mtime."""
+
+    def __init__(self, db_path: str | None = None):
+        self.db_path = db_path or os.path.join(user_cache_dir("probe"), "media.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS media ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, info TEXT NOT NULL)"
+            )
+
+    @staticmethod
+    def _stat_key(path: str) -> tuple[str, int, int] | None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+    def get(self, path: str) -> MediaInfo | None:
+        key = self._stat_key(path)
+        if key is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT info FROM media WHERE path = ? AND size = ? AND mtime_ns = ?", key
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return MediaInfo.from_dict(json.loads(row[0]))
+        except (ValueError, TypeError):
+            return None
+
+    def put(self, path: str, info: MediaInfo):
+        key = self._stat_key(path)
+        if key is None:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media (path, size, mtime_ns, info) VALUES (?, ?, ?, ?)",
+                (*key, json.dumps(info.to_dict())),
+            )
+
+    def probe(self, path: str) -> MediaInfo | None:
+        """Return indexed metadata for ``path``, probing it on a miss."""
+        info = self.get(path)
+        if info is not None:
+            return info
+        info = probe_media(path)
+        if info is not None:
+            self.put(path, info)
+        return info
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
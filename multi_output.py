@@ -0,0 +1,213 @@
+"""Single-decode rendering of several assets from one source.
+
+A video sticker, a custom emoji and a preview all come from the same clip.
+Converting them one by one decodes the source three times; here ffmpeg
+decodes it once, fans the frames out through a ``split`` filter and encodes
+every output in the same process. Progress is reported for the job as a
+whole (all branches advance together) and per output as its file grows.
+"""
+
+import os
+import threading
+import time
+
+from ffmpeg_backend import (
+    STICKER_MAX_BYTES,
+    STICKER_MAX_DURATION_S,
+    ProgressParser,
+    build_multi_output_command,
+    seek_options,
+    split_seek_options,
+    sticker_filter,
+    sticker_length,
+)
+from media_probe import probe_media
+from tgradish_jobs import default_convert_output, fast_decode_for, vp9_encoder_args
+
+PROGRESS_INTERVAL_S = 0.5
+# Фильтры графа сверх обязательных для обычного convert
+GRAPH_FILTERS = ("fps", "split", "pad")
+# Лимит Telegram для кастомных эмодзи
+EMOJI_MAX_BYTES = 64 * 1024
+
+
+class OutputPreset:
+    """Frame size, padding and quality of one kind of output."""
+
+    def __init__(
+        self, name: str, title: str, suffix: str, size: int, crf: int, pad: bool = False, max_bytes: int | None = None
+    ):
+        self.name = name
+        self.title = title
+        self.suffix = suffix
+        self.size = size
+        self.crf = crf
+        self.pad = pad
+        self.max_bytes = max_bytes
+
+    def video_filter(self) -> str:
+        vf = sticker_filter(self.size)
+        if self.pad:
+            # Эмодзи должны быть ровно 100x100: дополняем прозрачными полями
+            vf += f",pad={self.size}:{self.size}:(ow-iw)/2:(oh-ih)/2:color=black@0"
+        return vf
+
+
+PRESETS = {
+    "sticker": OutputPreset("sticker", "стикер", ".webm", 512, 32, max_bytes=STICKER_MAX_BYTES),
+    "emoji": OutputPreset("emoji", "эмодзи", "_emoji.webm", 100, 36, pad=True, max_bytes=EMOJI_MAX_BYTES),
+    "preview": OutputPreset("preview", "превью", "_preview.webm", 256, 40),
+}
+DEFAULT_OUTPUTS = ("sticker", "emoji", "preview")
+
+
+def parse_output_names(text: str) -> list[str]:
+    """Parse a comma-separated list of preset names (ValueError on unknown ones)."""
+    names = [n.strip() for n in text.split(",") if n.strip()]
+    unknown = [n for n in names if n not in PRESETS]
+    if unknown:
+        raise ValueError(f"Неизвестный вид результата: {', '.join(unknown)} (доступны: {', '.join(PRESETS)})")
+    if not names:
+        raise ValueError("Не указан ни один вид результата.")
+    return list(dict.fromkeys(names))
+
+
+class MultiOutputTask:
+    """Callable job task (see :class:`tgradish_jobs.CallableRunner`).
+
+    ``outputs`` maps preset names to output paths.
+    """
+
+    # В кэше конвертаций хранится один файл на задачу
+    cacheable = False
+
+    def __init__(
+        self,
+        input_path: str,
+        outputs: dict[str, str],
+        extra_parts: list[str] | tuple = (),
+        start_s: float = 0.0,
+        duration_s: float | None = None,
+        ffmpeg: str = "ffmpeg",
+    ):
+        self.input_path = input_path
+        self.outputs = dict(outputs)
+        self.extra_parts = list(extra_parts)
+        self.start_s = float(start_s)
+        self.duration_s = duration_s
+        self.ffmpeg = ffmpeg
+
+    def describe(self) -> list[str]:
+        """Descriptive argument vector (also used as the cache key input)."""
+        args = ["multi-output", "-i", self.input_path]
+        for name, path in self.outputs.items():
+            args += [f"--{name}", path]
+        if self.start_s:
+            args += ["--start", str(self.start_s)]
+        if self.duration_s:
+            args += ["--duration", str(self.duration_s)]
+        return [*args, *self.extra_parts]
+
+    def command(self, media=None) -> list[str]:
+        decode_options, _video_filter = fast_decode_for(media)
+        count = len(self.outputs)
+        outputs = [
+            (
+                path,
+                PRESETS[name].video_filter(),
+                PRESETS[name].crf,
+                vp9_encoder_args(concurrent_jobs=count, media=media, output_width=PRESETS[name].size),
+            )
+            for name, path in self.outputs.items()
+        ]
+        return [
+            self.ffmpeg,
+            *build_multi_output_command(
+                self.input_path,
+                outputs,
+                self.extra_parts,
+                input_options=[*seek_options(self.start_s, sticker_length(self.duration_s)), *decode_options],
+            ),
+        ]
+
+    def __call__(self, ctx) -> int:
+        info = getattr(ctx.job, "media", None) or probe_media(self.input_path)
+        length = info.duration_s if info else None
+        if length:
+            length = max(0.0, length - self.start_s)
+        if self.duration_s:
+            length = min(length, self.duration_s) if length else self.duration_s
+        if not length or length > STICKER_MAX_DURATION_S:
+            if length:
+                ctx.emit(f"Стикер не длиннее {STICKER_MAX_DURATION_S:g} с: кодируются только {STICKER_MAX_DURATION_S:g} с.")
+            length = STICKER_MAX_DURATION_S
+        if ctx.job is not None and length:
+            ctx.job.parser.duration_s = length
+        for path in self.outputs.values():
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        parser = ProgressParser(duration_s=length)
+        lock = threading.Lock()
+        last_report = [0.0]
+
+        def report(out_s: float | None, force: bool = False):
+            now = time.monotonic()
+            with lock:
+                if not force and now - last_report[0] < PROGRESS_INTERVAL_S:
+                    return
+                last_report[0] = now
+            percent = f"{min(100.0, out_s / length * 100):.0f}%" if out_s is not None and length else "—"
+            parts = []
+            for name, path in self.outputs.items():
+                size = os.path.getsize(path) if os.path.isfile(path) else 0
+                parts.append(f"{PRESETS[name].title} {percent}, {size / 1024:.0f} КБ")
+            ctx.emit("; ".join(parts))
+
+        def on_line(line: str):
+            event = parser.feed(line)
+            if event is not None:
+                report(event.out_time_s)
+
+        ctx.emit(f"Одно декодирование, результаты: {', '.join(PRESETS[n].title for n in self.outputs)}")
+        code = ctx.run(self.command(info), on_line=on_line)
+        if code != 0:
+            return code
+        report(length, force=True)
+        stats = {
+            name: {"path": path, "bytes": os.path.getsize(path) if os.path.isfile(path) else None}
+            for name, path in self.outputs.items()
+        }
+        if ctx.job is not None:
+            ctx.job.stats["outputs"] = stats
+        for name, item in stats.items():
+            limit = PRESETS[name].max_bytes
+            if limit and item["bytes"] and item["bytes"] > limit:
+                ctx.emit(
+                    f"Внимание: {PRESETS[name].title} {item['bytes'] / 1024:.0f} КБ — "
+                    f"больше лимита Telegram {limit // 1024} КБ"
+                )
+        return 0
+
+
+def plan_multi_output(
+    input_path: str,
+    output: str = "",
+    names: list[str] | tuple = DEFAULT_OUTPUTS,
+    extra_parts: list[str] | tuple = (),
+    start_s: float = 0.0,
+    duration_s: float | None = None,
+) -> tuple[MultiOutputTask, str]:
+    """Return ``(task, primary_output_path)`` for a multi-output convert job.
+
+    The sticker goes where a plain convert would put it; other outputs are
+    named after it with their preset suffix. ``-ss``/``-t``/``-to`` in
+    ``extra_parts`` are treated like ``start_s``/``duration_s``.
+    """
+    sticker = default_convert_output(input_path, output)
+    stem = os.path.splitext(sticker)[0]
+    outputs = {name: sticker if name == "sticker" else stem + PRESETS[name].suffix for name in names}
+    seek_start, seek_length, extra_parts = split_seek_options(extra_parts)
+    task = MultiOutputTask(
+        input_path, outputs, extra_parts, start_s=start_s or seek_start, duration_s=duration_s or seek_length
+    )
+    return task, next(iter(outputs.values()))
@@ -0,0 +1,337 @@
+"""Incremental sticker-pack builds.
+
+A pack is a folder of source clips converted into a folder of stickers.
+:class:`PackBuild` scans the sources, compares them with the manifest
+(``pack.json`` in the output folder) written by the previous build and
+queues a convert job only for sources whose content hash or conversion
+settings changed, or whose output went missing. Outputs of deleted sources
+are removed. Sources that would map to the same sticker (``clip.mp4`` and
+``clip.gif``) get distinct names. When the last job finishes, the manifest
+is rewritten with hashes, sizes and durations of every source and output.
+
+Примеры:
+    python tgradish_cli.py pack stickers_src/ -o stickers/ --backend ffmpeg
+    python tgradish_cli.py pack stickers_src/ -o stickers/ --target-size-kb 250 --force
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conversion_cache import tool_versions
+from media_probe import probe_media
+from tgradish_jobs import VIDEO_EXTENSIONS, Job, plan_convert
+from webm_spoof import SpoofStep
+
+MANIFEST_NAME = "pack.json"
+MANIFEST_VERSION = 1
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def scan_sources(source_dir: str, exclude_dir: str = "") -> list[str]:
+    """Source clips under ``source_dir`` as sorted ``/``-separated relative paths."""
+    exclude = os.path.abspath(exclude_dir) if exclude_dir else ""
+    found: list[str] = []
+    for root, dirs, files in os.walk(source_dir):
+        # Папка результатов внутри исходников не должна сканироваться как исходники
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != exclude and not d.startswith("."))
+        for name in files:
+            if name.lower().endswith(VIDEO_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(root, name), source_dir).replace(os.sep, "/"))
+    return sorted(found)
+
+
+def load_manifest(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data
+
+
+class PackBuild:
+    """One incremental build of ``source_dir`` into ``output_dir``.
+
+    Call :meth:`plan`, then :meth:`submit` with ``JobQueue.submit`` and
+    forward finished jobs to :meth:`job_finished`; the report is returned
+    by whichever of the two completes the build, after the manifest is
+    written. Safe to call :meth:`job_finished` from worker threads.
+    """
+
+    def __init__(
+        self,
+        source_dir: str,
+        output_dir: str,
+        backend: str = "ffmpeg",
+        extra_parts: list[str] | tuple = (),
+        target_size_kb: int | None = None,
+        force: bool = False,
+        spoof_duration_s: float | None = None,
+    ):
+        self.source_dir = os.path.abspath(source_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.backend = "ffmpeg" if target_size_kb is not None else backend
+        self.extra_parts = list(extra_parts)
+        self.target_size_kb = target_size_kb
+        self.force = force
+        self.spoof_duration_s = spoof_duration_s
+        self.manifest_path = os.path.join(self.output_dir, MANIFEST_NAME)
+        self.settings = {
+            "backend": self.backend,
+            "extra": self.extra_parts,
+            "target_size_kb": target_size_kb,
+            "tools": tool_versions(),
+        }
+        if spoof_duration_s is not None:
+            # Ключ добавляется только при spoof, чтобы старые манифесты не устарели
+            self.settings["spoof_duration_s"] = spoof_duration_s
+        self.settings_digest = hashlib.sha256(json.dumps(self.settings, sort_keys=True).encode("utf-8")).hexdigest()
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._outputs: dict[str, str] = {}
+        self._stale: list[tuple[str, dict]] = []
+        self._pending: dict[int, tuple[str, dict]] = {}
+        self._submitting = False
+        # Задачи, снятые с ожидания, чьи записи манифеста ещё считаются (хэш, анализ результата)
+        self._recording = 0
+        self._removed: list[str] = []
+        self._reused = 0
+        self._rebuilt = 0
+        self._from_cache = 0
+        self._fast_path = 0
+        self._failed: list[str] = []
+        self._started = 0.0
+        self._report: dict | None = None
+
+    # ------------------------------- Planning ------------------------------ #
+    def output_for(self, rel: str) -> str:
+        """Sticker file for source ``rel``, unique within the pack once :meth:`plan` ran."""
+        return self._outputs.get(rel) or self._default_output(rel)
+
+    def _default_output(self, rel: str, with_extension: bool = False) -> str:
+        stem, extension = os.path.splitext(rel)
+        if with_extension:
+            stem += "_" + extension.lstrip(".").lower()
+        target = os.path.join(self.output_dir, *f"{stem}.webm".split("/"))
+        if os.path.abspath(target) == os.path.join(self.source_dir, *rel.split("/")):
+            target = os.path.join(self.output_dir, *f"{stem}_sticker.webm".split("/"))
+        return target
+
+    def _assign_outputs(self, sources: list[str]):
+        """Give every source its own sticker file.
+
+        Sources differing only in extension (``clip.mp4`` and ``clip.gif``)
+        get it as a suffix (``clip_mp4.webm``, ``clip_gif.webm``); a name
+        that is still taken gets a number. Sources are sorted, so the names
+        are the same from build to build.
+        """
+        groups: dict[str, list[str]] = {}
+        for rel in sources:
+            groups.setdefault(os.path.normcase(self._default_output(rel)), []).append(rel)
+        taken: set[str] = set()
+        for group in groups.values():
+            for rel in group:
+                target = candidate = self._default_output(rel, with_extension=len(group) > 1)
+                number = 2
+                while os.path.normcase(candidate) in taken:
+                    base, extension = os.path.splitext(target)
+                    candidate = f"{base}_{number}{extension}"
+                    number += 1
+                taken.add(os.path.normcase(candidate))
+                self._outputs[rel] = candidate
+
+    def _relative_output(self, rel: str) -> str:
+        return os.path.relpath(self.output_for(rel), self.output_dir).replace(os.sep, "/")
+
+    def _source_record(self, rel: str, previous: dict | None) -> dict:
+        path = os.path.join(self.source_dir, *rel.split("/"))
+        st = os.stat(path)
+        if previous and previous.get("source_bytes") == st.st_size and previous.get("source_mtime_ns") == st.st_mtime_ns:
+            # Размер и mtime не изменились — хэш из манифеста, файл не перечитывается
+            digest = previous["source_sha256"]
+        else:
+            digest = file_sha256(path)
+        return {"source_sha256": digest, "source_bytes": st.st_size, "source_mtime_ns": st.st_mtime_ns}
+
+    def _is_fresh(self, rel: str, previous: dict | None, record: dict) -> bool:
+        if self.force or not previous:
+            return False
+        if previous.get("output") != self._relative_output(rel):
+            # Имя результата сменилось: рядом появился исходник с тем же именем
+            return False
+        if previous.get("source_sha256") != record["source_sha256"] or previous.get("settings") != self.settings_digest:
+            return False
+        output = os.path.join(self.output_dir, *previous.get("output", "").split("/"))
+        try:
+            return os.path.getsize(output) == previous.get("output_bytes")
+        except OSError:
+            return False
+
+    def plan(self) -> dict:
+        """Compare sources with the manifest; returns counts of what will happen."""
+        self._started = time.monotonic()
+        previous_entries = load_manifest(self.manifest_path).get("entries", {})
+        sources = scan_sources(self.source_dir, exclude_dir=self.output_dir)
+        self._assign_outputs(sources)
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as pool:
+            records = list(pool.map(lambda rel: self._source_record(rel, previous_entries.get(rel)), sources))
+        for rel, record in zip(sources, records):
+            previous = previous_entries.get(rel)
+            if self._is_fresh(rel, previous, record):
+                self._entries[rel] = {**previous, **record}
+                self._reused += 1
+            else:
+                self._stale.append((rel, record))
+        current = set(sources)
+        planned = {os.path.normcase(target) for target in self._outputs.values()}
+        for rel, entry in previous_entries.items():
+            output = os.path.abspath(os.path.join(self.output_dir, *entry.get("output", "").split("/")))
+            # Удаляются стикеры удалённых исходников и старые имена переименованных результатов
+            if os.path.normcase(output) not in planned and output.startswith(self.output_dir + os.sep):
+                try:
+                    os.remove(output)
+                except OSError:
+                    pass
+            if rel not in current:
+                self._removed.append(rel)
+        return {"sources": len(sources), "to_build": len(self._stale), "reused": self._reused, "removed": len(self._removed)}
+
+    def _job_specs(self) -> list[dict]:
+        specs = []
+        step = SpoofStep(self.spoof_duration_s) if self.spoof_duration_s is not None else None
+        for rel, record in self._stale:
+            input_path = os.path.join(self.source_dir, *rel.split("/"))
+            target = self.output_for(rel)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if self.target_size_kb is not None:
+                from size_target import plan_size_target
+
+                task, target = plan_size_target(input_path, target, self.target_size_kb * 1024, self.extra_parts)
+                specs.append({
+                    "source": (rel, record), "args": task.describe(), "input_path": input_path,
+                    "output_path": target, "backend": "task", "task": task, "then": step,
+                })
+                continue
+            args, target = plan_convert(input_path, target, self.extra_parts, backend=self.backend)
+            specs.append({
+                "source": (rel, record), "args": args, "input_path": input_path,
+                "output_path": target, "backend": self.backend, "task": None,
+                "fast_path": not self.extra_parts, "then": step,
+            })
+        return specs
+
+    def submit(self, submit) -> dict | None:
+        """Queue a convert job per stale source through ``submit`` (``JobQueue.submit``).
+
+        Returns the report right away if nothing needed rebuilding.
+        """
+        with self._lock:
+            self._submitting = True
+        try:
+            for spec in self._job_specs():
+                source = spec.pop("source")
+                job = submit("convert", spec.pop("args"), **spec)
+                with self._lock:
+                    self._pending[job.id] = source
+                if job.is_finished:
+                    self.job_finished(job)
+        finally:
+            with self._lock:
+                self._submitting = False
+                done = not self._pending and not self._recording
+        return self.finish() if done else None
+
+    # ------------------------------ Completion ----------------------------- #
+    def job_finished(self, job: Job) -> dict | None:
+        """Record a finished job; returns the report after the last one."""
+        with self._lock:
+            item = self._pending.pop(job.id, None)
+            if item is None:
+                return None
+            self._recording += 1
+        source, record = item
+        try:
+            if job.status == Job.DONE and job.output_path and os.path.isfile(job.output_path):
+                media = probe_media(job.output_path)
+                entry = {
+                    **record,
+                    "output": os.path.relpath(job.output_path, self.output_dir).replace(os.sep, "/"),
+                    "output_sha256": file_sha256(job.output_path),
+                    "output_bytes": os.path.getsize(job.output_path),
+                    "duration_s": media.duration_s if media else None,
+                    "settings": self.settings_digest,
+                }
+                with self._lock:
+                    self._entries[source] = entry
+                    self._rebuilt += 1
+                    self._from_cache += 1 if job.cached else 0
+                    self._fast_path += 1 if "fast_path" in job.stats else 0
+            else:
+                with self._lock:
+                    self._failed.append(source)
+        except OSError:
+            # Результат пропал между завершением задачи и записью манифеста
+            with self._lock:
+                self._failed.append(source)
+        finally:
+            with self._lock:
+                self._recording -= 1
+                done = not self._pending and not self._submitting and not self._recording
+        return self.finish() if done else None
+
+    def finish(self) -> dict:
+        """Write the manifest and return the build report (idempotent)."""
+        with self._lock:
+            if self._report is not None:
+                return self._report
+            entries = {}
+            owners: dict[str, str] = {}
+            for rel, entry in sorted(self._entries.items()):
+                output = os.path.normcase(entry.get("output", ""))
+                if output in owners:
+                    # Два исходника с одним стикером: запись второго потеряла бы первый, пересобираем его
+                    self._failed.append(rel)
+                    continue
+                owners[output] = rel
+                entries[rel] = entry
+            manifest = {
+                "version": MANIFEST_VERSION,
+                "built_at": round(time.time(), 3),
+                "source_dir": self.source_dir,
+                "settings": self.settings,
+                "settings_digest": self.settings_digest,
+                "entries": entries,
+            }
+            os.makedirs(self.output_dir, exist_ok=True)
+            tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.manifest_path)
+            self._report = {
+                "pack": self.output_dir,
+                "manifest": self.manifest_path,
+                "stickers": len(entries),
+                "rebuilt": self._rebuilt,
+                "from_cache": self._from_cache,
+                "encodes_avoided": self._fast_path,
+                "reused": self._reused,
+                "removed": len(self._removed),
+                "failed": sorted(self._failed),
+                "total_bytes": sum(e.get("output_bytes") or 0 for e in entries.values()),
+                "elapsed_s": round(time.monotonic() - self._started, 3),
+            }
+            return self._report
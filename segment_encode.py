@@ -0,0 +1,316 @@
+"""Segment-parallel sticker encoding.
+
+A single libvpx-vp9 process does not keep many cores busy, so
+high-resolution sources are split at keyframes into time segments. Every
+segment is encoded by its own ffmpeg process; because each cut lands on a
+source keyframe, input seeking starts decoding exactly at the cut and no
+frames are decoded twice. The encoded parts are joined with the concat
+demuxer using stream copy, so the joins are not re-encoded and every part
+keeps the same sticker settings (size, fps, pixel format, codec). The
+encoded range is limited to the sticker's maximum duration, so the split
+happens within those 3 seconds.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_backend import (
+    STICKER_MAX_BYTES,
+    STICKER_MAX_DURATION_S,
+    ProgressParser,
+    build_convert_command,
+    seek_options,
+    split_seek_options,
+)
+from media_probe import probe_media
+from tgradish_jobs import default_convert_output, fast_decode_for, tool_registry, vp9_encoder_args
+
+# Короче этого сегмента накладные расходы запуска ffmpeg съедают выигрыш;
+# трёхсекундный стикер делится максимум на три части
+MIN_SEGMENT_S = 1.0
+PROGRESS_INTERVAL_S = 0.5
+
+
+def keyframe_times(
+    path: str,
+    start_s: float = 0.0,
+    duration_s: float | None = None,
+    ffprobe: str | None = None,
+    timeout: float = 120.0,
+) -> list[float]:
+    """Return sorted presentation times of video keyframes in ``path``.
+
+    Only packet headers are read (no decoding). Returns an empty list if
+    ffprobe is missing or fails.
+    """
+    exe = ffprobe or tool_registry().which("ffprobe")
+    if not exe:
+        return []
+    cmd = [exe, "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0"]
+    if start_s or duration_s:
+        interval = f"{start_s:.3f}%" + (f"+{duration_s:.3f}" if duration_s else "")
+        cmd += ["-read_intervals", interval]
+    cmd.append(path)
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    if result.returncode != 0:
+        return []
+    times: set[float] = set()
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) < 2 or "K" not in parts[1]:
+            continue
+        try:
+            times.add(float(parts[0]))
+        except ValueError:
+            continue
+    return sorted(times)
+
+
+def plan_segments(
+    keyframes: list[float],
+    start_s: float,
+    end_s: float,
+    count: int,
+    min_segment_s: float = MIN_SEGMENT_S,
+) -> list[tuple[float, float]]:
+    """Split ``[start_s, end_s)`` into at most ``count`` ``(start, length)`` segments.
+
+    Cuts are placed on the keyframes closest to equal-length boundaries;
+    segments shorter than ``min_segment_s`` are avoided.
+    """
+    total = end_s - start_s
+    count = max(1, min(count, int(total // min_segment_s) or 1))
+    inner = [k for k in keyframes if start_s + min_segment_s <= k <= end_s - min_segment_s]
+    cuts = [start_s]
+    for i in range(1, count):
+        if not inner:
+            break
+        ideal = start_s + total * i / count
+        best = min(inner, key=lambda k: abs(k - ideal))
+        if best - cuts[-1] >= min_segment_s:
+            cuts.append(best)
+    cuts.append(end_s)
+    return [(a, b - a) for a, b in zip(cuts, cuts[1:])]
+
+
+def _concat_line(path: str) -> str:
+    escaped = path.replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+
+class SegmentEncodeTask:
+    """Callable job task (see :class:`tgradish_jobs.CallableRunner`).
+
+    ``start_s``/``duration_s`` trim the input before it is split, and the
+    range is cut to :data:`ffmpeg_backend.STICKER_MAX_DURATION_S`; with
+    ``segments=0`` the number of segments follows the CPU count. ``speed``
+    overrides the tuned ``-speed`` (the benchmark pins it for both paths).
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        output_path: str,
+        segments: int = 0,
+        extra_parts: list[str] | tuple = (),
+        start_s: float = 0.0,
+        duration_s: float | None = None,
+        ffmpeg: str = "ffmpeg",
+        speed: int | None = None,
+    ):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.segments = int(segments)
+        self.extra_parts = list(extra_parts)
+        self.start_s = float(start_s)
+        self.duration_s = duration_s
+        self.ffmpeg = ffmpeg
+        self.speed = speed
+        # Заполняется при запуске по данным ffprobe
+        self._decode: tuple[list[str], str | None] = ([], None)
+
+    @property
+    def processes(self) -> int:
+        """Upper bound of concurrently running encoders."""
+        return self.segments if self.segments > 0 else (os.cpu_count() or 1)
+
+    def describe(self) -> list[str]:
+        """Descriptive argument vector (also used as the cache key input)."""
+        args = ["segment-encode", "--segments", str(self.segments), "-i", self.input_path, "-o", self.output_path]
+        if self.start_s:
+            args += ["--start", str(self.start_s)]
+        if self.duration_s:
+            args += ["--duration", str(self.duration_s)]
+        return [*args, *self.extra_parts]
+
+    def _command(self, output: str, start: float, length: float | None, progress: bool, parallel: int = 1) -> list[str]:
+        decode_options, video_filter = self._decode
+        return [
+            self.ffmpeg,
+            *build_convert_command(
+                self.input_path,
+                output,
+                self.extra_parts,
+                progress=progress,
+                input_options=[*seek_options(start, length), *decode_options],
+                video_filter=video_filter,
+                encoder_args=vp9_encoder_args(concurrent_jobs=parallel, speed=self.speed),
+            ),
+        ]
+
+    def __call__(self, ctx) -> int:
+        info = getattr(ctx.job, "media", None) or probe_media(self.input_path)
+        source_duration = info.duration_s if info else None
+        if not source_duration:
+            ctx.emit("Не удалось определить длительность входа; сегментное кодирование невозможно.")
+            return 1
+        self._decode = fast_decode_for(info)
+        start = min(self.start_s, source_duration)
+        end = source_duration if not self.duration_s else min(source_duration, start + self.duration_s)
+        if end - start > STICKER_MAX_DURATION_S:
+            end = start + STICKER_MAX_DURATION_S
+            ctx.emit(f"Стикер не длиннее {STICKER_MAX_DURATION_S:g} с: кодируется отрезок {start:.2f}–{end:.2f} с.")
+        trimmed = start > 0 or end < source_duration
+        if self.processes < 2:
+            ctx.emit("Задан один сегмент — обычное кодирование.")
+            return ctx.run(self._command(self.output_path, start, end - start if trimmed else None, True))
+        if end - start < 2 * MIN_SEGMENT_S:
+            ctx.emit("Клип слишком короткий для деления на сегменты — обычное кодирование.")
+            return ctx.run(self._command(self.output_path, start, end - start if trimmed else None, True))
+
+        keyframes = keyframe_times(self.input_path, start, end - start)
+        segments = plan_segments(keyframes, start, end, self.processes)
+        if len(segments) < 2:
+            ctx.emit("Во входе нет подходящих ключевых кадров — обычное кодирование.")
+            return ctx.run(self._command(self.output_path, start, end - start if trimmed else None, True))
+
+        out_dir = os.path.dirname(os.path.abspath(self.output_path))
+        os.makedirs(out_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".segments_", dir=out_dir)
+        try:
+            return self._run(ctx, segments, tmp_dir, open_end=end >= source_duration)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _run(self, ctx, segments: list[tuple[float, float]], tmp_dir: str, open_end: bool) -> int:
+        ctx.emit(
+            f"Сегментное кодирование по ключевым кадрам: {len(segments)} сегм. "
+            f"(начала: {', '.join(f'{s:.2f}' for s, _ in segments)} с)"
+        )
+        lock = threading.Lock()
+        done = [0.0] * len(segments)
+        frames = [0] * len(segments)
+        fps = [0.0] * len(segments)
+        last_report = [0.0]
+        t0 = time.monotonic()
+
+        def report(force: bool = False):
+            # Суммарный прогресс выдаётся строкой статистики ffmpeg, её разбирает ProgressParser задачи
+            now = time.monotonic()
+            with lock:
+                if not force and now - last_report[0] < PROGRESS_INTERVAL_S:
+                    return
+                last_report[0] = now
+                out_s = sum(done)
+                line = (
+                    f"frame={sum(frames)} fps={sum(fps):.1f} time={_clock(out_s)} "
+                    f"speed={out_s / max(now - t0, 1e-6):.2f}x"
+                )
+            ctx.emit(line)
+
+        def encode(index: int) -> int:
+            seg_start, seg_len = segments[index]
+            parser = ProgressParser(duration_s=seg_len)
+
+            def on_line(line: str):
+                event = parser.feed(line)
+                if event is None:
+                    return
+                with lock:
+                    if event.out_time_s is not None:
+                        done[index] = min(event.out_time_s, seg_len)
+                    if event.frame is not None:
+                        frames[index] = event.frame
+                    fps[index] = 0.0 if event.finished else (event.fps or fps[index])
+                report()
+
+            path = os.path.join(tmp_dir, f"seg_{index:03d}.webm")
+            # Последний сегмент без -t, если клип не обрезан: конец определяет сам вход
+            length = None if open_end and index == len(segments) - 1 else seg_len
+            return ctx.run(self._command(path, seg_start, length, True, len(segments)), stream=False, on_line=on_line)
+
+        with ThreadPoolExecutor(max_workers=len(segments)) as pool:
+            codes = list(pool.map(encode, range(len(segments))))
+        encode_wall = time.monotonic() - t0
+        if ctx.cancelled:
+            return 1
+        if any(codes):
+            ctx.emit("Кодирование сегмента завершилось с ошибкой.")
+            return next(c for c in codes if c)
+        with lock:
+            done[:] = [length for _, length in segments]
+        report(force=True)
+
+        list_path = os.path.join(tmp_dir, "segments.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for index in range(len(segments)):
+                f.write(_concat_line(f"seg_{index:03d}.webm"))
+        joined = os.path.join(tmp_dir, "joined.webm")
+        concat = [
+            self.ffmpeg, "-hide_banner", "-nostdin", "-y",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", joined,
+        ]
+        code = ctx.run(concat, stream=False)
+        if code != 0:
+            ctx.emit("Не удалось склеить сегменты.")
+            return code
+        os.replace(joined, self.output_path)
+
+        size = os.path.getsize(self.output_path)
+        stats = {
+            "segments": len(segments),
+            "encode_wall_s": round(encode_wall, 3),
+            "total_wall_s": round(time.monotonic() - t0, 3),
+            "output_bytes": size,
+        }
+        if ctx.job is not None:
+            ctx.job.stats.update(stats)
+        ctx.emit(f"Готово: {len(segments)} сегм. за {stats['total_wall_s']:.1f} с, {size / 1024:.0f} КБ")
+        if size > STICKER_MAX_BYTES:
+            ctx.emit(f"Внимание: файл больше лимита стикера ({STICKER_MAX_BYTES // 1024} КБ).")
+        return 0
+
+
+def _clock(seconds: float) -> str:
+    h, rem = divmod(max(seconds, 0.0), 3600)
+    m, s = divmod(rem, 60)
+    return f"{int(h):02d}:{int(m):02d}:{s:05.2f}"
+
+
+def plan_segment_encode(
+    input_path: str,
+    output: str = "",
+    segments: int = 0,
+    extra_parts: list[str] | tuple = (),
+    start_s: float = 0.0,
+    duration_s: float | None = None,
+) -> tuple[SegmentEncodeTask, str]:
+    """Return ``(task, output_path)`` for a segment-parallel convert job.
+
+    ``-ss``/``-t``/``-to`` in ``extra_parts`` are treated like ``start_s``/``duration_s``.
+    """
+    target = default_convert_output(input_path, output)
+    seek_start, seek_length, extra_parts = split_seek_options(extra_parts)
+    task = SegmentEncodeTask(
+        input_path, target, segments, extra_parts, start_s=start_s or seek_start, duration_s=duration_s or seek_length
+    )
+    return task, target
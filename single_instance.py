@@ -0,0 +1,198 @@
+"""Single running instance of the desktop app.
+
+The first instance takes an exclusive lock next to its info file, listens
+on a loopback TCP port and records the port with a random token in a file
+only the user can read. A later launch (e.g. "Open with VideoToSticker"
+from the file manager) finds the lock taken, connects to that port, hands
+over its file arguments and exits before initialising Tk, so the files
+join the running queue instead of starting a second, competing encoder.
+
+The lock, not the info file, decides who is first, so two launches at the
+same moment cannot both become the server. It is released by the OS when
+the process exits, even after a crash.
+
+Loopback TCP and file locks work the same on Windows, Linux and macOS
+without extra packages; the token keeps other local users from injecting
+files.
+"""
+
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+
+# Ожидание ответа запущенного экземпляра; дольше — считаем, что он завис или уже закрыт
+CONNECT_TIMEOUT_S = 1.0
+# Сколько ждать, пока экземпляр, уже взявший блокировку, опубликует свой порт
+FORWARD_WAIT_S = 3.0
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+
+def _read_info(info_path: str) -> dict | None:
+    try:
+        with open(info_path, encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return info if isinstance(info, dict) and "port" in info and "token" in info else None
+
+
+def _read_line(conn: socket.socket) -> bytes:
+    data = b""
+    while b"\n" not in data and len(data) < MAX_MESSAGE_BYTES:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data.split(b"\n", 1)[0]
+
+
+def _try_lock(path: str):
+    """Open ``path`` and lock it exclusively without waiting; None if another process holds it."""
+    try:
+        f = open(path, "a+b")
+    except OSError:
+        return None
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _send(info: dict, files: list[str]) -> bool:
+    message = json.dumps({"token": info["token"], "files": files}, ensure_ascii=False) + "\n"
+    try:
+        with socket.create_connection(("127.0.0.1", int(info["port"])), timeout=CONNECT_TIMEOUT_S) as conn:
+            conn.sendall(message.encode("utf-8"))
+            return _read_line(conn) == b"ok"
+    except (OSError, ValueError):
+        # Файл остался от упавшего экземпляра: порт закрыт или занят чужим процессом
+        return False
+
+
+def forward(info_path: str, files: list[str], wait_s: float = 0.0) -> bool:
+    """Pass ``files`` (absolute paths) to a running instance; False if there is none.
+
+    With ``wait_s`` the attempt is repeated for that long, for an instance
+    that has taken the lock but not yet published its port.
+    """
+    deadline = time.monotonic() + wait_s
+    while True:
+        info = _read_info(info_path)
+        if info is not None and _send(info, files):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+
+
+class InstanceServer:
+    """Accept file lists from later launches and pass them to ``on_files(files)``.
+
+    :meth:`start` is meant to run before the window is built; lists that
+    arrive before :meth:`set_handler` are kept and delivered then.
+    ``on_files`` is called from the listener thread.
+    """
+
+    def __init__(self, info_path: str, on_files=None):
+        self.info_path = info_path
+        self._on_files = on_files
+        self._token = secrets.token_hex(16)
+        self._sock: socket.socket | None = None
+        self._lock_file = None
+        self._handler_lock = threading.Lock()
+        self._early: list[list[str]] = []
+
+    def start(self) -> bool:
+        """Become the running instance.
+
+        False if another instance holds the lock (pass the files to it with
+        :func:`forward`) or the socket could not be opened.
+        """
+        lock_file = _try_lock(self.info_path + ".lock")
+        if lock_file is None:
+            return False
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind(("127.0.0.1", 0))
+            sock.listen(8)
+            tmp = f"{self.info_path}.{os.getpid()}.tmp"
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd, "w", encoding="utf-8") as f:
+                json.dump({"port": sock.getsockname()[1], "token": self._token, "pid": os.getpid()}, f)
+            os.replace(tmp, self.info_path)
+        except OSError:
+            sock.close()
+            lock_file.close()
+            return False
+        self._sock = sock
+        self._lock_file = lock_file
+        threading.Thread(target=self._serve, daemon=True).start()
+        return True
+
+    def set_handler(self, on_files):
+        """Set the receiver and hand it the lists that arrived before."""
+        with self._handler_lock:
+            self._on_files = on_files
+            early, self._early = self._early, []
+        for files in early:
+            on_files(files)
+
+    def close(self):
+        sock, self._sock = self._sock, None
+        if sock is None:
+            return
+        try:
+            sock.close()
+        except OSError:
+            pass
+        info = _read_info(self.info_path)
+        if info is not None and info.get("token") == self._token:
+            # Файл мог уже перезаписать другой экземпляр — удаляем только свой
+            try:
+                os.remove(self.info_path)
+            except OSError:
+                pass
+        lock_file, self._lock_file = self._lock_file, None
+        if lock_file is not None:
+            # Файл блокировки не удаляем: иначе два новых запуска могли бы заблокировать разные файлы
+            lock_file.close()
+
+    def _deliver(self, files: list[str]):
+        with self._handler_lock:
+            on_files = self._on_files
+            if on_files is None:
+                self._early.append(files)
+                return
+        on_files(files)
+
+    def _serve(self):
+        sock = self._sock
+        while sock is not None and self._sock is sock:
+            try:
+                conn, _addr = sock.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    conn.settimeout(CONNECT_TIMEOUT_S)
+                    message = json.loads(_read_line(conn).decode("utf-8"))
+                    if not secrets.compare_digest(str(message.get("token", "")), self._token):
+                        continue
+                    files = [str(p) for p in message.get("files") or []]
+                    conn.sendall(b"ok\n")
+                except (OSError, ValueError, AttributeError):
+                    continue
+            self._deliver(files)
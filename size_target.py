@@ -0,0 +1,296 @@
+"""Size-targeted encoding: pick the CRF that fits a byte budget.
+
+Instead of re-running full encodes with guessed settings, a few short
+representative segments are encoded in parallel at two CRF values. Output
+bitrate is modelled as ``log(bytes/s) = a + b * crf``, the CRF hitting the
+target size is solved from the fit and the full clip is encoded once. If
+the result still overshoots, the measured point refines the model for a
+single correction pass.
+"""
+
+import math
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_backend import (
+    STICKER_MAX_BYTES,
+    STICKER_MAX_DURATION_S,
+    build_convert_command,
+    seek_options,
+    split_seek_options,
+)
+from media_probe import probe_media
+from encoder_tuning import DEFAULT_SPEED
+from tgradish_jobs import default_convert_output, fast_decode_for, tuned_encoder_settings, vp9_encoder_args
+
+PROBE_CRFS = (28, 44)
+MIN_CRF = 4
+MAX_CRF = 63
+SAMPLE_SEGMENTS = 3
+SAMPLE_SECONDS = 1.0
+# Запас, чтобы итоговый файл не упёрся в лимит из-за погрешности модели
+SIZE_MARGIN = 0.95
+MAX_FINAL_PASSES = 2
+# Параметры «ручного» перебора, с которым сравнивается расход кодирования
+NAIVE_START_CRF = 32
+NAIVE_CRF_STEP = 4
+# Типичный наклон log(битрейта) по CRF для libvpx-vp9, если точки вырождены
+DEFAULT_SLOPE = -0.08
+
+
+class SizeModel:
+    """Least-squares fit of ``log(bytes per second)`` against CRF."""
+
+    def __init__(self, points: list[tuple[float, float]]):
+        self.points = [(c, bps) for c, bps in points if bps > 0]
+        self._fit()
+
+    def _fit(self):
+        pts = [(c, math.log(bps)) for c, bps in self.points]
+        if not pts:
+            self.a, self.b = 0.0, DEFAULT_SLOPE
+            return
+        mean_c = sum(c for c, _ in pts) / len(pts)
+        mean_y = sum(y for _, y in pts) / len(pts)
+        var = sum((c - mean_c) ** 2 for c, _ in pts)
+        slope = sum((c - mean_c) * (y - mean_y) for c, y in pts) / var if var else 0.0
+        self.b = slope if slope < 0 else DEFAULT_SLOPE
+        self.a = mean_y - self.b * mean_c
+
+    def add_point(self, crf: float, bytes_per_s: float):
+        if bytes_per_s > 0:
+            self.points.append((crf, bytes_per_s))
+            self._fit()
+
+    def predict_bps(self, crf: float) -> float:
+        return math.exp(self.a + self.b * crf)
+
+    def crf_for(self, bytes_per_s: float) -> float:
+        return (math.log(bytes_per_s) - self.a) / self.b
+
+
+def sample_windows(duration_s: float) -> list[tuple[float, float]]:
+    """Return ``(start, length)`` windows spread evenly over the clip.
+
+    Short clips are sampled whole, so a sample can double as the final result.
+    """
+    if duration_s <= SAMPLE_SEGMENTS * SAMPLE_SECONDS:
+        return [(0.0, duration_s)]
+    windows = []
+    for i in range(SAMPLE_SEGMENTS):
+        center = (i + 0.5) / SAMPLE_SEGMENTS * duration_s
+        windows.append((max(0.0, center - SAMPLE_SECONDS / 2), SAMPLE_SECONDS))
+    return windows
+
+
+def _clamp_crf(value: float) -> int:
+    return max(MIN_CRF, min(MAX_CRF, int(math.ceil(value))))
+
+
+class SizeTargetTask:
+    """Callable job task (see :class:`tgradish_jobs.CallableRunner`)."""
+
+    def __init__(
+        self,
+        input_path: str,
+        output_path: str,
+        target_bytes: int = STICKER_MAX_BYTES,
+        extra_parts: list[str] | tuple = (),
+        ffmpeg: str = "ffmpeg",
+        start_s: float = 0.0,
+        duration_s: float | None = None,
+    ):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.target_bytes = int(target_bytes)
+        self.extra_parts = list(extra_parts)
+        self.ffmpeg = ffmpeg
+        self.start_s = float(start_s)
+        self.duration_s = duration_s
+        # Заполняются при запуске по данным ffprobe
+        self._trim: tuple[float, float] | None = None
+        self._decode: tuple[list[str], str | None] = ([], None)
+
+    def describe(self) -> list[str]:
+        """Descriptive argument vector (also used as the cache key input)."""
+        args = [
+            "size-target",
+            "--target-bytes", str(self.target_bytes),
+            "-i", self.input_path,
+            "-o", self.output_path,
+        ]
+        if self.start_s:
+            args += ["--start", str(self.start_s)]
+        if self.duration_s:
+            args += ["--duration", str(self.duration_s)]
+        return [*args, *self.extra_parts]
+
+    def _command(
+        self, output: str, crf: int, progress: bool, window: tuple[float, float] | None = None, parallel: int = 1
+    ) -> list[str]:
+        offset = self._trim[0] if self._trim else 0.0
+        if window is not None:
+            input_options = seek_options(offset + window[0], window[1])
+        elif self._trim:
+            input_options = seek_options(*self._trim)
+        else:
+            input_options = []
+        decode_options, video_filter = self._decode
+        return [
+            self.ffmpeg,
+            *build_convert_command(
+                self.input_path,
+                output,
+                self.extra_parts,
+                crf=crf,
+                progress=progress,
+                input_options=[*input_options, *decode_options],
+                video_filter=video_filter,
+                # Пробы и финал кодируются с одними -speed, -row-mt и -tile-columns, иначе модель размера
+                # не совпадёт с результатом; параллельным пробам достаётся только меньше потоков
+                encoder_args=vp9_encoder_args(
+                    speed=DEFAULT_SPEED, threads=tuned_encoder_settings(parallel).threads
+                ),
+            ),
+        ]
+
+    def __call__(self, ctx) -> int:
+        info = getattr(ctx.job, "media", None) or probe_media(self.input_path)
+        source_duration = info.duration_s if info else None
+        if not source_duration:
+            ctx.emit("Не удалось определить длительность входа; подбор размера невозможен.")
+            return 1
+        start = min(self.start_s, source_duration)
+        end = source_duration if not self.duration_s else min(source_duration, start + self.duration_s)
+        if end - start > STICKER_MAX_DURATION_S:
+            end = start + STICKER_MAX_DURATION_S
+            ctx.emit(f"Стикер не длиннее {STICKER_MAX_DURATION_S:g} с: кодируется отрезок {start:.2f}–{end:.2f} с.")
+        if start > 0 or end < source_duration:
+            self._trim = (start, end - start)
+        duration = end - start
+        self._decode = fast_decode_for(info)
+        out_dir = os.path.dirname(os.path.abspath(self.output_path))
+        os.makedirs(out_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".size_target_", dir=out_dir)
+        try:
+            return self._run(ctx, duration, tmp_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _run(self, ctx, duration: float, tmp_dir: str) -> int:
+        windows = sample_windows(duration)
+        whole_clip = len(windows) == 1 and windows[0][0] == 0.0
+        samples = []
+        for crf in PROBE_CRFS:
+            for idx, window in enumerate(windows):
+                path = os.path.join(tmp_dir, f"sample_{crf}_{idx}.webm")
+                samples.append((crf, window, path))
+        commands = [
+            self._command(path, crf, False, None if whole_clip else window, len(samples))
+            for crf, window, path in samples
+        ]
+
+        ctx.emit(f"Пробное кодирование: {len(samples)} фрагм. параллельно (CRF {', '.join(map(str, PROBE_CRFS))})")
+        t0 = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(samples)) as pool:
+            codes = list(pool.map(lambda cmd: ctx.run(cmd, stream=False), commands))
+        sample_wall = time.monotonic() - t0
+        if ctx.cancelled:
+            return 1
+        if any(codes):
+            ctx.emit("Пробное кодирование завершилось с ошибкой.")
+            return 1
+
+        points = []
+        fitting_samples: list[tuple[int, str]] = []
+        for crf in PROBE_CRFS:
+            group = [s for s in samples if s[0] == crf]
+            total_bytes = sum(os.path.getsize(s[2]) for s in group)
+            total_len = sum(s[1][1] for s in group)
+            points.append((crf, total_bytes / total_len))
+            if whole_clip and total_bytes <= self.target_bytes:
+                fitting_samples.append((crf, group[0][2]))
+        model = SizeModel(points)
+        crf = _clamp_crf(model.crf_for(self.target_bytes * SIZE_MARGIN / duration))
+        ctx.emit(f"Модель: CRF {crf} → ~{model.predict_bps(crf) * duration / 1024:.0f} КБ (цель {self.target_bytes / 1024:.0f} КБ)")
+
+        sample_media_s = sum(s[1][1] for s in samples)
+        passes = 0
+        final_wall = 0.0
+        final_size = None
+        reused_crf = min((c for c, _ in fitting_samples), default=None)
+        if reused_crf is not None and reused_crf <= crf:
+            # Пробный файл целого клипа уже укладывается в лимит — повторное кодирование не нужно
+            path = dict(fitting_samples)[reused_crf]
+            os.replace(path, self.output_path)
+            crf = reused_crf
+            final_size = os.path.getsize(self.output_path)
+            ctx.emit(f"Использован пробный результат CRF {crf}")
+        else:
+            tmp_out = os.path.join(tmp_dir, "final.webm")
+            while passes < MAX_FINAL_PASSES:
+                passes += 1
+                t1 = time.monotonic()
+                code = ctx.run(self._command(tmp_out, crf, True))
+                final_wall += time.monotonic() - t1
+                if code != 0:
+                    return code
+                final_size = os.path.getsize(tmp_out)
+                if final_size <= self.target_bytes:
+                    break
+                ctx.emit(f"CRF {crf}: {final_size / 1024:.0f} КБ — больше цели, уточняю модель")
+                model.add_point(crf, final_size / duration)
+                next_crf = _clamp_crf(model.crf_for(self.target_bytes * SIZE_MARGIN / duration))
+                crf = next_crf if next_crf > crf else min(MAX_CRF, crf + 1)
+            os.replace(tmp_out, self.output_path)
+
+        naive_encodes = 1
+        naive_crf = NAIVE_START_CRF
+        while model.predict_bps(naive_crf) * duration > self.target_bytes and naive_crf < MAX_CRF:
+            naive_crf = min(MAX_CRF, naive_crf + NAIVE_CRF_STEP)
+            naive_encodes += 1
+        stats = {
+            "target_bytes": self.target_bytes,
+            "output_bytes": final_size,
+            "crf": crf,
+            "final_passes": passes,
+            "sample_encode_s": round(sample_media_s, 3),
+            "final_encode_s": round(passes * duration, 3),
+            "naive_encode_s": round(naive_encodes * duration, 3),
+            "sample_wall_s": round(sample_wall, 3),
+            "final_wall_s": round(final_wall, 3),
+        }
+        if ctx.job is not None:
+            ctx.job.stats.update(stats)
+        ctx.emit(
+            f"Закодировано {stats['sample_encode_s'] + stats['final_encode_s']:.1f} с видео "
+            f"(пробы {stats['sample_encode_s']:.1f} с + финал {stats['final_encode_s']:.1f} с); "
+            f"перебор с шагом CRF {NAIVE_CRF_STEP} потребовал бы ~{stats['naive_encode_s']:.1f} с"
+        )
+        if final_size is None or final_size > self.target_bytes:
+            ctx.emit("Не удалось уложиться в целевой размер.")
+            return 2
+        return 0
+
+
+def plan_size_target(
+    input_path: str,
+    output: str = "",
+    target_bytes: int = STICKER_MAX_BYTES,
+    extra_parts: list[str] | tuple = (),
+    start_s: float = 0.0,
+    duration_s: float | None = None,
+) -> tuple[SizeTargetTask, str]:
+    """Return ``(task, output_path)`` for a size-targeted convert job.
+
+    ``-ss``/``-t``/``-to`` in ``extra_parts`` are treated like ``start_s``/``duration_s``.
+    """
+    target = default_convert_output(input_path, output)
+    seek_start, seek_length, extra_parts = split_seek_options(extra_parts)
+    task = SizeTargetTask(
+        input_path, target, target_bytes, extra_parts, start_s=start_s or seek_start, duration_s=duration_s or seek_length
+    )
+    return task, target
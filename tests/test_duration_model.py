@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from duration_model import DEFAULT_SECONDS_PER_UNIT, OVERHEAD_S, DurationModel, work_units
+
+SETTINGS = "convert/task/SizeTargetTask"
+
+
+def entry(units: float, wall: float, settings: str = SETTINGS, **extra) -> dict:
+    # 1 мегапиксель, 30 кадр/с, длительность подобрана под нужное число единиц работы
+    width = height = 1000
+    duration = units / ((30 * width * height + 30 * 512 * 512) / 1e6)
+    return {
+        "status": "done",
+        "settings": settings,
+        "wall_s": wall,
+        "width": width,
+        "height": height,
+        "duration_s": duration,
+        "input_fps": 30,
+        **extra,
+    }
+
+
+def test_work_units_counts_decode_and_encode():
+    assert work_units(1920, 1080, 2.0, 60) == pytest.approx((2 * 60 * 1920 * 1080 + 2 * 30 * 512 * 512) / 1e6)
+    assert work_units(None, 1080, 2.0, 30) is None
+
+
+def test_defaults_before_any_measurement():
+    assert DurationModel().coefficients(SETTINGS) == (OVERHEAD_S, DEFAULT_SECONDS_PER_UNIT)
+
+
+def test_fits_overhead_and_rate():
+    model = DurationModel()
+    for units in (10, 50, 100, 200):
+        model._learn(entry(units, 0.8 + 0.02 * units))
+
+    overhead, rate = model.coefficients(SETTINGS)
+    assert overhead == pytest.approx(0.8, rel=1e-6)
+    assert rate == pytest.approx(0.02, rel=1e-6)
+
+
+def test_unseen_task_type_borrows_from_same_backend():
+    model = DurationModel()
+    for units in (10, 100):
+        model._learn(entry(units, 1.0 + 0.01 * units))
+
+    assert model.coefficients("convert/task/SegmentEncodeTask") == pytest.approx(model.coefficients(SETTINGS))
+    assert model.coefficients("spoof/task/SpoofTask") == (OVERHEAD_S, DEFAULT_SECONDS_PER_UNIT)
+
+
+def test_failed_cached_and_fast_path_jobs_are_ignored():
+    model = DurationModel()
+    model._learn(entry(10, 99.0, status="failed"))
+    model._learn(entry(10, 99.0, cached=True))
+    model._learn(entry(10, 99.0, fast_path="copy"))
+
+    assert model.coefficients(SETTINGS) == (OVERHEAD_S, DEFAULT_SECONDS_PER_UNIT)
+
+
+def test_history_skips_broken_lines(tmp_path):
+    log = tmp_path / "jobs.jsonl"
+    lines = [json.dumps(entry(10, 1.2)), "{not json", json.dumps(entry(100, 3.0)), "[]"]
+    log.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    overhead, rate = DurationModel(str(log)).coefficients(SETTINGS)
+    assert overhead == pytest.approx(1.0, rel=1e-6)
+    assert rate == pytest.approx(0.02, rel=1e-6)
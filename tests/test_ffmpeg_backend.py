@@ -0,0 +1,93 @@
+import pytest
+
+from ffmpeg_backend import (
+    STICKER_MAX_DURATION_S,
+    ProgressParser,
+    input_duration_limit,
+    seek_options,
+    split_seek_options,
+    sticker_length,
+)
+
+
+def feed_all(parser: ProgressParser, lines: list[str]):
+    return [event for event in map(parser.feed, lines) if event is not None]
+
+
+def test_progress_block_becomes_one_event():
+    parser = ProgressParser()
+    events = feed_all(
+        parser,
+        [
+            "frame=45",
+            "fps=30.00",
+            "total_size=131072",
+            "out_time_us=1500000",
+            "speed=2.5x",
+            "progress=continue",
+        ],
+    )
+
+    assert len(events) == 1
+    event = events[0]
+    assert event.out_time_s == pytest.approx(1.5)
+    assert (event.frame, event.fps, event.total_size) == (45, 30.0, 131072)
+    assert event.speed == pytest.approx(2.5)
+    assert not event.finished
+
+
+def test_progress_end_and_legacy_out_time_ms():
+    parser = ProgressParser()
+    events = feed_all(parser, ["out_time_ms=2000000", "progress=end"])
+
+    assert events[0].out_time_s == pytest.approx(2.0)
+    assert events[0].finished
+
+
+def test_negative_out_time_at_start_is_unknown():
+    parser = ProgressParser()
+    events = feed_all(parser, ["out_time_us=-9223372036854775807", "progress=continue"])
+
+    assert events[0].out_time_s is None
+
+
+def test_duration_banner_and_stats_line():
+    parser = ProgressParser()
+    events = feed_all(
+        parser,
+        [
+            "  Duration: 00:01:02.50, start: 0.000000, bitrate: 1000 kb/s",
+            "frame=  30 fps= 15 q=32.0 size=     256kB time=00:00:01.00 bitrate= 100.0kbits/s speed=0.5x",
+        ],
+    )
+
+    assert parser.duration_s == pytest.approx(62.5)
+    assert events[0].out_time_s == pytest.approx(1.0)
+    assert events[0].frame == 30
+
+
+def test_known_duration_is_not_replaced_by_banner():
+    parser = ProgressParser(duration_s=3.0)
+    parser.feed("  Duration: 00:00:10.00, start: 0.000000")
+
+    assert parser.duration_s == 3.0
+
+
+def test_split_seek_options_moves_trim_before_input():
+    start, length, rest = split_seek_options(["-ss", "00:01.5", "-crf", "30", "-to", "4"])
+
+    assert start == pytest.approx(1.5)
+    assert length == pytest.approx(2.5)
+    assert rest == ["-crf", "30"]
+    assert seek_options(start, length) == ["-ss", "1.500000", "-t", "2.500000"]
+
+
+def test_sticker_length_never_exceeds_the_limit():
+    assert sticker_length() == STICKER_MAX_DURATION_S
+    assert sticker_length(10.0) == STICKER_MAX_DURATION_S
+    assert sticker_length(1.5) == 1.5
+
+
+def test_input_duration_limit_reads_only_input_options():
+    assert input_duration_limit(["-t", "2.5", "-i", "in.mp4", "out.webm"]) == pytest.approx(2.5)
+    assert input_duration_limit(["-i", "in.mp4", "-t", "2.5", "out.webm"]) is None
@@ -0,0 +1,41 @@
+import math
+
+import pytest
+
+from size_target import DEFAULT_SLOPE, SAMPLE_SECONDS, SizeModel, sample_windows
+
+
+def test_model_recovers_exponential_rate():
+    a, b = 12.0, -0.09
+    model = SizeModel([(crf, math.exp(a + b * crf)) for crf in (28, 44)])
+
+    assert model.b == pytest.approx(b)
+    assert model.predict_bps(36) == pytest.approx(math.exp(a + b * 36))
+    assert model.crf_for(math.exp(a + b * 40)) == pytest.approx(40)
+
+
+def test_added_point_refines_fit():
+    model = SizeModel([(28, 100_000.0), (44, 20_000.0)])
+    model.add_point(36, 30_000.0)
+
+    assert len(model.points) == 3
+    assert model.predict_bps(36) < math.sqrt(100_000.0 * 20_000.0)
+
+
+def test_degenerate_points_fall_back_to_default_slope():
+    # Один CRF или битрейт, растущий с CRF, наклона не задают
+    assert SizeModel([(30, 50_000.0), (30, 60_000.0)]).b == DEFAULT_SLOPE
+    assert SizeModel([(28, 10_000.0), (44, 20_000.0)]).b == DEFAULT_SLOPE
+    assert SizeModel([(28, 0.0)]).b == DEFAULT_SLOPE
+
+
+def test_short_clip_is_sampled_whole():
+    assert sample_windows(2.0) == [(0.0, 2.0)]
+
+
+def test_long_clip_windows_are_spread_and_inside():
+    windows = sample_windows(30.0)
+
+    assert len(windows) == 3
+    assert all(length == SAMPLE_SECONDS and 0 <= start and start + length <= 30.0 for start, length in windows)
+    assert [start for start, _ in windows] == sorted(start for start, _ in windows)
@@ -0,0 +1,176 @@
+import os
+import struct
+
+import pytest
+
+from webm_spoof import (
+    CLUSTER_ID,
+    DURATION_ID,
+    EBML_ID,
+    INFO_ID,
+    SEGMENT_ID,
+    TIMECODE_SCALE_ID,
+    WebmSpoofError,
+    find_duration,
+    read_duration,
+    spoof_duration,
+)
+
+DOC_TYPE_ID = 0x4282
+VOID_ID = 0xEC
+UNKNOWN_SIZE = b"\x01\xff\xff\xff\xff\xff\xff\xff"
+
+
+def _id(value: int) -> bytes:
+    return value.to_bytes((value.bit_length() + 7) // 8, "big")
+
+
+def _size(value: int, length: int = 8) -> bytes:
+    return ((1 << (7 * length)) | value).to_bytes(length, "big")
+
+
+def element(elem_id: int, payload: bytes, size_length: int = 8) -> bytes:
+    return _id(elem_id) + _size(len(payload), size_length) + payload
+
+
+def make_webm(
+    duration: float = 2500.0,
+    float_size: int = 8,
+    timecode_scale: int | None = None,
+    unknown_segment_size: bool = False,
+    cluster_first: bool = False,
+) -> bytes:
+    """Minimal WebM: EBML header, Segment with Void, Info and one Cluster."""
+    info = b""
+    if timecode_scale is not None:
+        info += element(TIMECODE_SCALE_ID, timecode_scale.to_bytes(4, "big"), 1)
+    info += element(DURATION_ID, struct.pack(">f" if float_size == 4 else ">d", duration), 1)
+    children = [element(VOID_ID, b"\x00" * 10, 1), element(INFO_ID, info), element(CLUSTER_ID, b"\x00" * 64)]
+    if cluster_first:
+        children = [children[2], children[1]]
+    body = b"".join(children)
+    segment = _id(SEGMENT_ID) + (UNKNOWN_SIZE if unknown_segment_size else _size(len(body))) + body
+    return element(EBML_ID, element(DOC_TYPE_ID, b"webm", 1)) + segment
+
+
+def write(path, data: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def read(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def changed_bytes(before: bytes, after: bytes) -> list[int]:
+    assert len(before) == len(after)
+    return [i for i, (a, b) in enumerate(zip(before, after)) if a != b]
+
+
+def test_spoof_in_place_touches_only_the_duration_payload(tmp_path):
+    data = make_webm(duration=2500.0)
+    path = write(tmp_path / "a.webm", data)
+    offset, size, scale = find_duration(data)
+
+    assert spoof_duration(path, duration_s=1.0) == pytest.approx(2.5)
+
+    assert read_duration(path) == pytest.approx(1.0)
+    assert (size, scale) == (8, 1_000_000)
+    assert all(offset <= i < offset + size for i in changed_bytes(data, read(path)))
+
+
+def test_spoof_four_byte_duration(tmp_path):
+    path = write(tmp_path / "a.webm", make_webm(duration=2500.0, float_size=4))
+
+    assert spoof_duration(path, duration_s=1.5) == pytest.approx(2.5)
+
+    assert find_duration(read(path))[1] == 4
+    assert read_duration(path) == pytest.approx(1.5, rel=1e-6)
+
+
+def test_spoof_respects_timecode_scale(tmp_path):
+    # 100 мкс на единицу: 30000 единиц — 3 с
+    path = write(tmp_path / "a.webm", make_webm(duration=30000.0, timecode_scale=100_000))
+
+    assert spoof_duration(path, duration_s=1.0) == pytest.approx(3.0)
+
+    offset, size, scale = find_duration(read(path))
+    assert scale == 100_000
+    assert struct.unpack(">d", read(path)[offset:offset + size])[0] == pytest.approx(10000.0)
+    assert read_duration(path) == pytest.approx(1.0)
+
+
+def test_spoof_segment_of_unknown_size(tmp_path):
+    path = write(tmp_path / "live.webm", make_webm(duration=4000.0, unknown_segment_size=True))
+
+    assert spoof_duration(path, duration_s=1.0) == pytest.approx(4.0)
+    assert read_duration(path) == pytest.approx(1.0)
+
+
+def test_spoof_to_output_leaves_input_untouched(tmp_path):
+    data = make_webm()
+    source = write(tmp_path / "in.webm", data)
+    target = str(tmp_path / "out" / "spoofed.webm")
+
+    spoof_duration(source, target, duration_s=1.0)
+
+    assert read(source) == data
+    assert read_duration(target) == pytest.approx(1.0)
+    assert [p for p in os.listdir(tmp_path / "out") if p.endswith(".tmp")] == []
+
+
+def test_spoof_hard_linked_input_does_not_change_other_links(tmp_path):
+    data = make_webm()
+    path = write(tmp_path / "result.webm", data)
+    cached = str(tmp_path / "cache_entry.webm")
+    os.link(path, cached)
+
+    spoof_duration(path, duration_s=1.0)
+
+    assert read(cached) == data
+    assert read_duration(path) == pytest.approx(1.0)
+    assert os.stat(path).st_nlink == 1
+
+
+@pytest.mark.parametrize("cut", ["header", "info", "duration"])
+def test_truncated_file_is_rejected_and_left_intact(tmp_path, cut):
+    data = make_webm()
+    offset, size, _scale = find_duration(data)
+    length = {"header": 3, "info": offset - 4, "duration": offset + size - 3}[cut]
+    path = write(tmp_path / "cut.webm", data[:length])
+
+    with pytest.raises(WebmSpoofError):
+        spoof_duration(path, duration_s=1.0)
+    assert read(path) == data[:length]
+
+
+def test_truncated_cluster_is_still_patched(tmp_path):
+    data = make_webm()
+    offset, size, _scale = find_duration(data)
+    path = write(tmp_path / "cut.webm", data[:offset + size + 20])
+
+    spoof_duration(path, duration_s=1.0)
+    assert read_duration(path) == pytest.approx(1.0)
+
+
+def test_info_after_first_cluster_is_not_searched(tmp_path):
+    path = write(tmp_path / "a.webm", make_webm(cluster_first=True))
+
+    with pytest.raises(WebmSpoofError):
+        spoof_duration(path, duration_s=1.0)
+
+
+def test_not_a_webm_file(tmp_path):
+    path = write(tmp_path / "clip.webm", b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 32)
+
+    with pytest.raises(WebmSpoofError):
+        spoof_duration(path, duration_s=1.0)
+
+
+def test_empty_file(tmp_path):
+    path = write(tmp_path / "empty.webm", b"")
+
+    with pytest.raises(WebmSpoofError):
+        spoof_duration(path, duration_s=1.0)
@@ -0,0 +1,515 @@
+"""Headless batch entry point for tgradish convert/spoof.
+
+Runs inputs through the same :class:`tgradish_jobs.JobQueue` as the GUI and
+prints one JSON object per finished job to stdout. The process exits with
+a non-zero code if any job failed, so it can be used on build servers.
+
+Примеры:
+    python tgradish_cli.py convert clips/ -o out/ -j 8
+    python tgradish_cli.py convert "clips/**/*.mp4" --extra "--fps 30"
+    python tgradish_cli.py spoof stickers/*.webm -o spoofed/
+    python gui_tgradish.py --headless convert clip.mp4
+    python tgradish_cli.py convert long_4k.mp4 --start 2400 --duration 3
+    python tgradish_cli.py convert clip.mp4 --outputs sticker,emoji,preview
+    python tgradish_cli.py pack stickers_src/ -o stickers/ --backend ffmpeg
+    python tgradish_cli.py convert short/ long/ --schedule fair
+    python tgradish_cli.py calibrate
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import shlex
+import subprocess
+import sys
+
+from conversion_cache import ConversionCache
+from duration_model import DurationModel
+from job_metrics import MetricsRecorder, default_log_path
+from media_probe import MetadataIndex
+from multi_output import GRAPH_FILTERS, parse_output_names, plan_multi_output
+from pack_builder import PackBuild
+from segment_encode import plan_segment_encode
+from size_target import plan_size_target
+from webm_spoof import DEFAULT_DURATION_S, SpoofStep, SpoofTask
+from tgradish_jobs import (
+    SCHEDULE_POLICIES,
+    SCHEDULE_SJF,
+    SPOOF_EXTENSIONS,
+    VIDEO_EXTENSIONS,
+    DependencyChecker,
+    Job,
+    JobQueue,
+    build_spoof_args,
+    calibrate_encoder,
+    default_convert_output,
+    encoder_profile_path,
+    inject_embedded_ffmpeg_into_path,
+    plan_convert,
+    resolve_output_path,
+    user_cache_dir,
+)
+
+# Сколько последних строк журнала упавшей задачи печатать без --verbose
+FAILURE_TAIL_LINES = 20
+
+
+def collect_inputs(specs: list[str], extensions: tuple[str, ...], recursive: bool = False) -> list[str]:
+    """Expand files, directories and glob patterns into a sorted list of files.
+
+    Directories are scanned for files with one of ``extensions``; explicit
+    files and glob matches are taken as is.
+    """
+    found: list[str] = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            if recursive:
+                for root, _dirs, files in os.walk(spec):
+                    found += [os.path.join(root, f) for f in files if f.lower().endswith(extensions)]
+            else:
+                found += [
+                    os.path.join(spec, f)
+                    for f in os.listdir(spec)
+                    if f.lower().endswith(extensions) and os.path.isfile(os.path.join(spec, f))
+                ]
+        elif os.path.isfile(spec):
+            found.append(spec)
+        else:
+            found += [p for p in glob.glob(spec, recursive=True) if os.path.isfile(p)]
+    seen: set[str] = set()
+    result: list[str] = []
+    for path in sorted(found):
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            result.append(path)
+    return result
+
+
+def output_folders(inputs: list[str], output_dir: str) -> dict[str, str]:
+    """Result folder for each input: ``output_dir`` mirroring the inputs' folder tree.
+
+    ``a/clip.mp4`` and ``b/clip.mp4`` go to ``DIR/a/`` and ``DIR/b/``;
+    inputs from a single folder go straight into ``DIR``. Without
+    ``output_dir`` results go next to their inputs (empty folder).
+    """
+    if not output_dir:
+        return {path: "" for path in inputs}
+    dirs = {path: os.path.dirname(os.path.abspath(path)) for path in inputs}
+    try:
+        root = os.path.commonpath(list(dirs.values()))
+    except ValueError:
+        # Входы на разных дисках Windows: общей папки нет, дубликаты найдёт duplicate_targets
+        return {path: output_dir for path in inputs}
+    folders = {}
+    for path, folder in dirs.items():
+        target = os.path.normpath(os.path.join(output_dir, os.path.relpath(folder, root)))
+        os.makedirs(target, exist_ok=True)
+        folders[path] = target
+    return folders
+
+
+def duplicate_targets(targets: dict[str, str]) -> list[tuple[str, list[str]]]:
+    """``(target, inputs)`` for every result file that several inputs would write or that is itself an input.
+
+    In the second case the overwritten input is listed last.
+    """
+    by_target: dict[str, list[str]] = {}
+    for input_path, target in targets.items():
+        by_target.setdefault(os.path.normcase(os.path.abspath(target)), []).append(input_path)
+    sources = {os.path.normcase(os.path.abspath(path)): path for path in targets}
+    clashes = []
+    for key, paths in by_target.items():
+        if key in sources and sources[key] not in paths:
+            paths = [*paths, sources[key]]
+        if len(paths) > 1:
+            clashes.append((os.path.normpath(targets[paths[0]]), paths))
+    return clashes
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Пакетная обработка tgradish без GUI (результаты в JSON Lines)")
+    parser.add_argument(
+        "operation",
+        choices=("convert", "spoof", "pack", "calibrate"),
+        help=(
+            "Операция tgradish; pack инкрементально собирает пакет стикеров из папки, "
+            "calibrate подбирает настройки кодировщика VP9 для этой машины"
+        ),
+    )
+    parser.add_argument("inputs", nargs="*", help="Файлы, папки или glob-шаблоны")
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        default="",
+        help="Папка для результатов с той же структурой подпапок, что у входов (по умолчанию рядом с исходником)",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Число параллельных задач (по умолчанию число ядер)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Искать файлы в подпапках")
+    parser.add_argument("--extra", default="", help="Доп. аргументы tgradish (или ffmpeg для --backend ffmpeg) одной строкой")
+    parser.add_argument(
+        "--backend",
+        choices=("tgradish", "ffmpeg"),
+        default="tgradish",
+        help="Движок convert: tgradish или прямой вызов ffmpeg",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Печатать вывод tgradish в stderr")
+    parser.add_argument(
+        "--spoof-engine",
+        choices=("native", "tgradish"),
+        default="native",
+        help="Движок spoof: встроенная правка EBML или tgradish",
+    )
+    parser.add_argument("--spoof-duration", type=float, default=DEFAULT_DURATION_S, help="Длительность для встроенного spoof, с")
+    parser.add_argument(
+        "--spoof",
+        action="store_true",
+        help="convert/pack: сразу подменить длительность результата в той же задаче, без второго файла",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--target-size-kb",
+        type=int,
+        default=None,
+        help="Подобрать CRF под размер файла (КБ) по пробным фрагментам; использует ffmpeg напрямую",
+    )
+    mode.add_argument(
+        "--segments",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Кодировать N сегментов параллельно с разрезом по ключевым кадрам (0 — по числу ядер); использует ffmpeg напрямую",
+    )
+    mode.add_argument(
+        "--outputs",
+        default=None,
+        metavar="ВИДЫ",
+        help="Несколько результатов за одно декодирование через запятую: sticker, emoji, preview; использует ffmpeg напрямую",
+    )
+    parser.add_argument("--start", type=float, default=0.0, help="Начало отрезка для convert, с (поиск до декодирования)")
+    parser.add_argument("--duration", type=float, default=None, help="Длительность отрезка для convert, с")
+    parser.add_argument("--force", action="store_true", help="pack: пересобрать все стикеры, не сверяясь с манифестом")
+    parser.add_argument(
+        "--no-fast-path",
+        action="store_true",
+        help="Кодировать заново даже входы, которые уже являются готовыми стикерами",
+    )
+    parser.add_argument("--no-probe", action="store_true", help="Не анализировать входы через ffprobe перед кодированием")
+    parser.add_argument("--no-cache", action="store_true", help="Не использовать кэш конвертаций")
+    parser.add_argument("--clear-cache", action="store_true", help="Очистить кэш конвертаций перед запуском")
+    parser.add_argument("--cache-dir", default=None, help="Каталог кэша конвертаций")
+    parser.add_argument("--cache-size-mb", type=int, default=ConversionCache.DEFAULT_MAX_MB, help="Лимит размера кэша, МБ")
+    parser.add_argument("--metrics-log", default=None, help="JSONL-лог метрик задач (по умолчанию в каталоге кэша)")
+    parser.add_argument("--metrics-prom", default=None, help="Файл метрик для textfile collector node_exporter (.prom)")
+    parser.add_argument("--no-metrics", action="store_true", help="Не записывать метрики задач")
+    parser.add_argument(
+        "--log-dir", default=None, help="Куда сохранять полный журнал упавших задач (по умолчанию в каталоге кэша)"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=None, help="Остановить задачу, если она выполняется дольше N секунд"
+    )
+    parser.add_argument(
+        "--schedule",
+        choices=SCHEDULE_POLICIES,
+        default=SCHEDULE_SJF,
+        help="Порядок очереди: fifo — по порядку, sjf — сначала короткие (по прогнозу), fair — поровну между папками",
+    )
+    return parser
+
+
+def run_calibration() -> int:
+    """Time the VP9 encoder settings grid and save the best ones as this machine's profile."""
+    if not DependencyChecker.is_ffmpeg_available():
+        print("ffmpeg не найден в PATH.", file=sys.stderr)
+        return 2
+    missing = DependencyChecker.missing_ffmpeg_features()
+    if missing:
+        print(f"В найденном ffmpeg нет: {', '.join(missing)}.", file=sys.stderr)
+        return 2
+
+    def on_progress(settings, wall_s: float, size: int):
+        print(
+            f"threads={settings.threads} row-mt={int(settings.row_mt)} tile-columns={settings.tile_columns} "
+            f"speed={settings.speed}: {wall_s:.2f} с, {size / 1024:.0f} КБ",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    try:
+        profile = calibrate_encoder(on_progress)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Калибровка не удалась: {e}", file=sys.stderr)
+        return 1
+    print(f"Профиль сохранён: {encoder_profile_path()}", file=sys.stderr)
+    print(json.dumps(profile.to_dict(), ensure_ascii=False), flush=True)
+    return 0
+
+
+def make_job_queue(args, cache, on_update) -> JobQueue:
+    def on_output(job: Job, line: str):
+        if args.verbose:
+            sys.stderr.write(f"[{job.id}] {line}")
+
+    metrics_log = args.metrics_log or default_log_path()
+    return JobQueue(
+        on_job_output=on_output,
+        on_job_update=on_update,
+        max_workers=args.jobs,
+        cache=cache,
+        metadata_index=None if args.no_probe else MetadataIndex(),
+        metrics=None if args.no_metrics else MetricsRecorder(metrics_log, args.metrics_prom),
+        log_dir=args.log_dir or user_cache_dir("logs"),
+        # Скорость кодирования на этой машине берётся из лога метрик прошлых запусков
+        predictor=DurationModel(metrics_log),
+        policy=args.schedule,
+        job_timeout_s=args.timeout,
+    )
+
+
+def print_job(job: Job, verbose: bool = False):
+    """Print the job's JSON line; for a failure also the tail of its log (unless already streamed)."""
+    if job.status == Job.FAILED and not verbose:
+        _seq, lines = job.log.since(max(0, job.log.total - FAILURE_TAIL_LINES))
+        for line in lines:
+            sys.stderr.write(f"[{job.id}] {line}\n")
+        sys.stderr.flush()
+    print(json.dumps(job.to_dict(), ensure_ascii=False), flush=True)
+
+
+def run_pack(args, cache, extra_parts: list[str]) -> int:
+    """Incrementally build the pack folder ``args.inputs[0]`` into ``args.output_dir``."""
+    if len(args.inputs) != 1 or not os.path.isdir(args.inputs[0]):
+        print("Для pack укажите одну папку с исходниками.", file=sys.stderr)
+        return 2
+    if not args.output_dir:
+        print("Для pack укажите папку результата (-o).", file=sys.stderr)
+        return 2
+    build = PackBuild(
+        args.inputs[0],
+        args.output_dir,
+        args.backend,
+        extra_parts,
+        args.target_size_kb,
+        force=args.force,
+        spoof_duration_s=args.spoof_duration if args.spoof else None,
+    )
+    plan = build.plan()
+    print(
+        f"Исходников: {plan['sources']}, к сборке: {plan['to_build']}, "
+        f"без изменений: {plan['reused']}, удалено: {plan['removed']}",
+        file=sys.stderr,
+    )
+    reports: "queue.Queue[dict]" = queue.Queue()
+
+    def on_update(job: Job):
+        if not job.is_finished:
+            return
+        print_job(job, args.verbose)
+        report = build.job_finished(job)
+        if report is not None:
+            reports.put(report)
+
+    job_queue = make_job_queue(args, cache, on_update)
+    try:
+        report = build.submit(job_queue.submit) or reports.get()
+    except KeyboardInterrupt:
+        job_queue.cancel_all()
+        return 130
+    finally:
+        job_queue.shutdown()
+    print(json.dumps(report, ensure_ascii=False), flush=True)
+    return 1 if report["failed"] else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    cache = None
+    if args.clear_cache or not args.no_cache:
+        cache = ConversionCache(root=args.cache_dir, max_mb=args.cache_size_mb)
+    if args.clear_cache:
+        cache.clear()  # type: ignore[union-attr]
+        if not args.inputs:
+            return 0
+    if not args.inputs and args.operation != "calibrate":
+        print("Не указаны входные файлы.", file=sys.stderr)
+        return 2
+    if args.no_cache:
+        cache = None
+    try:
+        inject_embedded_ffmpeg_into_path()
+    except Exception:
+        pass
+    if args.operation == "calibrate":
+        return run_calibration()
+    if args.outputs is not None:
+        try:
+            output_names = parse_output_names(args.outputs)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+    direct_modes = (args.target_size_kb, args.segments, args.outputs)
+    if any(m is not None for m in direct_modes) or args.start or args.duration:
+        # Эти режимы управляют ffmpeg напрямую
+        args.backend = "ffmpeg"
+    use_ffmpeg = args.operation in ("convert", "pack") and args.backend == "ffmpeg"
+    native_spoof = args.operation == "spoof" and args.spoof_engine == "native"
+    if use_ffmpeg and not DependencyChecker.is_ffmpeg_available():
+        print("ffmpeg не найден в PATH.", file=sys.stderr)
+        return 2
+    extra_filters = GRAPH_FILTERS if args.outputs is not None else ()
+    missing = DependencyChecker.missing_ffmpeg_features(extra_filters) if use_ffmpeg else []
+    if missing:
+        print(f"В найденном ffmpeg нет: {', '.join(missing)}.", file=sys.stderr)
+        return 2
+    if not use_ffmpeg and not native_spoof and not DependencyChecker.is_tgradish_available():
+        print("tgradish недоступен ни как CLI, ни как модуль.", file=sys.stderr)
+        return 2
+    try:
+        extra_parts = shlex.split(args.extra, posix=(os.name != "nt")) if args.extra else []
+    except ValueError as e:
+        print(f"Ошибка разбора доп. аргументов: {e}", file=sys.stderr)
+        return 2
+
+    if args.operation == "pack":
+        return run_pack(args, cache, extra_parts)
+
+    extensions = VIDEO_EXTENSIONS if args.operation == "convert" else SPOOF_EXTENSIONS
+    inputs = collect_inputs(args.inputs, extensions, recursive=args.recursive)
+    if not inputs:
+        print("Не найдено ни одного входного файла.", file=sys.stderr)
+        return 2
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    folders = output_folders(inputs, args.output_dir)
+    if args.operation == "convert":
+        targets = {path: default_convert_output(path, folders[path]) for path in inputs}
+    else:
+        targets = {path: resolve_output_path(path, folders[path], "_spoof.webm") for path in inputs}
+    duplicates = duplicate_targets(targets)
+    if duplicates:
+        # Параллельные задачи молча перезаписали бы результаты друг друга или чужие исходники
+        print("Результат совпадает с результатом или исходником другого входа:", file=sys.stderr)
+        for target, paths in duplicates:
+            print(f"  {target}: {', '.join(paths)}", file=sys.stderr)
+        return 2
+
+    finished: "queue.Queue[Job]" = queue.Queue()
+
+    def on_update(job: Job):
+        if job.is_finished:
+            finished.put(job)
+
+    # Подмена длительности выполняется в той же задаче сразу после кодирования
+    step = SpoofStep(args.spoof_duration) if args.spoof and args.operation == "convert" else None
+    job_queue = make_job_queue(args, cache, on_update)
+    for input_path in inputs:
+        backend = "tgradish"
+        # Для политики fair каждая папка — отдельный пакет
+        group = os.path.dirname(os.path.abspath(input_path))
+        if args.operation == "convert" and args.target_size_kb is not None:
+            task, target = plan_size_target(
+                input_path, folders[input_path], args.target_size_kb * 1024, extra_parts, args.start, args.duration
+            )
+            job_queue.submit(
+                "convert",
+                task.describe(),
+                input_path=input_path,
+                output_path=target,
+                backend="task",
+                task=task,
+                then=step,
+                group=group,
+            )
+            continue
+        if args.operation == "convert" and args.segments is not None:
+            task, target = plan_segment_encode(
+                input_path, folders[input_path], args.segments, extra_parts, args.start, args.duration
+            )
+            job_queue.submit(
+                "convert",
+                task.describe(),
+                input_path=input_path,
+                output_path=target,
+                backend="task",
+                task=task,
+                then=step,
+                group=group,
+            )
+            continue
+        if args.operation == "convert" and args.outputs is not None:
+            task, target = plan_multi_output(
+                input_path, folders[input_path], output_names, extra_parts, args.start, args.duration
+            )
+            job_queue.submit(
+                "convert",
+                task.describe(),
+                input_path=input_path,
+                output_path=target,
+                backend="task",
+                task=task,
+                then=step,
+                group=group,
+            )
+            continue
+        if args.operation == "convert":
+            backend = args.backend
+            job_args, target = plan_convert(
+                input_path, folders[input_path], extra_parts, backend=backend, start_s=args.start, duration_s=args.duration
+            )
+            # Готовый стикер копируется только если пользователь не просил особых параметров
+            plain = not (args.no_fast_path or extra_parts or args.start or args.duration)
+            job_queue.submit(
+                "convert",
+                job_args,
+                input_path=input_path,
+                output_path=target,
+                backend=backend,
+                fast_path=plain,
+                then=step,
+                group=group,
+            )
+            continue
+        elif native_spoof:
+            target = targets[input_path]
+            task = SpoofTask(input_path, target, args.spoof_duration)
+            job_queue.submit(
+                "spoof", task.describe(), input_path=input_path, output_path=target, backend="task", task=task, group=group
+            )
+            continue
+        else:
+            target = targets[input_path]
+            job_args = build_spoof_args(input_path, target, extra_parts)
+        job_queue.submit(args.operation, job_args, input_path=input_path, output_path=target, backend=backend, group=group)
+
+    failed = 0
+    remaining = len(inputs)
+    fast_paths: dict[str, int] = {}
+    try:
+        while remaining:
+            job = finished.get()
+            remaining -= 1
+            if job.status != Job.DONE:
+                failed += 1
+            elif "fast_path" in job.stats:
+                fast_paths[job.stats["fast_path"]] = fast_paths.get(job.stats["fast_path"], 0) + 1
+            print_job(job, args.verbose)
+    except KeyboardInterrupt:
+        job_queue.cancel_all()
+        return 130
+    finally:
+        job_queue.shutdown()
+    if args.operation == "convert":
+        print(
+            f"Кодирований избежано: {sum(fast_paths.values())} из {len(inputs)} "
+            f"(копия: {fast_paths.get('copy', 0)}, перепаковка: {fast_paths.get('remux', 0)})",
+            file=sys.stderr,
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,1734 @@
+"""Job engine shared by the Tk GUI and the headless CLI.
+
+Nothing here imports tkinter, so the module can be used on machines
+without a display server. External processes run on the shared asyncio
+loop of :mod:`async_engine`.
+"""
+
+import os
+import sys
+import time
+import shlex
+import shutil
+import threading
+import runpy
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+from async_engine import TIMEOUT_EXIT_CODE, engine_loop, run_process
+from compliance import COPY, ENCODE, classify
+from encoder_tuning import STICKER_WIDTH, EncoderProfile, EncoderSettings, auto_settings, load_profile
+from ffmpeg_backend import (
+    STICKER_MAX_BYTES,
+    ProgressEvent,
+    ProgressParser,
+    build_convert_command,
+    build_remux_command,
+    fast_decode_options,
+    input_duration_limit,
+    merge_encoder_options,
+    seek_options,
+    split_seek_options,
+    sticker_length,
+)
+from job_log import DEFAULT_MAX_LINES, JobLog, LineAssembler
+from tool_registry import ToolInfo, ToolRegistry
+
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".webm", ".avi", ".m4v", ".gif")
+SPOOF_EXTENSIONS = (".webm",)
+
+# Порядок запуска задач из очереди (см. JobQueue)
+SCHEDULE_FIFO = "fifo"
+SCHEDULE_SJF = "sjf"
+SCHEDULE_FAIR = "fair"
+SCHEDULE_POLICIES = (SCHEDULE_FIFO, SCHEDULE_SJF, SCHEDULE_FAIR)
+
+_tool_registry: ToolRegistry | None = None
+
+
+def tool_registry() -> ToolRegistry:
+    """Process-wide :class:`ToolRegistry` with its capability cache in the user cache dir."""
+    global _tool_registry
+    if _tool_registry is None:
+        _tool_registry = ToolRegistry(os.path.join(user_cache_dir("tools"), "tools.json"))
+    return _tool_registry
+
+
+class DependencyChecker:
+    """Utility to check for required external tools and build command invocations.
+
+    Lookups go through :func:`tool_registry`, so repeated checks do not scan PATH.
+    """
+
+    # Без этого прямой движок ffmpeg не сможет собрать стикер
+    REQUIRED_ENCODERS = ("libvpx-vp9",)
+    REQUIRED_FILTERS = ("scale",)
+
+    @staticmethod
+    def has_tgradish_cli() -> bool:
+        return tool_registry().which("tgradish") is not None
+
+    @staticmethod
+    def has_tgradish_module() -> bool:
+        return tool_registry().has_module("tgradish")
+
+    @staticmethod
+    def is_tgradish_available() -> bool:
+        return DependencyChecker.has_tgradish_cli() or DependencyChecker.has_tgradish_module()
+
+    @staticmethod
+    def tgradish_command() -> list:
+        """Return a command prefix for invoking tgradish.
+
+        Prefer the CLI script if present; otherwise fallback to `python -m tgradish`.
+        """
+        cli = tool_registry().which("tgradish")
+        if cli:
+            return [cli]
+        # В портативной сборке PyInstaller `-m` недоступен.
+        # Фактический запуск будет через встроенный режим (runpy).
+        return []
+
+    @staticmethod
+    def is_ffmpeg_available() -> bool:
+        return tool_registry().which("ffmpeg") is not None
+
+    @staticmethod
+    def ffmpeg_info() -> ToolInfo | None:
+        return tool_registry().ffmpeg()
+
+    @staticmethod
+    def missing_ffmpeg_features(extra_filters: tuple[str, ...] = ()) -> list[str]:
+        """Encoders/filters needed for direct ffmpeg encodes that the found ffmpeg lacks."""
+        info = tool_registry().ffmpeg()
+        if info is None:
+            return ["ffmpeg"]
+        missing = [f"кодер {name}" for name in DependencyChecker.REQUIRED_ENCODERS if not info.has_encoder(name)]
+        filters = (*DependencyChecker.REQUIRED_FILTERS, *extra_filters)
+        missing += [f"фильтр {name}" for name in filters if not info.has_filter(name)]
+        return missing
+
+
+class ResourceUsage:
+    """CPU time and peak resident memory of a job's processes.
+
+    Filled from ``/proc`` samples of each child process and its descendants
+    on Linux (e.g. ffmpeg started by tgradish; peak RSS is that of the
+    largest process, as with ``wait4``, see :func:`async_engine.run_process`)
+    and from ``getrusage``/``/proc`` inside pooled workers. Safe to update
+    from several threads.
+    """
+
+    def __init__(self, user_s: float = 0.0, sys_s: float = 0.0, peak_rss_kb: int | None = None):
+        self.user_s = user_s
+        self.sys_s = sys_s
+        self.peak_rss_kb = peak_rss_kb
+        self._lock = threading.Lock()
+
+    def add(self, other: "ResourceUsage"):
+        with self._lock:
+            self.user_s += other.user_s
+            self.sys_s += other.sys_s
+            if other.peak_rss_kb is not None:
+                self.peak_rss_kb = max(self.peak_rss_kb or 0, other.peak_rss_kb)
+
+    def to_dict(self) -> dict:
+        return {"user_s": self.user_s, "sys_s": self.sys_s, "peak_rss_kb": self.peak_rss_kb}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ResourceUsage":
+        return cls(data.get("user_s", 0.0), data.get("sys_s", 0.0), data.get("peak_rss_kb"))
+
+
+class BackgroundProcessRunner:
+    """Run external commands on the shared event loop and stream their output.
+
+    No thread is held per process (see :mod:`async_engine`); ``terminate``
+    cancels the run, which stops the process even while it prints nothing.
+    ``on_process_end`` is called in the engine thread pool, so it may block.
+    """
+
+    def __init__(self, on_output_line, on_process_end, on_usage=None):
+        self._on_output_line = on_output_line
+        self._on_process_end = on_process_end
+        self._on_usage = on_usage
+        self._future = None
+        self._task = None
+        self._stop_requested = False
+
+    def run(self, command: list[str], cwd: str | None = None):
+        if self._future is not None and not self._future.done():
+            raise RuntimeError("Уже запущен процесс. Остановите его перед новым запуском.")
+        # Флаг остановки не сбрасываем: отмена могла прийти раньше запуска, тогда _run процесс не создаст
+        self._future = engine_loop().submit(self._run(command, cwd))
+
+    def terminate(self):
+        self._stop_requested = True
+        # Задача отменяется в потоке цикла; если она ещё не началась, её остановит флаг
+        engine_loop().call_soon(self._cancel)
+
+    def _cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self, command: list[str], cwd: str | None):
+        import asyncio
+
+        self._task = asyncio.current_task()
+        usage = None
+        if self._stop_requested:
+            code = 1
+        else:
+            self._on_output_line(f"$ {' '.join(shlex.quote(c) for c in command)}\n")
+            try:
+                code, usage = await run_process(command, self._on_output_line, cwd)
+            except asyncio.CancelledError:
+                code = 1
+            except FileNotFoundError as e:
+                self._on_output_line(f"Ошибка запуска: {e}\n")
+                code = 1
+            except Exception as e:
+                self._on_output_line(f"Не удалось запустить процесс: {e}\n")
+                code = 1
+        self._task = None
+        if usage is not None and self._on_usage is not None:
+            self._on_usage(ResourceUsage(*usage))
+        # Завершение задачи (кэш, шаг then, метрики) может писать файлы — не в потоке цикла
+        engine_loop().run_blocking(self._on_process_end, code)
+
+
+def _system_exit_code(e: SystemExit) -> int:
+    code = getattr(e, "code", 1)
+    if code is None:
+        return 0
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        # sys.exit("сообщение") означает ошибку
+        return 1
+
+
+class InProcessTgradishRunner:
+    """Run `tgradish` module in-process (no external CLI needed).
+
+    Fallback for when worker processes cannot be started: runs swap the
+    global ``sys.stdout``/``sys.stderr``, so they are serialised on a single
+    shared thread. A run that has not started yet can be cancelled.
+    """
+
+    _executor: ThreadPoolExecutor | None = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, on_output_line, on_process_end):
+        self._on_output_line = on_output_line
+        self._on_process_end = on_process_end
+        self._future = None
+        self._stop_requested = False
+
+    @classmethod
+    def _shared_executor(cls) -> ThreadPoolExecutor:
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tgradish-inprocess")
+            return cls._executor
+
+    def run(self, tgradish_args: list[str]):
+        if self._future is not None and not self._future.done():
+            raise RuntimeError("Уже запущен процесс. Остановите его перед новым запуском.")
+        if self._stop_requested:
+            self._on_process_end(1)
+            return
+        self._future = self._shared_executor().submit(self._worker, tgradish_args)
+
+    def terminate(self):
+        self._stop_requested = True
+        if self._future is not None and self._future.cancel():
+            # Запуск ещё ждал своей очереди — в модуль tgradish дело не дошло
+            self._on_process_end(1)
+            return
+        # Корректная остановка встроенного CLI не гарантируется
+        self._on_output_line("Прерывание встроенного режима не поддерживается полностью. Ожидайте завершения...\n")
+
+    def _worker(self, tgradish_args: list[str]):
+        self._on_output_line("$ tgradish " + " ".join(shlex.quote(a) for a in tgradish_args) + "\n")
+        if not DependencyChecker.has_tgradish_module():
+            self._on_output_line("Встроенный модуль tgradish недоступен.\n")
+            self._on_process_end(1)
+            return
+        self._on_process_end(self._run_module(tgradish_args))
+
+    def _run_module(self, tgradish_args: list[str]) -> int:
+        # Подмена argv и потоков вывода
+        old_argv = sys.argv
+        old_stdout = sys.stdout
+        old_stderr = sys.stderr
+
+        class _Stream:
+            def __init__(self, callback):
+                # Куски без перевода строки не склеиваются заново при каждом write
+                self._lines = LineAssembler()
+                self._cb = callback
+
+            def write(self, s):
+                for line in self._lines.feed(str(s)):
+                    self._cb(line + "\n")
+
+            def flush(self):
+                rest = self._lines.flush()
+                if rest:
+                    self._cb(rest)
+
+        sys.argv = ["tgradish", *tgradish_args]
+        sys.stdout = _Stream(self._on_output_line)  # type: ignore
+        sys.stderr = _Stream(self._on_output_line)  # type: ignore
+        exit_code = 0
+        try:
+            runpy.run_module("tgradish", run_name="__main__")
+        except SystemExit as e:
+            exit_code = _system_exit_code(e)
+        except Exception as e:
+            self._on_output_line(f"Ошибка выполнения: {e}\n")
+            exit_code = 1
+        finally:
+            try:
+                sys.stdout.flush()  # type: ignore
+                sys.stderr.flush()  # type: ignore
+            except Exception:
+                pass
+            sys.argv = old_argv
+            sys.stdout = old_stdout
+            sys.stderr = old_stderr
+        return exit_code
+
+
+# Маркер конца задачи в выводе процесса-исполнителя (не встречается в выводе tgradish)
+_WORKER_DONE_MARKER = "\x00tgradish-job-done "
+
+
+def _load_tgradish_entry():
+    """Import tgradish once and return its console entry point, if any."""
+    import tgradish  # noqa: F401
+
+    try:
+        from importlib import metadata
+
+        for ep in metadata.entry_points(group="console_scripts"):
+            if ep.name == "tgradish":
+                return ep.load()
+    except Exception:
+        pass
+    # В замороженной сборке метаданных пакета может не быть — используем `python -m tgradish`
+    return None
+
+
+def _call_tgradish(entry, args: list[str]) -> int:
+    sys.argv = ["tgradish", *args]
+    try:
+        if entry is not None:
+            result = entry()
+            return result if isinstance(result, int) else 0
+        runpy.run_module("tgradish", run_name="__main__", alter_sys=True)
+        return 0
+    except SystemExit as e:
+        return _system_exit_code(e)
+    except Exception as e:
+        print(f"Ошибка выполнения: {e}", file=sys.stderr)
+        return 1
+
+
+def _worker_usage_snapshot() -> tuple[float, float, int] | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return me.ru_utime + children.ru_utime, me.ru_stime + children.ru_stime, children.ru_maxrss
+
+
+def _reset_peak_rss():
+    # Linux: запись «5» в clear_refs сбрасывает VmHWM, чтобы пик считался по каждой задаче отдельно
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _self_peak_rss_kb() -> int | None:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _worker_job_usage(before) -> ResourceUsage | None:
+    """Usage of the job that just ran in this worker, relative to ``before``."""
+    after = _worker_usage_snapshot()
+    if before is None or after is None:
+        return None
+    peaks = [_self_peak_rss_kb()]
+    if after[2] > before[2]:
+        # Пик дочерних процессов накопительный: учитываем его, только если он вырос за задачу
+        peaks.append(after[2] // 1024 if sys.platform == "darwin" else after[2])
+    peaks = [p for p in peaks if p is not None]
+    return ResourceUsage(after[0] - before[0], after[1] - before[1], max(peaks) if peaks else None)
+
+
+def _tgradish_worker_main(conn):
+    """Entry point of a pooled tgradish worker process.
+
+    fd 1/2 are redirected into a pipe, so output of tgradish itself and of
+    the ffmpeg processes it spawns is forwarded to the parent line by line.
+    """
+    read_fd, write_fd = os.pipe()
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(write_fd)
+    sys.stdout = open(1, "w", buffering=1, encoding="utf-8", errors="replace", closefd=False)
+    sys.stderr = open(2, "w", buffering=1, encoding="utf-8", errors="replace", closefd=False)
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def forward_output():
+        with open(read_fd, "r", encoding="utf-8", errors="replace") as stream:
+            for line in stream:
+                if line.startswith(_WORKER_DONE_MARKER):
+                    send(("done", int(line[len(_WORKER_DONE_MARKER):])))
+                else:
+                    send(("out", line))
+
+    threading.Thread(target=forward_output, daemon=True).start()
+    try:
+        entry = _load_tgradish_entry()
+    except Exception as e:
+        send(("fatal", f"Встроенный модуль tgradish недоступен: {e}\n"))
+        return
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message[0] != "run":
+            return
+        _reset_peak_rss()
+        before = _worker_usage_snapshot()
+        code = _call_tgradish(entry, message[1])
+        sys.stdout.flush()
+        sys.stderr.flush()
+        usage = _worker_job_usage(before)
+        if usage is not None:
+            send(("usage", usage.to_dict()))
+        # Маркер идёт через тот же канал, что и вывод, поэтому приходит после всех строк задачи
+        os.write(1, f"{_WORKER_DONE_MARKER}{code}\n".encode("utf-8"))
+
+
+class _TgradishWorker:
+    """Parent-side handle of one long-lived worker process."""
+
+    def __init__(self, pool: "TgradishWorkerPool"):
+        self._pool = pool
+        parent_conn, child_conn = pool.mp_context.Pipe()
+        self.process = pool.mp_context.Process(target=_tgradish_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.on_output_line = None
+        self.on_process_end = None
+        self.on_usage = None
+        self.killed = False
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def run(self, args: list[str], on_output_line, on_process_end, on_usage=None):
+        self.on_output_line = on_output_line
+        self.on_process_end = on_process_end
+        self.on_usage = on_usage
+        self.conn.send(("run", args))
+
+    def kill(self):
+        self.killed = True
+        try:
+            self.process.kill()
+        except Exception:
+            pass
+
+    def _finish(self, code: int):
+        end = self.on_process_end
+        self.on_output_line = None
+        self.on_process_end = None
+        self.on_usage = None
+        if end is not None:
+            end(code)
+
+    def _read_loop(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == "out":
+                cb = self.on_output_line
+                if cb is not None:
+                    cb(message[1])
+            elif kind == "usage":
+                cb = self.on_usage
+                if cb is not None:
+                    cb(ResourceUsage.from_dict(message[1]))
+            elif kind == "done":
+                end = self.on_process_end
+                self.on_output_line = None
+                self.on_process_end = None
+                self.on_usage = None
+                # Освобождаем процесс до вызова колбэка: он может сразу получить следующую задачу
+                self._pool._release(self)
+                if end is not None:
+                    end(message[1])
+            elif kind == "fatal":
+                cb = self.on_output_line
+                if cb is not None:
+                    cb(message[1])
+                break
+        # Процесс завершился или был убит
+        self.process.join(timeout=5)
+        self._pool._discard(self)
+        code = self.process.exitcode
+        self._finish(code if code not in (None, 0) else 1)
+
+
+class TgradishWorkerPool:
+    """Pool of long-lived processes that import tgradish once and run jobs.
+
+    Each worker runs one job at a time; output is streamed back over a pipe.
+    Cancelling a job kills its worker and a fresh one is spawned in its place,
+    so the pool stays warm.
+    """
+
+    def __init__(self, max_idle: int | None = None):
+        # multiprocessing и сам tgradish загружаются только к первой задаче, а не при старте окна
+        import multiprocessing
+
+        self.mp_context = multiprocessing.get_context("spawn")
+        self.max_idle = max(1, max_idle or os.cpu_count() or 1)
+        self._lock = threading.Lock()
+        self._idle: list[_TgradishWorker] = []
+        self._closed = False
+
+    def acquire(self) -> _TgradishWorker:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _TgradishWorker(self)
+
+    def _release(self, worker: _TgradishWorker):
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_idle and worker.process.is_alive():
+                self._idle.append(worker)
+                return
+        worker.conn.send(("exit",))
+
+    def _discard(self, worker: _TgradishWorker):
+        with self._lock:
+            if worker in self._idle:
+                self._idle.remove(worker)
+            # Замена нужна только для убитых при отмене; упавший процесс не перезапускаем в цикле
+            replace = worker.killed and not self._closed and not self._idle
+        if replace:
+            # Держим один прогретый процесс взамен убитого
+            try:
+                worker_new = _TgradishWorker(self)
+            except Exception:
+                return
+            with self._lock:
+                self._idle.append(worker_new)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            try:
+                worker.conn.send(("exit",))
+            except Exception:
+                worker.kill()
+
+
+class PooledTgradishRunner:
+    """Runner interface over :class:`TgradishWorkerPool` with real cancellation."""
+
+    def __init__(self, on_output_line, on_process_end, pool: TgradishWorkerPool, on_usage=None):
+        self._on_output_line = on_output_line
+        self._on_process_end = on_process_end
+        self._on_usage = on_usage
+        self._pool = pool
+        self._worker: _TgradishWorker | None = None
+        self._fallback: InProcessTgradishRunner | None = None
+        self._stop_requested = False
+
+    def run(self, tgradish_args: list[str]):
+        if self._stop_requested:
+            self._on_process_end(1)
+            return
+        self._on_output_line("$ tgradish " + " ".join(shlex.quote(a) for a in tgradish_args) + "\n")
+        try:
+            self._worker = self._pool.acquire()
+        except Exception as e:
+            self._on_output_line(f"Не удалось запустить процесс-исполнитель ({e}); выполняю в текущем процессе.\n")
+            self._fallback = InProcessTgradishRunner(self._on_output_line, self._on_process_end)
+            self._fallback.run(tgradish_args)
+            return
+        self._worker.run(tgradish_args, self._on_output_line, self._on_process_end, self._on_usage)
+        if self._stop_requested:
+            # Отмена пришла, пока выбирался процесс-исполнитель
+            self._worker.kill()
+
+    def terminate(self):
+        self._stop_requested = True
+        if self._worker is not None:
+            self._worker.kill()
+        elif self._fallback is not None:
+            self._fallback.terminate()
+
+
+class TaskContext:
+    """Handle passed to callable jobs (see :class:`CallableRunner`).
+
+    Gives the task access to its :class:`Job`, an output channel (lines go
+    through the job's progress parser like process output) and a way to run
+    child processes that are killed when the job is cancelled.
+    """
+
+    def __init__(self, job, on_output_line, on_usage=None):
+        self.job = job
+        self._on_output_line = on_output_line
+        self._on_usage = on_usage
+        self._lock = threading.Lock()
+        self._runs: set = set()
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def emit(self, text: str):
+        self._on_output_line(text if text.endswith("\n") else text + "\n")
+
+    def run(
+        self, command: list[str], stream: bool = True, cwd: str | None = None, on_line=None, timeout_s: float | None = None
+    ) -> int:
+        """Run ``command`` to completion and return its exit code.
+
+        With ``stream=True`` every output line is forwarded to the job;
+        otherwise output is collected and only emitted if the command fails.
+        ``on_line`` additionally receives every line (e.g. to track progress
+        of a quiet command); it is called on the engine loop thread. The
+        process runs on the shared event loop (:mod:`async_engine`) and is
+        stopped after ``timeout_s``. Safe to call from several threads at once.
+        """
+        if self.cancelled:
+            return 1
+        if stream:
+            self.emit(f"$ {' '.join(shlex.quote(c) for c in command)}")
+        collected: list[str] = []
+
+        def on_output(line: str):
+            if on_line is not None:
+                on_line(line)
+            if stream:
+                self._on_output_line(line)
+            elif len(collected) < 200:
+                collected.append(line)
+
+        future = engine_loop().submit(run_process(command, on_output, cwd, timeout_s))
+        with self._lock:
+            self._runs.add(future)
+        if self.cancelled:
+            future.cancel()
+        try:
+            code, usage = future.result()
+        except CancelledError:
+            # Процесс останавливается в цикле событий; задача уже может завершаться
+            return 1
+        except Exception as e:
+            self.emit(f"Не удалось запустить процесс: {e}")
+            return 1
+        finally:
+            with self._lock:
+                self._runs.discard(future)
+        if usage is not None and self._on_usage is not None:
+            self._on_usage(ResourceUsage(*usage))
+        if code != 0 and not stream and not self.cancelled:
+            self.emit(f"$ {' '.join(shlex.quote(c) for c in command)}")
+            for line in collected:
+                self._on_output_line(line)
+        return 1 if self.cancelled and code == 0 else code
+
+    def terminate(self):
+        self._cancelled.set()
+        with self._lock:
+            runs = list(self._runs)
+        for future in runs:
+            future.cancel()
+
+
+class CallableRunner:
+    """Run a Python task ``task(ctx) -> exit_code`` in the engine thread pool.
+
+    Used for jobs that orchestrate several processes (sample encodes,
+    segment encodes) or do their work natively in Python; the processes
+    themselves run on the engine loop through :meth:`TaskContext.run`.
+    """
+
+    def __init__(self, on_output_line, on_process_end, on_usage=None):
+        self._on_output_line = on_output_line
+        self._on_process_end = on_process_end
+        self._on_usage = on_usage
+        self._future: Future | None = None
+        self._ctx: TaskContext | None = None
+        self._stop_requested = False
+
+    def run(self, task, job=None):
+        if self._future is not None and not self._future.done():
+            raise RuntimeError("Уже запущен процесс. Остановите его перед новым запуском.")
+        self._ctx = TaskContext(job, self._on_output_line, self._on_usage)
+        if self._stop_requested:
+            self._ctx.terminate()
+        self._future = engine_loop().run_blocking(self._worker, task, self._ctx)
+
+    def terminate(self):
+        self._stop_requested = True
+        if self._ctx is not None:
+            self._ctx.terminate()
+
+    def _worker(self, task, ctx: TaskContext):
+        cpu_start = time.thread_time()
+        try:
+            code = int(task(ctx) or 0)
+        except Exception as e:
+            self._on_output_line(f"Ошибка выполнения: {e}\n")
+            code = 1
+        if self._on_usage is not None:
+            # Работа самой задачи в Python (например, правка EBML) идёт в этом потоке пула
+            self._on_usage(ResourceUsage(user_s=time.thread_time() - cpu_start))
+        if ctx.cancelled and code == 0:
+            code = 1
+        self._on_process_end(code)
+
+
+def _total_memory_mb() -> int | None:
+    """Return total physical memory in MiB, or None if it cannot be determined."""
+    try:
+        if sys.platform.startswith("win"):
+            import ctypes
+
+            class _MemStatus(ctypes.Structure):
+                _fields_ = [
+                    ("dwLength", ctypes.c_ulong),
+                    ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong),
+                    ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong),
+                    ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong),
+                    ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+                ]
+
+            stat = _MemStatus()
+            stat.dwLength = ctypes.sizeof(_MemStatus)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat)):  # type: ignore[attr-defined]
+                return int(stat.ullTotalPhys // (1024 * 1024))
+            return None
+        pages = os.sysconf("SC_PHYS_PAGES")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        if pages > 0 and page_size > 0:
+            return int(pages * page_size // (1024 * 1024))
+    except Exception:
+        pass
+    return None
+
+
+class Job:
+    """A single tgradish (or direct ffmpeg) invocation tracked by :class:`JobQueue`."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(
+        self,
+        job_id: int,
+        operation: str,
+        args: list[str],
+        input_path: str = "",
+        output_path: str = "",
+        memory_mb: int = 0,
+        backend: str = "tgradish",
+    ):
+        self.id = job_id
+        self.operation = operation  # 'convert' | 'spoof'
+        self.backend = backend  # 'tgradish' | 'ffmpeg' | 'task'
+        self.args = args
+        self.task = None  # callable(TaskContext) -> int для backend='task'
+        self.stats: dict = {}
+        self.input_path = input_path
+        self.output_path = output_path
+        self.memory_mb = memory_mb
+        self.status = Job.QUEUED
+        self.exit_code: int | None = None
+        self.progress = 0
+        self.parser = ProgressParser()
+        self.last_event: ProgressEvent | None = None
+        self.eta_s: float | None = None
+        self.runner: BackgroundProcessRunner | PooledTgradishRunner | CallableRunner | None = None
+        self.inprocess = False
+        self.cancel_requested = False
+        self.timed_out = False
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.cache_key: str | None = None
+        self.cached = False
+        self.media = None  # media_probe.MediaInfo, если вход уже проанализирован
+        self.fast_path = False  # можно ли скопировать/перепаковать готовый стикер вместо кодирования
+        self.then = None  # шаг после успешного завершения: then(output_path, emit) -> int
+        self.group = ""  # пакет, между которыми политика fair делит исполнителей
+        self.submitted_at = time.monotonic()
+        self.predicted_s: float | None = None  # ожидаемая длительность по DurationModel
+        self.usage = ResourceUsage()
+        self.log = JobLog(DEFAULT_MAX_LINES)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    @property
+    def total_duration_s(self) -> float | None:
+        return self.parser.duration_s
+
+    @property
+    def settings_key(self) -> str:
+        """Operation, backend and task type: jobs with the same key encode at a similar speed."""
+        key = f"{self.operation}/{self.backend}"
+        return f"{key}/{type(self.task).__name__}" if self.task is not None else key
+
+    @property
+    def remaining_s(self) -> float | None:
+        """Best guess of the time left: encoder ETA while running, else the prediction."""
+        if self.is_finished:
+            return 0.0
+        if self.status == Job.RUNNING and self.eta_s is not None:
+            return self.eta_s
+        if self.predicted_s is None:
+            return None
+        return max(0.0, self.predicted_s - (self.elapsed_s or 0.0))
+
+    def apply_progress(self, event: ProgressEvent):
+        """Update progress and ETA from a parsed encoder event."""
+        previous = self.last_event
+        if previous is not None:
+            # Незаполненные поля (например, в финальном блоке) берём из прошлого события
+            for name in ProgressEvent.__slots__:
+                if getattr(event, name) is None:
+                    setattr(event, name, getattr(previous, name))
+        self.last_event = event
+        total = self.parser.duration_s
+        if event.out_time_s is None or not total:
+            return
+        self.progress = max(0, min(100, int(event.out_time_s / total * 100)))
+        remaining = max(0.0, total - event.out_time_s)
+        if event.speed:
+            self.eta_s = remaining / event.speed
+        elif self.elapsed_s and event.out_time_s > 0:
+            self.eta_s = remaining * self.elapsed_s / event.out_time_s
+
+    @property
+    def elapsed_s(self) -> float | None:
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def metrics(self) -> dict:
+        """Resource metrics of the job: wall/CPU time, peak RSS, average fps, bytes."""
+        wall = self.elapsed_s
+        frames = self.last_event.frame if self.last_event else None
+
+        def size_of(path: str) -> int | None:
+            try:
+                return os.path.getsize(path) if path else None
+            except OSError:
+                return None
+
+        rss = self.usage.peak_rss_kb
+        media = self.media
+        return {
+            "wall_s": None if wall is None else round(wall, 3),
+            "cpu_user_s": round(self.usage.user_s, 3),
+            "cpu_sys_s": round(self.usage.sys_s, 3),
+            "peak_rss_mb": None if rss is None else round(rss / 1024, 1),
+            "frames": frames,
+            "avg_fps": round(frames / wall, 2) if frames and wall else None,
+            "input_bytes": size_of(self.input_path),
+            "output_bytes": size_of(self.output_path) if self.status == Job.DONE else None,
+            # Описание входа, по которому DurationModel учится предсказывать длительность
+            "settings": self.settings_key,
+            "width": media.width if media else None,
+            "height": media.height if media else None,
+            "input_fps": media.fps if media else None,
+            "duration_s": self.parser.duration_s or (media.duration_s if media else None),
+            "fast_path": self.stats.get("fast_path"),
+        }
+
+    def to_dict(self) -> dict:
+        elapsed = self.elapsed_s
+        return {
+            "id": self.id,
+            "operation": self.operation,
+            "input": self.input_path,
+            "output": self.output_path,
+            "status": self.status,
+            "exit_code": self.exit_code,
+            "elapsed_s": None if elapsed is None else round(elapsed, 3),
+            "cached": self.cached,
+            "backend": self.backend,
+            "frames": self.last_event.frame if self.last_event else None,
+            "fps": self.last_event.fps if self.last_event else None,
+            "speed": self.last_event.speed if self.last_event else None,
+            "predicted_s": None if self.predicted_s is None else round(self.predicted_s, 1),
+            **({"stats": self.stats} if self.stats else {}),
+            **({"log": self.log.saved_path} if self.log.saved_path else {}),
+        }
+
+
+class JobQueue:
+    """Bounded worker pool running tgradish jobs concurrently.
+
+    At most ``max_workers`` jobs run at the same time (defaults to the CPU
+    count), and a job is only started while the sum of the running jobs'
+    memory estimates fits into ``memory_budget_mb``. Without a tgradish CLI,
+    jobs run in a :class:`TgradishWorkerPool` of long-lived processes, so
+    they are concurrent and cancellable as well.
+
+    Callbacks are invoked from worker threads: ``on_job_output(job, line)``
+    (may be None when ``job.log`` is enough), ``on_job_update(job)`` and the
+    optional ``on_job_progress(job, event)``, called with each
+    :class:`ffmpeg_backend.ProgressEvent` parsed from the job output.
+
+    If ``metrics`` (:class:`job_metrics.MetricsRecorder`) is set, every
+    finished job is passed to its ``record`` method.
+
+    Output of every job is kept in ``job.log`` (:class:`job_log.JobLog`),
+    the last ``log_lines`` lines in memory. With ``log_dir`` set, the full
+    output of a failed job is saved there and ``job.log.saved_path`` points
+    to it.
+
+    If a ``cache`` (:class:`conversion_cache.ConversionCache`) is set, convert
+    jobs with a known output path are looked up before encoding and stored
+    after a successful run. If a ``metadata_index``
+    (:class:`media_probe.MetadataIndex`) is set, convert inputs are probed in
+    the background right after submission: the duration makes progress
+    determinate from the first frame and the resolution refines the job's
+    memory estimate.
+
+    Convert jobs submitted with ``fast_path=True`` are checked against the
+    sticker constraints first (:func:`compliance.classify`): a compliant
+    input is copied, one that only needs a new container is remuxed with
+    ``-c:v copy``, and ``job.stats["fast_path"]`` records which was done.
+    For tgradish jobs the result then gets the duration tgradish convert
+    would have written (:data:`webm_spoof.TGRADISH_DURATION_S`).
+
+    A job submitted with ``then`` (e.g. :class:`webm_spoof.SpoofStep`) runs
+    that step on its output after success, within the same job: the cache
+    keeps the output as produced by the encoder, the step is applied to
+    fresh and cached results alike.
+
+    With a ``predictor`` (:class:`duration_model.DurationModel`) every job
+    gets ``job.predicted_s`` once its input is probed, and the predictor
+    learns from finished jobs. ``policy`` picks the next job to start:
+    ``fifo`` in submission order, ``sjf`` the shortest predicted job first
+    (waiting time counts towards it, so long jobs are not starved), ``fair``
+    the group (``submit(group=...)``) with the fewest running jobs, shortest
+    first within it. :meth:`estimate` turns the predictions into ETAs.
+
+    Processes run on the shared event loop of :mod:`async_engine`, and
+    blocking preparation (probing, cache lookup) in its thread pool, so
+    dozens of concurrent jobs do not need a thread each. With
+    ``job_timeout_s`` set, a job still running after that many seconds is
+    stopped and fails with :data:`async_engine.TIMEOUT_EXIT_CODE`.
+    """
+
+    DEFAULT_JOB_MEMORY_MB = 300
+    MEMORY_BUDGET_FRACTION = 0.75
+    # На сколько секунд «короче» становится задача за каждую секунду ожидания (sjf, fair)
+    SJF_AGING = 0.5
+
+    def __init__(
+        self,
+        on_job_output,
+        on_job_update,
+        on_job_progress=None,
+        max_workers: int | None = None,
+        memory_budget_mb: int | None = None,
+        cache=None,
+        metadata_index=None,
+        metrics=None,
+        log_dir: str | None = None,
+        log_lines: int = DEFAULT_MAX_LINES,
+        predictor=None,
+        policy: str = SCHEDULE_FIFO,
+        job_timeout_s: float | None = None,
+    ):
+        self._on_job_output = on_job_output
+        self._on_job_update = on_job_update
+        self._on_job_progress = on_job_progress
+        self.cache = cache
+        self.metadata_index = metadata_index
+        self.metrics = metrics
+        self.log_dir = log_dir
+        self.log_lines = log_lines
+        self.predictor = predictor
+        self.policy = policy if policy in SCHEDULE_POLICIES else SCHEDULE_FIFO
+        self.job_timeout_s = job_timeout_s
+        self._probe_queue: list[Job] = []
+        self._worker_pool: TgradishWorkerPool | None = None
+        self._probe_thread: threading.Thread | None = None
+        self._lock = threading.RLock()
+        self._jobs: list[Job] = []
+        self._pending: list[Job] = []
+        self._running: list[Job] = []
+        self._next_id = 1
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        if memory_budget_mb is None:
+            total = _total_memory_mb()
+            memory_budget_mb = int(total * JobQueue.MEMORY_BUDGET_FRACTION) if total else None
+        self.memory_budget_mb = memory_budget_mb
+
+    # ------------------------------ Public API ----------------------------- #
+    @property
+    def jobs(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs)
+
+    def set_max_workers(self, value: int):
+        with self._lock:
+            self.max_workers = max(1, int(value))
+            if self._worker_pool is not None:
+                self._worker_pool.max_idle = self.max_workers
+        self._pump()
+
+    def set_policy(self, policy: str):
+        if policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"Неизвестная политика очереди: {policy}")
+        with self._lock:
+            self.policy = policy
+        self._pump()
+
+    def estimate(self) -> tuple[dict[int, float | None], float | None]:
+        """Predicted seconds until each active job finishes, and until the whole queue is done.
+
+        Queued jobs are laid out on ``max_workers`` slots in the order the
+        policy would start them; the memory budget is not simulated. A job
+        behind one without a prediction gets ``None``, as does the total.
+        """
+        with self._lock:
+            running = list(self._running)
+            order = self._schedule_order()
+            workers = self.max_workers
+        etas: dict[int, float | None] = {}
+        slots: list[float | None] = []
+        for job in running:
+            etas[job.id] = job.remaining_s
+            slots.append(job.remaining_s)
+        slots += [0.0] * max(0, workers - len(slots))
+        for job in order:
+            # Следующая задача займёт исполнителя, который освободится раньше всех
+            known = [s for s in slots if s is not None]
+            if not known:
+                etas[job.id] = None
+                continue
+            index = slots.index(min(known))
+            finish = None if job.predicted_s is None else slots[index] + job.predicted_s
+            etas[job.id] = finish
+            slots[index] = finish
+        total = None if any(v is None for v in etas.values()) else max(etas.values(), default=0.0)
+        return etas, total
+
+    def shutdown(self):
+        """Cancel all jobs and stop pooled worker processes."""
+        self.cancel_all()
+        if self._worker_pool is not None:
+            self._worker_pool.shutdown()
+
+    def submit(
+        self,
+        operation: str,
+        args: list[str],
+        input_path: str = "",
+        output_path: str = "",
+        memory_mb: int | None = None,
+        backend: str = "tgradish",
+        task=None,
+        fast_path: bool = False,
+        then=None,
+        group: str = "",
+    ) -> Job:
+        """Queue a job.
+
+        ``args`` are tgradish arguments, or ffmpeg arguments for
+        ``backend='ffmpeg'``. For ``backend='task'`` the callable ``task`` is
+        run with a :class:`TaskContext` and ``args`` is only descriptive.
+        ``fast_path`` allows skipping the encode for inputs that already are
+        stickers; only set it for plain converts without custom arguments.
+        ``then(output_path, emit) -> exit_code`` post-processes the output.
+        ``group`` identifies the batch for the ``fair`` policy.
+        """
+        with self._lock:
+            job = Job(
+                self._next_id,
+                operation,
+                args,
+                input_path=input_path,
+                output_path=output_path,
+                memory_mb=JobQueue.DEFAULT_JOB_MEMORY_MB if memory_mb is None else memory_mb,
+                backend=backend,
+            )
+            job.task = task
+            job.fast_path = fast_path and operation == "convert" and bool(output_path) and bool(input_path)
+            job.then = then if output_path else None
+            job.group = group
+            job.log = JobLog(self.log_lines, self.log_dir, name=_log_name(job))
+            if backend == "ffmpeg":
+                # Баннер ffmpeg сообщает полную длительность входа, а кодируется только отрезок после -ss
+                job.parser.duration_s = input_duration_limit(args)
+            self._predict(job)
+            self._next_id += 1
+            self._jobs.append(job)
+            self._pending.append(job)
+            if self.metadata_index is not None and operation == "convert" and input_path:
+                self._probe_queue.append(job)
+                if self._probe_thread is None or not self._probe_thread.is_alive():
+                    self._probe_thread = threading.Thread(target=self._probe_worker, daemon=True)
+                    self._probe_thread.start()
+        self._on_job_update(job)
+        self._pump()
+        return job
+
+    def cancel(self, job_id: int):
+        with self._lock:
+            job = next((j for j in self._jobs if j.id == job_id), None)
+            if job is None or job.is_finished:
+                return
+            job.cancel_requested = True
+            if job in self._pending:
+                self._pending.remove(job)
+                job.status = Job.CANCELLED
+                runner = None
+            else:
+                runner = job.runner
+        if runner is not None:
+            runner.terminate()
+        else:
+            self._on_job_update(job)
+
+    def cancel_all(self):
+        for job in self.jobs:
+            self.cancel(job.id)
+
+    def clear_finished(self):
+        with self._lock:
+            self._jobs = [j for j in self._jobs if not j.is_finished]
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._pending) + len(self._running)
+
+    # ------------------------------- Probing ------------------------------- #
+    def _probe_worker(self):
+        while True:
+            with self._lock:
+                if not self._probe_queue:
+                    self._probe_thread = None
+                    return
+                job = self._probe_queue.pop(0)
+            if job.status != Job.QUEUED:
+                continue
+            self._ensure_media(job)
+            self._pump()
+
+    def _ensure_media(self, job: Job):
+        if job.media is not None or self.metadata_index is None:
+            return
+        try:
+            info = self.metadata_index.probe(job.input_path)
+        except Exception as e:
+            self._emit(job, f"Не удалось получить метаданные: {e}\n")
+            return
+        if info is None:
+            return
+        with self._lock:
+            job.media = info
+            if job.status == Job.QUEUED:
+                # Задача может запускать несколько кодировщиков сразу (сегменты, пробы)
+                job.memory_mb = info.estimated_memory_mb(job.memory_mb) * getattr(job.task, "processes", 1)
+            if job.parser.duration_s is None and info.duration_s:
+                job.parser.duration_s = info.duration_s
+            self._predict(job)
+
+    def _predict(self, job: Job):
+        if self.predictor is None:
+            return
+        try:
+            job.predicted_s = self.predictor.predict(job)
+        except Exception:
+            # Прогноз влияет только на порядок очереди
+            job.predicted_s = None
+
+    # ------------------------------ Scheduling ----------------------------- #
+    def _can_start(self, job: Job) -> bool:
+        if len(self._running) >= self.max_workers:
+            return False
+        if not self._running:
+            # Хотя бы одна задача должна выполняться даже при малом бюджете памяти
+            return True
+        if self.memory_budget_mb is not None:
+            used = sum(j.memory_mb for j in self._running)
+            if used + job.memory_mb > self.memory_budget_mb:
+                return False
+        return True
+
+    def _schedule_order(self) -> list[Job]:
+        """Pending jobs in the order the policy would start them (caller holds the lock)."""
+        if self.policy == SCHEDULE_FIFO:
+            return list(self._pending)
+        now = time.monotonic()
+        known = [j.predicted_s for j in self._pending if j.predicted_s is not None]
+        # Ещё не проанализированные задачи считаются средними, а не самыми короткими
+        typical = sum(known) / len(known) if known else 0.0
+
+        def shortness(job: Job) -> float:
+            predicted = typical if job.predicted_s is None else job.predicted_s
+            return predicted - JobQueue.SJF_AGING * (now - job.submitted_at)
+
+        ordered = sorted(self._pending, key=shortness)
+        if self.policy == SCHEDULE_SJF:
+            return ordered
+        groups: dict[str, list[Job]] = {}
+        for job in ordered:
+            groups.setdefault(job.group, []).append(job)
+        active = {name: sum(1 for j in self._running if j.group == name) for name in groups}
+        result = []
+        while groups:
+            # Следующей обслуживается группа, у которой сейчас меньше всего исполнителей
+            name = min(groups, key=lambda g: (active[g], groups[g][0].submitted_at))
+            result.append(groups[name].pop(0))
+            active[name] += 1
+            if not groups[name]:
+                del groups[name]
+        return result
+
+    def _expected_concurrency(self) -> int:
+        with self._lock:
+            return max(1, min(self.max_workers, len(self._running) + len(self._pending)))
+
+    def _pump(self):
+        to_start: list[Job] = []
+        with self._lock:
+            has_cli = DependencyChecker.has_tgradish_cli()
+            for job in self._pending:
+                job.inprocess = job.backend == "tgradish" and not has_cli
+            for job in self._schedule_order():
+                if not self._can_start(job):
+                    # Не обходим задачу, которой не хватает памяти: иначе меньшие обгоняли бы её бесконечно
+                    break
+                self._pending.remove(job)
+                job.status = Job.RUNNING
+                job.started_at = time.monotonic()
+                job.runner = self._make_runner(job)
+                self._running.append(job)
+                to_start.append(job)
+        for job in to_start:
+            self._on_job_update(job)
+            if self.job_timeout_s:
+                engine_loop().call_later(self.job_timeout_s, self._on_timeout, job)
+            self._start(job)
+
+    def _make_runner(self, job: Job):
+        on_output = lambda line, j=job: self._handle_output(j, line)  # noqa: E731
+        on_end = lambda code, j=job: self._on_job_end(j, code)  # noqa: E731
+        on_usage = job.usage.add
+        if job.inprocess:
+            if self._worker_pool is None:
+                self._worker_pool = TgradishWorkerPool(max_idle=self.max_workers)
+            return PooledTgradishRunner(
+                on_output_line=on_output, on_process_end=on_end, pool=self._worker_pool, on_usage=on_usage
+            )
+        if job.backend == "task":
+            return CallableRunner(on_output_line=on_output, on_process_end=on_end, on_usage=on_usage)
+        return BackgroundProcessRunner(on_output_line=on_output, on_process_end=on_end, on_usage=on_usage)
+
+    def _emit(self, job: Job, line: str):
+        job.log.write(line)
+        if self._on_job_output is not None:
+            self._on_job_output(job, line)
+
+    def _handle_output(self, job: Job, line: str):
+        event = job.parser.feed(line)
+        self._emit(job, line)
+        if event is not None:
+            job.apply_progress(event)
+            if self._on_job_progress is not None:
+                self._on_job_progress(job, event)
+
+    def _start(self, job: Job):
+        if job.operation == "convert" and (self.metadata_index is not None or self.cache is not None or job.fast_path):
+            # Анализ и хэширование входа могут быть долгими, поэтому выполняются вне вызывающего потока
+            future = engine_loop().run_blocking(self._prepare_and_launch, job)
+            future.add_done_callback(lambda f, j=job: self._on_prepared(j, f))
+            return
+        self._launch(job)
+
+    def _on_prepared(self, job: Job, future):
+        error = future.exception()
+        if error is None or job.status != Job.RUNNING:
+            return
+        # Иначе задача навсегда осталась бы «выполняется» и держала бы место в очереди
+        self._emit(job, f"Ошибка подготовки задачи: {error}\n")
+        self._on_job_end(job, 1)
+
+    def _prepare_and_launch(self, job: Job):
+        self._ensure_media(job)
+        if job.fast_path and self._try_fast_path(job):
+            return
+        cache = self.cache
+        # Задачи с несколькими результатами (cacheable=False) кэш целиком не восстановит
+        if cache is None or not job.output_path or not getattr(job.task, "cacheable", True):
+            self._launch(job)
+            return
+        try:
+            job.cache_key = cache.key_for(job.input_path, self._cache_args(job), job.output_path)
+            hit = cache.fetch(job.cache_key, job.output_path)
+        except Exception as e:
+            self._emit(job, f"Кэш недоступен: {e}\n")
+            job.cache_key = None
+            hit = False
+        if hit:
+            job.cached = True
+            self._emit(job, f"Результат взят из кэша: {job.output_path}\n")
+            self._on_job_end(job, 0)
+        else:
+            self._launch(job)
+
+    def _try_fast_path(self, job: Job) -> bool:
+        """Copy or remux an input that already meets the sticker constraints; False if it must be encoded."""
+        media = job.media
+        if media is None:
+            from media_probe import probe_media
+
+            media = job.media = probe_media(job.input_path)
+        decision, reasons = classify(media, job.input_path)
+        if decision == ENCODE:
+            self._emit(job, f"Нужно перекодирование: {', '.join(reasons)}\n")
+            return False
+        job.stats["fast_path"] = decision
+        if job.backend == "tgradish" and job.then is None:
+            # tgradish convert всегда подменяет длительность: заголовок не должен зависеть от того, был ли путь быстрым
+            from webm_spoof import TGRADISH_DURATION_S, SpoofStep
+
+            job.then = SpoofStep(TGRADISH_DURATION_S)
+        if job.cancel_requested:
+            self._on_job_end(job, 1)
+            return True
+        if decision == COPY:
+            self._emit(job, "Вход уже соответствует требованиям стикера, копирование без перекодирования\n")
+            try:
+                if os.path.abspath(job.input_path) != os.path.abspath(job.output_path):
+                    os.makedirs(os.path.dirname(os.path.abspath(job.output_path)), exist_ok=True)
+                    shutil.copyfile(job.input_path, job.output_path)
+            except OSError as e:
+                self._emit(job, f"Не удалось скопировать: {e}\n")
+                self._on_job_end(job, 1)
+                return True
+            self._on_job_end(job, 0)
+            return True
+        self._emit(job, f"Перепаковка без перекодирования ({', '.join(reasons)})\n")
+        # Поток копируется процессом ffmpeg даже для задач tgradish
+        runner = BackgroundProcessRunner(
+            on_output_line=lambda line, j=job: self._handle_output(j, line),
+            on_process_end=lambda code, j=job: self._on_job_end(j, code),
+            on_usage=job.usage.add,
+        )
+        with self._lock:
+            # Отмена после этой точки остановит уже новый исполнитель (см. cancel)
+            job.runner = runner
+        if job.cancel_requested:
+            self._on_job_end(job, 1)
+            return True
+        try:
+            job.runner.run([tool_registry().which("ffmpeg") or "ffmpeg", *build_remux_command(job.input_path, job.output_path)])
+        except Exception as e:
+            self._emit(job, f"Ошибка запуска: {e}\n")
+            self._on_job_end(job, 1)
+        return True
+
+    def _cache_args(self, job: Job) -> list[str]:
+        """Arguments that identify the job's result in the conversion cache.
+
+        ffmpeg jobs are keyed on the tuning a lone job would get, which
+        depends on the input and the encoder profile but not on how many
+        jobs happen to share the CPU, so a batch still hits entries made by
+        a single run and vice versa.
+        """
+        if job.backend == "ffmpeg":
+            return tune_ffmpeg_args(job.args, 1, job.media)
+        return job.args
+
+    def _launch_args(self, job: Job) -> list[str]:
+        """Arguments the job's runner will get (tuned for ffmpeg jobs)."""
+        if job.backend == "ffmpeg":
+            # Потоки и скорость подбираются при запуске: к этому моменту известно, сколько задач делят ядра
+            return tune_ffmpeg_args(job.args, self._expected_concurrency(), job.media)
+        return job.args
+
+    def _launch(self, job: Job):
+        if job.cancel_requested:
+            # Отменена, пока анализировался вход; исполнитель ещё ничего не запустил
+            self._on_job_end(job, 1)
+            return
+        try:
+            if job.inprocess:
+                job.runner.run(job.args)  # type: ignore[union-attr]
+            elif job.backend == "task":
+                job.runner.run(job.task, job)  # type: ignore[union-attr]
+            elif job.backend == "ffmpeg":
+                args = self._launch_args(job)
+                job.runner.run([tool_registry().which("ffmpeg") or "ffmpeg", *args], cwd=None)  # type: ignore[union-attr]
+            else:
+                cmd = [*DependencyChecker.tgradish_command(), *job.args]
+                job.runner.run(cmd, cwd=None)  # type: ignore[union-attr]
+        except Exception as e:
+            self._emit(job, f"Ошибка запуска: {e}\n")
+            self._on_job_end(job, 1)
+
+    def _on_timeout(self, job: Job):
+        with self._lock:
+            if job.status != Job.RUNNING or job.cancel_requested:
+                return
+            job.timed_out = True
+            runner = job.runner
+        self._emit(job, f"Превышено время выполнения задачи ({self.job_timeout_s:g} с), задача остановлена\n")
+        if runner is not None:
+            runner.terminate()
+
+    def _on_job_end(self, job: Job, exit_code: int):
+        if job.timed_out:
+            # Задача могла успеть завершиться одновременно с таймаутом — результату не доверяем
+            exit_code = TIMEOUT_EXIT_CODE
+        if exit_code == 0 and job.backend == "ffmpeg" and not job.cancel_requested:
+            # В отличие от tgradish, прямой ffmpeg кодирует один раз без подгонки под размер
+            try:
+                size = os.path.getsize(job.output_path)
+            except OSError:
+                size = 0
+            if size > STICKER_MAX_BYTES:
+                self._emit(
+                    job,
+                    f"Внимание: файл {size / 1024:.0f} КБ — больше лимита стикера {STICKER_MAX_BYTES // 1024} КБ; "
+                    "уменьшить его поможет целевой размер (--target-size-kb, в GUI — «Целевой размер»).\n",
+                )
+        if exit_code == 0 and job.cache_key and not job.cached and not job.cancel_requested:
+            try:
+                self.cache.store(job.cache_key, job.output_path)
+            except Exception as e:
+                self._emit(job, f"Не удалось сохранить в кэш: {e}\n")
+        if exit_code == 0 and job.then is not None and not job.cancel_requested:
+            try:
+                exit_code = int(job.then(job.output_path, lambda text, j=job: self._emit(j, text.rstrip("\n") + "\n")) or 0)
+            except Exception as e:
+                self._emit(job, f"Ошибка выполнения: {e}\n")
+                exit_code = 1
+        with self._lock:
+            if job in self._running:
+                self._running.remove(job)
+            job.exit_code = exit_code
+            job.finished_at = time.monotonic()
+            job.eta_s = None
+            if job.cancel_requested:
+                job.status = Job.CANCELLED
+            elif exit_code == 0:
+                job.status = Job.DONE
+                job.progress = 100
+            else:
+                job.status = Job.FAILED
+        if job.status == Job.FAILED:
+            # Полный журнал нужен для разбора ошибки; в памяти остаётся только хвост
+            path = job.log.keep()
+            if path:
+                self._emit(job, f"Журнал сохранён: {path}\n")
+        else:
+            job.log.discard()
+        if self.predictor is not None:
+            try:
+                self.predictor.observe(job)
+            except Exception as e:
+                self._emit(job, f"Не удалось обновить прогноз длительности: {e}\n")
+        if self.metrics is not None:
+            try:
+                self.metrics.record(job)
+            except Exception as e:
+                self._emit(job, f"Не удалось записать метрики: {e}\n")
+        self._on_job_update(job)
+        self._pump()
+
+
+def _log_name(job: Job) -> str:
+    stem = os.path.splitext(os.path.basename(job.input_path))[0]
+    stem = "".join(c if c.isalnum() or c in "-_." else "_" for c in stem)[:60]
+    return f"{job.operation}-{job.id}" + (f"-{stem}" if stem else "")
+
+
+# ---------------------- Embedded ffmpeg PATH bootstrap ---------------------- #
+def user_cache_dir(*parts: str) -> str:
+    """Return (and create) a per-user cache directory for the application."""
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+        path = os.path.join(base, "VideoToSticker", "cache", *parts)
+    elif sys.platform == "darwin":
+        path = os.path.join(os.path.expanduser("~/Library/Caches"), "VideoToSticker", *parts)
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        path = os.path.join(base, "videotosticker", *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def resolve_output_path(input_path: str, output: str, suffix: str) -> str:
+    """Return the output file for ``input_path``.
+
+    ``output`` may be a file path, a directory (the file is named after the
+    input stem plus ``suffix``) or empty (the file goes next to the input).
+    """
+    if output and not os.path.isdir(output):
+        return output
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    folder = output or os.path.dirname(input_path)
+    return os.path.join(folder, stem + suffix)
+
+
+def default_convert_output(input_path: str, output: str = "") -> str:
+    """Sticker path for ``input_path`` that never overwrites the input itself."""
+    target = resolve_output_path(input_path, output, ".webm")
+    if os.path.abspath(target) == os.path.abspath(input_path):
+        target = resolve_output_path(input_path, output, "_sticker.webm")
+    return target
+
+
+def build_convert_args(input_path: str, output_path: str = "", extra_parts: list[str] | tuple = ()) -> list[str]:
+    args: list[str] = ["convert", "-i", input_path]
+    if output_path:
+        args += ["-o", output_path]
+    return args + list(extra_parts)
+
+
+_encoder_profile: EncoderProfile | None = None
+_encoder_profile_loaded = False
+
+
+def encoder_profile_path() -> str:
+    return os.path.join(user_cache_dir("tuning"), "encoder_profile.json")
+
+
+def encoder_profile() -> EncoderProfile | None:
+    """Calibrated encoder profile of this machine, loaded once (None if not calibrated)."""
+    global _encoder_profile, _encoder_profile_loaded
+    if not _encoder_profile_loaded:
+        _encoder_profile = load_profile(encoder_profile_path())
+        _encoder_profile_loaded = True
+    return _encoder_profile
+
+
+def set_encoder_profile(profile: EncoderProfile | None):
+    """Use ``profile`` for subsequent jobs (e.g. right after calibration)."""
+    global _encoder_profile, _encoder_profile_loaded
+    _encoder_profile, _encoder_profile_loaded = profile, True
+
+
+def tuned_encoder_settings(concurrent_jobs: int = 1, media=None, output_width: int = STICKER_WIDTH) -> EncoderSettings:
+    """Encoder settings for one job sharing the CPU with ``concurrent_jobs - 1`` others."""
+    return auto_settings(
+        os.cpu_count(),
+        concurrent_jobs,
+        getattr(media, "width", None),
+        getattr(media, "height", None),
+        output_width=output_width,
+        profile=encoder_profile(),
+    )
+
+
+# Синтетический клип для калибровки: детализированный, с движением, 720p как типичный вход
+CALIBRATION_SOURCE = "testsrc2=size=1280x720:rate=30:duration=3"
+
+
+def calibrate_encoder(on_progress=None) -> EncoderProfile:
+    """Measure the best encoder settings on this machine and save them as the profile."""
+    import tempfile
+
+    from encoder_tuning import calibrate
+
+    ffmpeg = tool_registry().which("ffmpeg") or "ffmpeg"
+
+    def command_for(settings: EncoderSettings, output: str) -> list[str]:
+        return [
+            ffmpeg,
+            *build_convert_command(
+                CALIBRATION_SOURCE,
+                output,
+                progress=False,
+                input_options=["-f", "lavfi"],
+                encoder_args=_supported_output_args(settings),
+            ),
+        ]
+
+    with tempfile.TemporaryDirectory(prefix="encoder_calibration_") as work:
+        profile = calibrate(command_for, work_dir=work, on_progress=on_progress)
+    info = tool_registry().ffmpeg()
+    profile.ffmpeg = info.version if info is not None else ""
+    profile.save(encoder_profile_path())
+    set_encoder_profile(profile)
+    return profile
+
+
+def _supported_output_args(settings: EncoderSettings) -> list[str]:
+    info = tool_registry().ffmpeg()
+    return settings.output_args(
+        row_mt_supported=info is not None and info.supports_option("libvpx-vp9", "row-mt"),
+        tiles_supported=info is not None and info.supports_option("libvpx-vp9", "tile-columns"),
+    )
+
+
+def vp9_encoder_args(
+    concurrent_jobs: int = 1,
+    media=None,
+    speed: int | None = None,
+    output_width: int = STICKER_WIDTH,
+    threads: int | None = None,
+) -> list[str]:
+    """Tuned libvpx-vp9 options limited to what the ffmpeg found in PATH supports.
+
+    ``speed`` and ``threads`` override the tuned values; ``-threads`` only
+    changes how fast the stream is made, not the stream itself.
+    """
+    settings = tuned_encoder_settings(concurrent_jobs, media, output_width)
+    if speed is not None:
+        settings.speed = speed
+    if threads is not None:
+        settings.threads = threads
+    return _supported_output_args(settings)
+
+
+def fast_decode_for(media) -> tuple[list[str], str]:
+    """:func:`ffmpeg_backend.fast_decode_options` for a probed :class:`media_probe.MediaInfo` (or None)."""
+    return fast_decode_options(
+        getattr(media, "video_codec", None),
+        getattr(media, "width", None),
+        getattr(media, "height", None),
+        getattr(media, "fps", None),
+    )
+
+
+def tune_ffmpeg_args(args: list[str], concurrent_jobs: int = 1, media=None) -> list[str]:
+    """Apply encoder tuning and the cheap decode path to a command from :func:`build_convert_command`."""
+    settings = tuned_encoder_settings(concurrent_jobs, media)
+    decode_options, video_filter = fast_decode_for(media)
+    return merge_encoder_options(
+        args,
+        [*settings.input_args(), *decode_options],
+        ["-vf", video_filter, *_supported_output_args(settings)],
+    )
+
+
+def plan_convert(
+    input_path: str,
+    output: str = "",
+    extra_parts: list[str] | tuple = (),
+    backend: str = "tgradish",
+    start_s: float = 0.0,
+    duration_s: float | None = None,
+) -> tuple[list[str], str]:
+    """Return ``(args, output_path)`` for a convert job on the given backend.
+
+    Both backends get an explicit output file, so the queue can look it up in
+    the cache and try the fast path; with an empty ``output`` it is the name
+    tgradish would pick itself, except that a ``.webm`` input is never
+    overwritten. ``start_s`` and ``duration_s`` (ffmpeg backend only) trim the
+    input by seeking before ``-i``; ``-ss``/``-t``/``-to`` found in
+    ``extra_parts`` are moved there too. The ffmpeg backend never encodes
+    more than :data:`ffmpeg_backend.STICKER_MAX_DURATION_S`, like tgradish.
+    """
+    target = default_convert_output(input_path, output)
+    if backend == "ffmpeg":
+        seek_start, seek_length, extra_parts = split_seek_options(extra_parts)
+        input_options = seek_options(start_s or seek_start, sticker_length(duration_s or seek_length))
+        return build_convert_command(input_path, target, extra_parts, input_options=input_options), target
+    return build_convert_args(input_path, target, extra_parts), target
+
+
+def build_spoof_args(input_path: str, output_path: str, extra_parts: list[str] | tuple = ()) -> list[str]:
+    return ["spoof", input_path, output_path, *extra_parts]
+
+
+def inject_embedded_ffmpeg_into_path():
+    """If ffmpeg is shipped alongside the app (PyInstaller), add it to PATH.
+
+    Search locations:
+    - In a frozen app: inside sys._MEIPASS under 'ffmpeg' or 'ffmpeg_bin'
+    - Next to the executable/script: './ffmpeg' or './ffmpeg_bin'
+    """
+    if tool_registry().which("ffmpeg"):
+        return
+
+    candidates: list[str] = []
+
+    # When frozen by PyInstaller
+    meipass = getattr(sys, "_MEIPASS", None)
+    if meipass and isinstance(meipass, str):
+        candidates.extend([
+            os.path.join(meipass, "ffmpeg"),
+            os.path.join(meipass, "ffmpeg_bin"),
+            meipass,
+        ])
+
+    # Directory of the executable/script
+    base_dir = os.path.dirname(sys.executable if getattr(sys, "frozen", False) else os.path.abspath(__file__))
+    candidates.extend([
+        os.path.join(base_dir, "ffmpeg"),
+        os.path.join(base_dir, "ffmpeg_bin"),
+        base_dir,
+    ])
+
+    ffmpeg_names = ["ffmpeg.exe", "ffmpeg"]
+    selected_dir = None
+    for d in candidates:
+        try:
+            if not d or not os.path.isdir(d):
+                continue
+            for name in ffmpeg_names:
+                fp = os.path.join(d, name)
+                if os.path.isfile(fp):
+                    selected_dir = d
+                    break
+            if selected_dir:
+                break
+        except Exception:
+            continue
+
+    if selected_dir and selected_dir not in os.environ.get("PATH", ""):
+        os.environ["PATH"] = selected_dir + os.pathsep + os.environ.get("PATH", "")
@@ -0,0 +1,240 @@
+"""Resolved external tools and their capabilities.
+
+:class:`ToolRegistry` looks up tgradish/ffmpeg/ffprobe once per ``PATH``
+value and remembers the result for the lifetime of the process, so
+repeated dependency checks do not walk ``PATH`` again. For ffmpeg it also
+records the version banner, the available encoders and filters and the
+options of the encoders we use; these are kept in a small JSON file and
+re-probed only when the binary's size or mtime changes.
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+# Кодеры, для которых запоминается список поддерживаемых опций
+PROBED_ENCODERS = ("libvpx-vp9",)
+
+_OPTION_RE = re.compile(r"^\s+-([A-Za-z0-9_-]+)\s")
+
+
+class ToolInfo:
+    """Version and capabilities of one executable."""
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        version: str = "",
+        encoders: set[str] | None = None,
+        filters: set[str] | None = None,
+        encoder_options: dict[str, set[str]] | None = None,
+    ):
+        self.name = name
+        self.path = path
+        self.version = version
+        self.encoders = encoders or set()
+        self.filters = filters or set()
+        self.encoder_options = encoder_options or {}
+
+    def has_encoder(self, encoder: str) -> bool:
+        return encoder in self.encoders
+
+    def has_filter(self, name: str) -> bool:
+        return name in self.filters
+
+    def supports_option(self, encoder: str, option: str) -> bool:
+        return option.lstrip("-") in self.encoder_options.get(encoder, ())
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "version": self.version,
+            "encoders": sorted(self.encoders),
+            "filters": sorted(self.filters),
+            "encoder_options": {k: sorted(v) for k, v in self.encoder_options.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ToolInfo":
+        return cls(
+            name=data["name"],
+            path=data["path"],
+            version=data.get("version", ""),
+            encoders=set(data.get("encoders", ())),
+            filters=set(data.get("filters", ())),
+            encoder_options={k: set(v) for k, v in (data.get("encoder_options") or {}).items()},
+        )
+
+
+def _run_text(cmd: list[str], timeout: float = 15.0) -> str:
+    try:
+        return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout).stdout or ""
+    except (OSError, subprocess.TimeoutExpired):
+        return ""
+
+
+def parse_encoders(text: str) -> set[str]:
+    """Parse ``ffmpeg -encoders`` output."""
+    names: set[str] = set()
+    in_list = False
+    for line in text.splitlines():
+        if line.strip().startswith("---"):
+            in_list = True
+            continue
+        parts = line.split()
+        if in_list and len(parts) >= 2 and len(parts[0]) == 6:
+            names.add(parts[1])
+    return names
+
+
+def parse_filters(text: str) -> set[str]:
+    """Parse ``ffmpeg -filters`` output."""
+    names: set[str] = set()
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and "->" in parts[2]:
+            names.add(parts[1])
+    return names
+
+
+def parse_encoder_options(text: str) -> set[str]:
+    """Parse option names from ``ffmpeg -h encoder=<name>`` output."""
+    return {m.group(1) for m in map(_OPTION_RE.match, text.splitlines()) if m}
+
+
+def probe_ffmpeg(path: str) -> ToolInfo:
+    """Run ffmpeg a few times to collect its version and capabilities."""
+    banner = _run_text([path, "-hide_banner", "-version"]).splitlines()
+    info = ToolInfo(
+        name="ffmpeg",
+        path=path,
+        version=banner[0].strip() if banner else "",
+        encoders=parse_encoders(_run_text([path, "-hide_banner", "-encoders"])),
+        filters=parse_filters(_run_text([path, "-hide_banner", "-filters"])),
+    )
+    for encoder in PROBED_ENCODERS:
+        if encoder in info.encoders:
+            info.encoder_options[encoder] = parse_encoder_options(
+                _run_text([path, "-hide_banner", "-h", f"encoder={encoder}"])
+            )
+    return info
+
+
+class ToolRegistry:
+    """Process-wide memo of tool locations backed by an on-disk capability cache."""
+
+    def __init__(self, cache_path: str | None = None):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._which: dict[tuple[str, str], str | None] = {}
+        self._modules: dict[str, bool] = {}
+        self._infos: dict[str, ToolInfo] = {}
+        self._disk: dict | None = None
+
+    def which(self, name: str) -> str | None:
+        """``shutil.which`` memoized per ``PATH`` value."""
+        key = (name, os.environ.get("PATH", ""))
+        with self._lock:
+            if key in self._which:
+                return self._which[key]
+        path = shutil.which(name)
+        with self._lock:
+            self._which[key] = path
+        return path
+
+    def has_module(self, name: str) -> bool:
+        with self._lock:
+            if name in self._modules:
+                return self._modules[name]
+        try:
+            import importlib.util
+
+            found = importlib.util.find_spec(name) is not None
+        except Exception:
+            found = False
+        with self._lock:
+            self._modules[name] = found
+        return found
+
+    def module_version(self, name: str) -> str:
+        try:
+            from importlib import metadata
+
+            return metadata.version(name)
+        except Exception:
+            return ""
+
+    def ffmpeg(self) -> ToolInfo | None:
+        """Capabilities of the ffmpeg found in ``PATH`` (None if missing)."""
+        path = self.which("ffmpeg")
+        if not path:
+            return None
+        with self._lock:
+            info = self._infos.get(path)
+        if info is not None:
+            return info
+        try:
+            st = os.stat(path)
+            stamp = [st.st_size, st.st_mtime_ns]
+        except OSError:
+            stamp = None
+        entry = self._load_disk().get(path) if stamp else None
+        if entry and entry.get("stamp") == stamp:
+            info = ToolInfo.from_dict(entry["info"])
+        else:
+            info = probe_ffmpeg(path)
+            if stamp:
+                self._save_disk(path, {"stamp": stamp, "info": info.to_dict()})
+        with self._lock:
+            self._infos[path] = info
+        return info
+
+    def invalidate(self):
+        """Forget everything resolved so far (e.g. after installing a tool)."""
+        with self._lock:
+            self._which.clear()
+            self._modules.clear()
+            self._infos.clear()
+            self._disk = None
+
+    # ------------------------------ Disk cache ----------------------------- #
+    def _load_disk(self) -> dict:
+        with self._lock:
+            if self._disk is not None:
+                return self._disk
+        data: dict = {}
+        if self.cache_path:
+            try:
+                with open(self.cache_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+        if not isinstance(data, dict):
+            data = {}
+        with self._lock:
+            self._disk = data
+        return data
+
+    def _save_disk(self, path: str, entry: dict):
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = dict(self._disk or {})
+            data[path] = entry
+            self._disk = data
+        tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
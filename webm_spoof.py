@@ -0,0 +1,257 @@
+"""Native WebM duration spoof.
+
+Telegram reads a video sticker's length from the ``Duration`` element of
+the Matroska/WebM ``Segment > Info`` block. This module locates that
+element by walking the EBML structure of a memory-mapped file and
+overwrites the float in place, so the cost does not depend on the file
+size and no re-muxing is needed. When an output path is given the file is
+first cloned with ``copy_file_range`` (reflink/server-side copy where the
+filesystem supports it).
+
+The module only uses the standard library so it can also be shipped with
+the Android build, where tgradish is not available.
+"""
+
+import argparse
+import mmap
+import os
+import shutil
+import struct
+import sys
+
+EBML_ID = 0x1A45DFA3
+SEGMENT_ID = 0x18538067
+INFO_ID = 0x1549A966
+TIMECODE_SCALE_ID = 0x2AD7B1
+DURATION_ID = 0x4489
+CLUSTER_ID = 0x1F43B675
+
+DEFAULT_TIMECODE_SCALE = 1_000_000  # нс на единицу времени Matroska
+# Telegram отклоняет видеостикеры длиннее 3 с по значению из заголовка
+DEFAULT_DURATION_S = 1.0
+# tgradish convert всегда пишет в Duration 420.69 единиц TimecodeScale (по умолчанию мс)
+TGRADISH_DURATION_S = 0.42069
+
+
+class WebmSpoofError(Exception):
+    """Raised when the file is not a WebM/Matroska file that can be patched."""
+
+
+def _check_available(buf, pos: int, length: int):
+    if pos + length > len(buf):
+        raise WebmSpoofError(f"Файл обрезан: элемент на позиции {pos} выходит за конец файла")
+
+
+def _read_id(buf, pos: int) -> tuple[int, int]:
+    _check_available(buf, pos, 1)
+    first = buf[pos]
+    length = 1
+    mask = 0x80
+    while length <= 4 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 4:
+        raise WebmSpoofError(f"Некорректный EBML ID на позиции {pos}")
+    _check_available(buf, pos, length)
+    value = int.from_bytes(buf[pos:pos + length], "big")
+    return value, pos + length
+
+
+def _read_size(buf, pos: int) -> tuple[int | None, int]:
+    """Read an EBML variable-size integer. Returns ``(None, end)`` for unknown size."""
+    _check_available(buf, pos, 1)
+    first = buf[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise WebmSpoofError(f"Некорректный размер EBML на позиции {pos}")
+    _check_available(buf, pos, length)
+    value = first & (mask - 1)
+    for b in buf[pos + 1:pos + length]:
+        value = (value << 8) | b
+    if value == (1 << (7 * length)) - 1:
+        return None, pos + length
+    return value, pos + length
+
+
+def _iter_children(buf, start: int, end: int):
+    """Yield ``(id, data_start, data_size)`` for the elements in ``[start, end)``."""
+    pos = start
+    while pos < end:
+        elem_id, pos = _read_id(buf, pos)
+        size, data_start = _read_size(buf, pos)
+        yield elem_id, data_start, size
+        if size is None:
+            return
+        pos = data_start + size
+
+
+def find_duration(buf) -> tuple[int, int, int]:
+    """Locate the Segment Info Duration element.
+
+    Returns ``(offset, size, timecode_scale)`` where ``offset``/``size``
+    describe the float payload.
+    """
+    total = len(buf)
+    if total < 4 or int.from_bytes(buf[0:4], "big") != EBML_ID:
+        raise WebmSpoofError("Файл не является WebM/Matroska (нет заголовка EBML)")
+    for elem_id, data_start, size in _iter_children(buf, 0, total):
+        if elem_id != SEGMENT_ID:
+            continue
+        seg_end = total if size is None else min(total, data_start + size)
+        for child_id, child_start, child_size in _iter_children(buf, data_start, seg_end):
+            if child_id == CLUSTER_ID:
+                break
+            if child_id != INFO_ID or child_size is None:
+                continue
+            # Обрезанный заголовок не правим: Duration мог оказаться за концом файла
+            _check_available(buf, child_start, child_size)
+            scale = DEFAULT_TIMECODE_SCALE
+            duration: tuple[int, int] | None = None
+            for info_id, info_start, info_size in _iter_children(buf, child_start, child_start + child_size):
+                if info_id == TIMECODE_SCALE_ID and info_size:
+                    scale = int.from_bytes(buf[info_start:info_start + info_size], "big")
+                elif info_id == DURATION_ID and info_size in (4, 8):
+                    duration = (info_start, info_size)
+            if duration is None:
+                raise WebmSpoofError("В Segment Info отсутствует элемент Duration")
+            return duration[0], duration[1], scale
+        break
+    raise WebmSpoofError("Не найден блок Segment Info")
+
+
+def read_duration(path: str) -> float:
+    """Return the header duration of ``path`` in seconds."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        offset, size, scale = find_duration(mm)
+        value = struct.unpack(">f" if size == 4 else ">d", mm[offset:offset + size])[0]
+    return value * scale / 1e9
+
+
+def _fast_copy(src: str, dst: str):
+    """Copy ``src`` to ``dst`` using in-kernel copy where available."""
+    copy_range = getattr(os, "copy_file_range", None)
+    if copy_range is None:
+        shutil.copyfile(src, dst)
+        return
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = copy_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        if remaining > 0:
+            raise OSError("copy_file_range stopped early")
+    except OSError:
+        # Разные ФС или ядро без поддержки — shutil сам выберет sendfile/обычное копирование
+        shutil.copyfile(src, dst)
+
+
+def spoof_duration(input_path: str, output_path: str | None = None, duration_s: float = DEFAULT_DURATION_S) -> float:
+    """Set the header duration of a WebM file.
+
+    Patches ``input_path`` in place when ``output_path`` is empty or the
+    same file; otherwise writes a patched copy atomically. Returns the
+    original duration in seconds.
+    """
+    in_place = not output_path or os.path.abspath(output_path) == os.path.abspath(input_path)
+    if in_place and os.stat(input_path).st_nlink > 1:
+        # Жёсткая ссылка (например, из кэша конвертаций): правка на месте изменила бы и другие имена
+        in_place = False
+        output_path = input_path
+    target = input_path
+    tmp = None
+    if not in_place:
+        out_dir = os.path.dirname(os.path.abspath(output_path)) or "."
+        os.makedirs(out_dir, exist_ok=True)
+        tmp = os.path.join(out_dir, f".{os.path.basename(output_path)}.{os.getpid()}.tmp")
+        _fast_copy(input_path, tmp)
+        target = tmp
+    try:
+        with open(target, "r+b") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise WebmSpoofError("Пустой файл")
+            with mmap.mmap(f.fileno(), 0) as mm:
+                offset, size, scale = find_duration(mm)
+                fmt = ">f" if size == 4 else ">d"
+                original = struct.unpack(fmt, mm[offset:offset + size])[0] * scale / 1e9
+                mm[offset:offset + size] = struct.pack(fmt, duration_s * 1e9 / scale)
+                mm.flush()
+        if tmp is not None:
+            os.replace(tmp, output_path)  # type: ignore[arg-type]
+            tmp = None
+    finally:
+        if tmp is not None:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    return original
+
+
+class SpoofTask:
+    """Callable job task running :func:`spoof_duration` (see ``tgradish_jobs.CallableRunner``)."""
+
+    def __init__(self, input_path: str, output_path: str, duration_s: float = DEFAULT_DURATION_S):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.duration_s = duration_s
+
+    def describe(self) -> list[str]:
+        return ["spoof", "--native", "--duration", str(self.duration_s), self.input_path, self.output_path]
+
+    def __call__(self, ctx) -> int:
+        try:
+            original = spoof_duration(self.input_path, self.output_path, self.duration_s)
+        except (OSError, WebmSpoofError) as e:
+            ctx.emit(f"Ошибка подмены длительности: {e}")
+            return 1
+        ctx.emit(f"Длительность в заголовке: {original:.3f} с → {self.duration_s:.3f} с")
+        return 0
+
+
+class SpoofStep:
+    """Post-processing step patching a job's finished output in place.
+
+    Attached to a convert job (``JobQueue.submit(..., then=SpoofStep(d))``)
+    it turns convert + spoof into one job with a single output file.
+    """
+
+    def __init__(self, duration_s: float = DEFAULT_DURATION_S):
+        self.duration_s = duration_s
+
+    def describe(self) -> list[str]:
+        return ["--spoof-duration", str(self.duration_s)]
+
+    def __call__(self, output_path: str, emit) -> int:
+        try:
+            original = spoof_duration(output_path, None, self.duration_s)
+        except (OSError, WebmSpoofError) as e:
+            emit(f"Ошибка подмены длительности: {e}")
+            return 1
+        emit(f"Длительность в заголовке: {original:.3f} с → {self.duration_s:.3f} с")
+        return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Подмена длительности WebM без перекодирования")
+    parser.add_argument("input", help="Входной .webm")
+    parser.add_argument("output", nargs="?", default="", help="Выходной .webm (по умолчанию правка на месте)")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_S, help="Новая длительность, с")
+    args = parser.parse_args(argv)
+    try:
+        original = spoof_duration(args.input, args.output or None, args.duration)
+    except (OSError, WebmSpoofError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    print(f"{original:.3f} -> {args.duration:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())